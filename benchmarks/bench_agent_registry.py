@@ -0,0 +1,97 @@
+"""
+Micro-benchmark: per-node agent overhead with and without the AgentRegistry.
+
+"before" rebuilds the prompt, the openai-functions agent and the AgentExecutor
+on every call, the way the nodes used to; "after" goes through a warmed-up
+registry. Both invoke the same fake chat model, so the difference is pure
+construction overhead.
+
+    python -m benchmarks.bench_agent_registry --iterations 500
+"""
+
+import argparse
+import time
+
+from langchain.agents import AgentExecutor, create_openai_functions_agent
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain.tools import Tool
+from langchain_core.language_models import FakeListChatModel
+
+from nodes.agent_registry import AgentRegistry
+from states.states import AgentState
+from tools.buffermemory import create_buffer_memory
+
+SYSTEM = "You are a summarization agent. Summarize the content of the retrieved documents."
+
+
+def build_prompt() -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM),
+            ("human", "{input}"),
+            ("user", "{retrieved_docs}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
+
+
+def make_inputs(state: AgentState) -> dict:
+    return {
+        "retrieved_docs": ["Amdahl's law bounds the speedup of a program."],
+        "input": AgentState.get_last_human_message(state),
+        "agent_scratchpad": [],
+    }
+
+
+def new_state() -> AgentState:
+    state = AgentState.create_initial_state(option="summary")
+    AgentState.add_human_message(state, "What is Amdahl's law?")
+    return state
+
+
+def run_before(llm, tools, iterations: int, invoke: bool) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        state = new_state()
+        agent = create_openai_functions_agent(llm=llm, prompt=build_prompt(), tools=tools)
+        executor = AgentExecutor(
+            agent=agent, memory=create_buffer_memory(state), tools=tools, verbose=False
+        )
+        if invoke:
+            executor.invoke(make_inputs(state))
+    return time.perf_counter() - start
+
+
+def run_after(llm, tools, iterations: int, invoke: bool) -> float:
+    registry = AgentRegistry(llm=llm, verbose=False)
+    registry.register("summary", build_prompt(), tools)
+    registry.warmup()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        state = new_state()
+        executor = registry.bind_memory("summary", state)
+        if invoke:
+            executor.invoke(make_inputs(state))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    llm = FakeListChatModel(responses=["Amdahl's law: S = 1 / ((1 - p) + p / n)"])
+    tools = [Tool(name="noop", description="does nothing", func=lambda q: q)]
+
+    for invoke in (False, True):
+        label = "construction + invoke" if invoke else "construction only"
+        before = run_before(llm, tools, args.iterations, invoke)
+        after = run_after(llm, tools, args.iterations, invoke)
+        print(f"{label}:")
+        print(f"  before: {before / args.iterations * 1e6:9.1f} us/node")
+        print(f"  after:  {after / args.iterations * 1e6:9.1f} us/node")
+        print(f"  speedup: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Memory and latency of AgentState at long-session sizes: the previous
+representation (Document per retrieval, datetime.now() per mutation,
+reversed isinstance scans for the last human/AI message) against the
+current one (interned DocRecords, epoch timestamps, indexed last-message
+pointers).
+
+Documents are drawn from a smaller pool of chunks, each retrieval building
+fresh Document objects, as the retriever and search node do.
+
+    python -m benchmarks.bench_agent_state --messages 1000 --docs 10000
+"""
+
+import argparse
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime
+
+from langchain.memory import ChatMessageHistory
+from langchain.schema import Document
+from langchain_core.messages import AIMessage, HumanMessage
+
+from states.states import AgentState
+
+WORDS = (
+    "cache memory processor pipeline branch instruction register clock cycle "
+    "throughput latency bandwidth power core thread vector scalar bus cpi"
+).split()
+
+
+class LegacyState:
+    """The previous AgentState helpers, inlined for comparison."""
+
+    @staticmethod
+    def create():
+        return {
+            "message_history": ChatMessageHistory(),
+            "retrieved_docs": [],
+            "created_at": datetime.now(),
+            "last_updated": datetime.now(),
+        }
+
+    @staticmethod
+    def add_message(state, message):
+        state["message_history"].add_message(message)
+        state["last_updated"] = datetime.now()
+
+    @staticmethod
+    def add_documents(state, docs):
+        state["retrieved_docs"].extend(docs)
+        state["last_updated"] = datetime.now()
+
+    @staticmethod
+    def last_human(state):
+        for message in reversed(state["message_history"].messages):
+            if isinstance(message, HumanMessage):
+                return message.content
+        return None
+
+    @staticmethod
+    def last_ai(state):
+        for message in reversed(state["message_history"].messages):
+            if isinstance(message, AIMessage):
+                return message.content
+        return None
+
+
+class CurrentState:
+    create = staticmethod(lambda: AgentState.create_initial_state())
+    add_message = staticmethod(AgentState.add_message)
+    add_documents = staticmethod(AgentState.add_documents)
+    last_human = staticmethod(AgentState.get_last_human_message)
+    last_ai = staticmethod(AgentState.get_last_ai_message)
+
+
+def make_chunks(n: int, words: int = 90):
+    rng = random.Random(0)
+    return [
+        (
+            " ".join(rng.choice(WORDS) for _ in range(words)),
+            {"course": "bench", "chapter": f"ch{i % 8}", "source": f"doc{i // 20}.pdf", "page": i},
+        )
+        for i in range(n)
+    ]
+
+
+def build(impl, messages, batches):
+    state = impl.create()
+    per_message = max(1, len(batches) // max(1, len(messages)))
+    pending = iter(batches)
+    for index, message in enumerate(messages):
+        impl.add_message(state, message)
+        # Nodes read the last human message several times per step.
+        impl.last_human(state)
+        if index % 2:
+            for _ in range(per_message):
+                batch = next(pending, None)
+                if batch is not None:
+                    impl.add_documents(state, [Document(page_content=c, metadata=dict(m)) for c, m in batch])
+    for batch in pending:
+        impl.add_documents(state, [Document(page_content=c, metadata=dict(m)) for c, m in batch])
+    return state
+
+
+def lookup_us(func, state, lookups):
+    samples = []
+    for _ in range(lookups):
+        start = time.perf_counter()
+        func(state)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6
+
+
+def measure(name, impl, messages, batches, lookups):
+    # Timed and traced separately: tracemalloc slows allocation-heavy code.
+    gc.collect()
+    start = time.perf_counter()
+    state = build(impl, messages, batches)
+    elapsed = time.perf_counter() - start
+    del state
+    gc.collect()
+    tracemalloc.start()
+    state = build(impl, messages, batches)
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Worst case for a scan: one question followed by the whole transcript.
+    far = impl.create()
+    impl.add_message(far, HumanMessage(content="Question"))
+    for message in messages[1:]:
+        impl.add_message(far, AIMessage(content=message.content))
+    print(
+        f"  {name:<8} build {elapsed * 1000:7.1f} ms  retained {size / 2**20:6.2f} MiB  "
+        f"last human {lookup_us(impl.last_human, state, lookups):5.2f} us  "
+        f"last ai {lookup_us(impl.last_ai, state, lookups):5.2f} us  "
+        f"last human, {len(messages)} messages back {lookup_us(impl.last_human, far, lookups):6.2f} us"
+    )
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--docs", type=int, default=10000)
+    parser.add_argument("--unique-docs", type=int, default=2500)
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    chunks = make_chunks(args.unique_docs)
+    draws = [rng.choice(chunks) for _ in range(args.docs)]
+    batches = [draws[i : i + args.batch_size] for i in range(0, len(draws), args.batch_size)]
+    # A human question per turn, then the validator's verdicts and the answer.
+    messages = [
+        HumanMessage(content=f"Question {i}") if i % 4 == 0 else AIMessage(content=f"Answer {i}")
+        for i in range(args.messages)
+    ]
+
+    print(
+        f"{args.messages} messages, {args.docs} docs ({args.unique_docs} unique chunks); "
+        "lookup times are medians"
+    )
+    legacy = measure("legacy", LegacyState, messages, batches, args.lookups)
+    del legacy
+    measure("current", CurrentState, messages, batches, args.lookups)
+
+
+if __name__ == "__main__":
+    main()
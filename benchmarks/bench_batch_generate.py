@@ -0,0 +1,104 @@
+"""
+Throughput and memory of batch flashcard/quiz generation (utils.batch_generate).
+
+Seeds the fake local store with `--chunks` synthetic chunks per chapter and
+generates both kinds for one chapter at each `--concurrency`, on a fake
+model answering after `--llm-latency` seconds. Peak memory is what the job
+allocates (tracemalloc), measured for the chapter and for one twice its
+size: bounded by the window queue, it should not grow with the chapter.
+A last run is interrupted halfway and resumed from its output file.
+
+    python -m benchmarks.bench_batch_generate --chunks 2000 --concurrency 1 8 32
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+from langchain.schema import Document
+
+from utils.fakes import FakeChatModel, install_fake_backends
+
+
+def chapter_docs(chapter: str, n: int):
+    return [
+        Document(
+            page_content=f"Slide {i} of {chapter}: " + " ".join(f"term{(i * 7 + j) % 997}" for j in range(60)),
+            metadata={"course": "bench", "chapter": chapter, "source": f"{chapter}.pdf", "page": i // 4},
+        )
+        for i in range(n)
+    ]
+
+
+def run(store, chapter: str, output: str, concurrency: int, **kwargs):
+    from utils.batch_generate import generate_batch
+
+    tracemalloc.start()
+    stats = generate_batch("bench", output, chapter=chapter, vectorstore=store, concurrency=concurrency, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return stats, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--max-tokens", type=int, default=1500)
+    args = parser.parse_args()
+
+    fakes = install_fake_backends(chat_model=FakeChatModel(latency=args.llm_latency))
+    store = fakes.vectorstore
+    store.add_documents(chapter_docs("small", args.chunks) + chapter_docs("large", args.chunks * 2))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'chapter':<8}{'concurrency':>12}{'windows':>9}{'items':>7}{'seconds':>9}{'items/min':>11}{'peak MB':>9}")
+        for chapter in ("small", "large"):
+            for concurrency in args.concurrency:
+                if chapter == "large" and concurrency != max(args.concurrency):
+                    continue
+                output = os.path.join(tmp, f"{chapter}-{concurrency}.jsonl")
+                stats, peak = run(store, chapter, output, concurrency, max_tokens=args.max_tokens)
+                print(
+                    f"{chapter:<8}{concurrency:>12}{stats.windows:>9}{stats.generated:>7}"
+                    f"{stats.seconds:>9.2f}{stats.items_per_minute:>11.0f}{peak:>9.2f}"
+                )
+
+        # Interrupt a run halfway through, then resume it from the same file.
+        output = os.path.join(tmp, "resume.jsonl")
+        concurrency = max(args.concurrency)
+        from utils.batch_generate import agenerate_batch, token_windows
+
+        total = sum(1 for _ in token_windows(store.iter_documents({"chapter": "small"}), "bench",
+                                              args.max_tokens)) * 2
+
+        async def interrupted():
+            task = asyncio.create_task(
+                agenerate_batch("bench", output, chapter="small", vectorstore=store,
+                                concurrency=concurrency, max_tokens=args.max_tokens)
+            )
+            await asyncio.sleep(args.llm_latency * total / concurrency / 2)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        start = time.perf_counter()
+        asyncio.run(interrupted())
+        with open(output) as f:
+            first = sum(1 for _ in f)
+        resumed, _ = run(store, "small", output, concurrency, max_tokens=args.max_tokens)
+        print(
+            f"\nresume: {first} of {total} items written before the interruption, "
+            f"{resumed.skipped} skipped and {resumed.generated} generated on re-run "
+            f"({time.perf_counter() - start:.2f}s in total)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Checkpoint size and per-step write/read latency of multi-turn sessions, with
+LangGraph's default JsonPlusSerializer against AgentStateSerializer
+(msgpack, documents stored once by id), both on SQLite.
+
+Runs the real graph on fakes: every thread asks `--turns` questions, so
+later checkpoints carry the accumulated messages and documents.
+
+    python -m benchmarks.bench_checkpoint --threads 20 --turns 4
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from langchain.schema import Document
+
+from utils.fakes import FakeSearchTool, install_fake_backends
+
+WORDS = (
+    "cache memory processor pipeline branch instruction register clock cycle "
+    "throughput latency bandwidth power core thread vector scalar bus cpi"
+).split()
+
+
+def make_docs(n: int, words: int = 90):
+    rng = random.Random(0)
+    return [
+        Document(
+            page_content=" ".join(rng.choice(WORDS) for _ in range(words)),
+            metadata={"course": "bench", "chapter": f"ch{i % 8}", "source": f"doc{i // 20}.pdf", "page": i},
+        )
+        for i in range(n)
+    ]
+
+
+def timed(func, samples: list):
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    return wrapper
+
+
+def ms(samples: list) -> str:
+    if not samples:
+        return "     n/a"
+    p95 = sorted(samples)[int(len(samples) * 0.95) - 1 if len(samples) > 1 else 0]
+    return f"{statistics.mean(samples) * 1000:6.2f} ms (p95 {p95 * 1000:6.2f})"
+
+
+def run(name: str, checkpointer, path: str, args):
+    from graph import thread_config, workflow
+    from states.states import AgentState
+
+    puts, writes, reads = [], [], []
+    checkpointer.put = timed(checkpointer.put, puts)
+    checkpointer.put_writes = timed(checkpointer.put_writes, writes)
+    checkpointer.get_tuple = timed(checkpointer.get_tuple, reads)
+    graph = workflow.compile(checkpointer=checkpointer)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in range(args.threads):
+            config = thread_config(f"{name}-{thread}")
+            for turn in range(args.turns):
+                previous = graph.get_state(config).values
+                state = AgentState.start_turn(
+                    previous, f"Explain topic {turn} of thread {thread}", "summary", 1
+                )
+                graph.invoke(state, config)
+    final = graph.get_state(config).values
+
+    conn = sqlite3.connect(path)
+    count, avg_size, last_size = conn.execute(
+        "SELECT COUNT(*), AVG(LENGTH(checkpoint)), "
+        "(SELECT LENGTH(checkpoint) FROM checkpoints ORDER BY rowid DESC LIMIT 1) FROM checkpoints"
+    ).fetchone()
+    write_bytes = conn.execute("SELECT AVG(LENGTH(value)) FROM writes").fetchone()[0]
+    conn.close()
+    print(f"{name}:")
+    print(
+        f"  {count} checkpoints, avg {avg_size / 1024:.1f} KiB, last {last_size / 1024:.1f} KiB "
+        f"({len(final['message_history'].messages)} messages, {len(final['retrieved_docs'])} docs); "
+        f"avg write {write_bytes / 1024:.1f} KiB"
+    )
+    print(f"  file size {sum(os.path.getsize(p) for p in (path, path + '-wal') if os.path.exists(p)) / 1024:.0f} KiB")
+    print(f"  put        {ms(puts)}")
+    print(f"  put_writes {ms(writes)}")
+    print(f"  get_tuple  {ms(reads)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--docs", type=int, default=400)
+    args = parser.parse_args()
+
+    install_fake_backends(documents=make_docs(args.docs), search_tool=FakeSearchTool(max_results=5))
+    import nodes.search_agent
+
+    # Both runs see the same corpus: no search results written back into it.
+    nodes.search_agent.tool.writeback = False
+    from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    from states.checkpointer import create_checkpointer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "jsonplus.sqlite")
+        saver = SqliteSaver(sqlite3.connect(path, check_same_thread=False), serde=JsonPlusSerializer())
+        saver.setup()
+        run("JsonPlusSerializer", saver, path, args)
+
+        path = os.path.join(tmp, "agentstate.sqlite")
+        run("AgentStateSerializer", create_checkpointer(path), path, args)
+
+
+if __name__ == "__main__":
+    main()
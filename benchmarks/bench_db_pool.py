@@ -0,0 +1,140 @@
+"""
+Query latency while an ingestion run holds database connections: one
+connection per query (no pool), one pool shared by queries and ingestion,
+and separate "read" and "ingest" pools (tools.db_pool).
+
+Runs on a SQLite file through the same metered pools, so no Postgres is
+needed; `--connect-ms` and `--query-ms`/`--batch-ms` stand in for the
+connection handshake and the server time of a retrieval query and an
+ingestion batch. Reported waits come from the pools' own metrics.
+
+    python -m benchmarks.bench_db_pool --readers 16 --ingesters 12 --seconds 3
+"""
+
+import argparse
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+from tools.db_pool import PoolConfig, create_pooled_engine, pool_metrics
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def run(read_engine, ingest_engine, args) -> dict:
+    stop = time.perf_counter() + args.seconds
+    latencies, batches = [], [0]
+    lock = threading.Lock()
+
+    def reader():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            with read_engine.connect() as conn:
+                conn.execute(text("SELECT count(*) FROM chunks WHERE id % 7 = 0")).scalar()
+                time.sleep(args.query_ms / 1000)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+            time.sleep(args.think_ms / 1000)
+
+    def ingester():
+        while time.perf_counter() < stop:
+            with ingest_engine.connect() as conn:
+                # Server time of a batch insert, then the (short) SQLite write.
+                time.sleep(args.batch_ms / 1000)
+                conn.execute(
+                    text("INSERT INTO chunks (body) VALUES (:body)"),
+                    [{"body": "chunk"} for _ in range(32)],
+                )
+                conn.commit()
+            with lock:
+                batches[0] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(args.readers)]
+    threads += [threading.Thread(target=ingester) for _ in range(args.ingesters)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {
+        "queries": len(latencies),
+        "p50": statistics.median(latencies) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "batches": batches[0],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--ingesters", type=int, default=12)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--connect-ms", type=float, default=15.0)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    parser.add_argument("--think-ms", type=float, default=10.0, help="pause between a thread's queries")
+    parser.add_argument("--batch-ms", type=float, default=100.0)
+    parser.add_argument("--max-connections", type=int, default=12, help="total for both workloads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.sqlite")
+        with sqlite3.connect(path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, body TEXT)")
+            conn.executemany("INSERT INTO chunks (body) VALUES (?)", [("chunk",)] * 5000)
+
+        def connect():
+            time.sleep(args.connect_ms / 1000)
+            return sqlite3.connect(path, check_same_thread=False, timeout=30)
+
+        url = f"sqlite:///{path}"
+        total = args.max_connections
+        ingest_size = max(1, total // 4)
+        shared = PoolConfig(min_size=total, max_size=total, timeout=30)
+        scenarios = {
+            "no pool": lambda: [create_engine(url, poolclass=NullPool, creator=connect)] * 2,
+            "shared pool": lambda: [create_pooled_engine(url, shared, "shared", creator=connect)] * 2,
+            "read + ingest pools": lambda: [
+                create_pooled_engine(
+                    url, PoolConfig(min_size=total - ingest_size, max_size=total - ingest_size, timeout=30),
+                    "read", creator=connect,
+                ),
+                create_pooled_engine(
+                    url, PoolConfig(min_size=ingest_size, max_size=ingest_size, timeout=30),
+                    "ingest", creator=connect,
+                ),
+            ],
+        }
+        print(
+            f"{args.readers} query threads ({args.query_ms:g} ms, {args.think_ms:g} ms apart), "
+            f"{args.ingesters} ingestion threads ({args.batch_ms:g} ms batches), "
+            f"{total} connections, {args.connect_ms:g} ms connect\n"
+        )
+        print(f"{'':<22}{'queries':>9}{'p50 ms':>9}{'p95 ms':>9}{'batches':>9}   pool waits (p95 / max ms)")
+        for label, build in scenarios.items():
+            read_engine, ingest_engine = build()
+            result = run(read_engine, ingest_engine, args)
+            waits = ", ".join(
+                f"{name} {m['wait_ms_p95']:.1f} / {m['wait_ms_max']:.1f} (peak {m['peak_in_use']}/{m['max_size']})"
+                for name, m in pool_metrics().items()
+                if name in ("shared", "read", "ingest") and m["checkouts"] and label != "no pool"
+                and (name == "shared") == (label == "shared pool")
+            )
+            print(
+                f"{label:<22}{result['queries']:>9}{result['p50']:>9.1f}{result['p95']:>9.1f}"
+                f"{result['batches']:>9}   {waits or '-'}"
+            )
+            for engine in {read_engine, ingest_engine}:
+                engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
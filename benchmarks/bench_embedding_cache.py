@@ -0,0 +1,69 @@
+"""
+Embedding cache benchmark: underlying embed calls and wall time for repeated
+ingestion and bursts of concurrent queries, with and without CachedEmbeddings.
+
+    python -m benchmarks.bench_embedding_cache --chunks 2000 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+
+from models.cached_embeddings import CachedEmbeddings
+from utils.fakes import FakeEmbeddings
+
+
+def ingest_twice(embeddings, chunks, batch_size: int) -> float:
+    start = time.perf_counter()
+    for _ in range(2):
+        for i in range(0, len(chunks), batch_size):
+            embeddings.embed_documents(chunks[i : i + batch_size])
+    return time.perf_counter() - start
+
+
+async def query_burst(embeddings, queries) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(embeddings.aembed_query(q) for q in queries))
+    return time.perf_counter() - start
+
+
+def report(label: str, fake: FakeEmbeddings, seconds: float) -> None:
+    print(f"  {label:<8} calls={fake.calls:5d} texts={fake.texts_embedded:6d} wall={seconds * 1000:9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--distinct-queries", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    chunks = [f"chunk {i} of the microprocessor lecture notes" for i in range(args.chunks)]
+    queries = [f"question {i % args.distinct_queries} about RISC-V" for i in range(args.queries)]
+
+    print(f"ingest {args.chunks} chunks twice (batch {args.batch_size}):")
+    raw = FakeEmbeddings(latency=args.latency)
+    report("raw", raw, ingest_twice(raw, chunks, args.batch_size))
+    fake = FakeEmbeddings(latency=args.latency)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cached = CachedEmbeddings(fake, cache_dir=cache_dir, max_batch_size=256)
+        report("cached", fake, ingest_twice(cached, chunks, args.batch_size))
+
+        # A fresh process with the same on-disk store should not call the embedder.
+        fake_restart = FakeEmbeddings(latency=args.latency)
+        restarted = CachedEmbeddings(fake_restart, cache_dir=cache_dir)
+        report("on-disk", fake_restart, ingest_twice(restarted, chunks, args.batch_size))
+
+    print(f"{args.queries} concurrent queries ({args.distinct_queries} distinct):")
+    raw = FakeEmbeddings(latency=args.latency)
+    report("raw", raw, asyncio.run(query_burst(raw, queries)))
+    fake = FakeEmbeddings(latency=args.latency)
+    cached = CachedEmbeddings(fake, max_batch_size=256)
+    report("cached", fake, asyncio.run(query_burst(cached, queries)))
+
+
+if __name__ == "__main__":
+    main()
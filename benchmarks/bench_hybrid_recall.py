@@ -0,0 +1,91 @@
+"""
+Offline recall@k of vector, BM25 and hybrid (RRF) retrieval over test_pdfs/.
+
+Each query is built from the rarest terms of a sampled chunk (the kind of
+formula/acronym-heavy query that pure similarity misses); a hit means that
+chunk is in the top k. Vectors come from utils.fakes.FakeEmbeddings unless
+--azure is given, so the absolute numbers are indicative only.
+
+    python -m benchmarks.bench_hybrid_recall --k 5 --queries 200
+"""
+
+import argparse
+import glob
+import random
+from collections import Counter
+
+from tools.local_vectorstore import LocalVectorStore
+
+from tools.hybrid_retriever import (
+    HybridRetriever,
+    LocalBM25Index,
+    LocalBM25Retriever,
+    doc_key,
+    tokenize,
+)
+from utils.fakes import FakeEmbeddings
+from utils.ingest import iter_chunks, iter_pages
+
+
+def load_chunks(pattern: str):
+    paths = sorted(glob.glob(pattern))
+    chapters = {path: path for path in paths}
+    return [chunk for _, chunk in iter_chunks(iter_pages(paths), "bench", chapters)]
+
+
+def make_queries(chunks, n: int, terms: int, seed: int):
+    df = Counter(term for chunk in chunks for term in set(tokenize(chunk.page_content)))
+    rng = random.Random(seed)
+    queries = []
+    for chunk in rng.sample(chunks, min(n, len(chunks))):
+        vocabulary = sorted(set(tokenize(chunk.page_content)), key=lambda t: (df[t], t))
+        if len(vocabulary) >= terms:
+            queries.append((" ".join(vocabulary[:terms]), doc_key(chunk)))
+    return queries
+
+
+def recall(retriever, queries) -> float:
+    hits = sum(
+        target in {doc_key(doc) for doc in retriever.invoke(query)}
+        for query, target in queries
+    )
+    return hits / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pdfs", default="test_pdfs/*.pdf")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--terms", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--azure", action="store_true", help="use the configured Azure embeddings")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.pdfs)
+    queries = make_queries(chunks, args.queries, args.terms, args.seed)
+    if args.azure:
+        from models.llms import azure_embeddings as embeddings
+    else:
+        embeddings = FakeEmbeddings()
+
+    store = LocalVectorStore(embeddings)
+    store.add_documents(chunks)
+    depth = max(args.k * 2, 10)
+    vector = store.as_retriever(search_kwargs={"k": args.k})
+    bm25 = LocalBM25Retriever(index=LocalBM25Index(chunks), k=args.k)
+    hybrid = HybridRetriever(
+        retrievers=[
+            store.as_retriever(search_kwargs={"k": depth}),
+            LocalBM25Retriever(index=bm25.index, k=depth),
+        ],
+        k=args.k,
+    )
+
+    print(f"{len(chunks)} chunks, {len(queries)} queries, recall@{args.k}:")
+    for name, retriever in (("vector", vector), ("bm25", bm25), ("hybrid", hybrid)):
+        print(f"  {name:<7} {recall(retriever, queries):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Cold import time of the entry points against the cost deferred to first use
+or graph.startup(): client construction, vector store, search tool and the
+compiled graphs.
+
+Every sample is a fresh interpreter. Imports are profiled with
+`python -X importtime`, and the report lists the slowest top-level imports
+and whether any client library was loaded. Placeholder Azure/Tavily
+credentials and the local vector store are used unless the environment sets
+them, so nothing needs to be reachable; clients make no request when built.
+
+    python -m benchmarks.bench_import_time --runs 5
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLIENT_MODULES = [
+    "langchain_openai",
+    "openai",
+    "langchain_postgres",
+    "langchain_community.tools.tavily_search",
+    "tools.local_vectorstore",
+]
+
+_PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+{after}
+done = time.perf_counter()
+clients = [m for m in {clients!r} if m in sys.modules]
+print("RESULT", imported - start, done - imported, ",".join(clients))
+"""
+
+
+def child_env(tmp: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=ROOT, PYTHONWARNINGS="ignore")
+    defaults = {
+        "AZURE_OPENAI_API_KEY": "placeholder",
+        "AZURE_OPENAI_ENDPOINT": "https://example.invalid",
+        "OPENAI_API_VERSION": "2024-06-01",
+        "tavily_api_key": "placeholder",
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_STORE_PATH": os.path.join(tmp, "vectorstore"),
+        "CHECKPOINT_DB": os.path.join(tmp, "checkpoints.sqlite"),
+        "SEARCH_CACHE_PATH": os.path.join(tmp, "search_cache.sqlite"),
+    }
+    for name, value in defaults.items():
+        env.setdefault(name, value)
+    return env
+
+
+def probe(module: str, after: str, env: dict, tmp: str, importtime: bool = False):
+    code = _PROBE.format(module=module, after=after or "pass", clients=CLIENT_MODULES)
+    flags = ["-X", "importtime"] if importtime else []
+    # Run from an empty directory so no .env is picked up.
+    result = subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=tmp, env=env, capture_output=True, text=True
+    )
+    line = next((l for l in result.stdout.splitlines() if l.startswith("RESULT")), None)
+    if line is None:
+        raise RuntimeError(f"probe for {module} failed:\n{result.stderr[-2000:]}")
+    _, imported, after_time, clients = line.split(" ", 3)
+    return float(imported), float(after_time), [c for c in clients.strip().split(",") if c], result.stderr
+
+
+def slowest_imports(stderr: str, depth: int, n: int):
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if (len(name) - len(name.lstrip()) - 1) // 2 <= depth:
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    args = parser.parse_args()
+
+    cases = [
+        ("import graph", "graph", ""),
+        ("import server", "server", ""),
+        ("import graph + startup()", "graph", "graph.startup()"),
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        env = child_env(tmp)
+        for label, module, after in cases:
+            imports, afters, clients = [], [], []
+            for _ in range(args.runs):
+                imported, after_time, clients, _ = probe(module, after, env, tmp)
+                imports.append(imported)
+                afters.append(after_time)
+            line = f"{label:<26} import {statistics.median(imports) * 1000:7.1f} ms"
+            if after:
+                line += f"  startup {statistics.median(afters) * 1000:7.1f} ms"
+            print(f"{line}  client modules loaded: {', '.join(clients) or 'none'}")
+
+        *_, stderr = probe("graph", "", env, tmp, importtime=True)
+        print(f"\nslowest imports under `import graph` (cumulative, -X importtime):")
+        for cumulative, name in slowest_imports(stderr, depth=1, n=args.top):
+            print(f"  {cumulative / 1000:7.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
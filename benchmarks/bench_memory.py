@@ -0,0 +1,115 @@
+"""
+Prompt tokens per turn over a long scripted conversation, for each memory
+mode of the task agents: no history, the full buffer (every past turn,
+validator verdicts included, as the unbounded ConversationBufferMemory
+sent it), a window of the last turns, and the window plus a rolling summary.
+
+Runs the real graph on fakes, carrying the state from turn to turn as a
+resumed session does. Answers are `--answer-words` long; tokens are counted
+on every chat-model call's input messages, split into the task agent, the
+validator and the memory summarizer.
+
+    python -m benchmarks.bench_memory --turns 30 --window 3
+"""
+
+import argparse
+import contextlib
+import io
+from collections import defaultdict
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.fakes import FakeChatModel, default_responder, install_fake_backends
+
+TOPICS = [
+    "amdahl's law", "cpu time", "clock rate", "cpi", "pipelining", "branch prediction",
+    "cache hierarchy", "virtual memory", "tlb", "dram", "power wall", "multicore",
+]
+
+
+class PromptTokens(BaseCallbackHandler):
+    """Input tokens of every chat-model call, per turn and per caller."""
+
+    def __init__(self):
+        from tools.context_builder import count_tokens
+
+        self.count_tokens = count_tokens
+        self.turn = 0
+        self.tokens = defaultdict(lambda: defaultdict(int))
+
+    def on_chat_model_start(self, serialized, messages, *, tags=None, metadata=None, **kwargs):
+        from tools.buffermemory import MEMORY_SUMMARY_TAG
+
+        node = (metadata or {}).get("langgraph_node", "")
+        caller = "summarizer" if MEMORY_SUMMARY_TAG in (tags or []) else (
+            "validator" if node == "retrieval_validator" else "task"
+        )
+        self.tokens[self.turn][caller] += sum(
+            self.count_tokens(str(message.content)) for batch in messages for message in batch
+        )
+
+
+def answer_responder(words: int):
+    def responder(messages):
+        reply = default_responder(messages)
+        if "validation agent" in messages[0].content or "summarize a conversation" in messages[0].content:
+            return reply
+        return " ".join([reply] + [f"point{i}" for i in range(words)])
+
+    return responder
+
+
+def run(mode: str, args, counter: PromptTokens):
+    from graph import graph
+    from nodes import task_agents
+    from nodes.agent_registry import agent_registry
+    from states.states import AgentState
+    from tools.buffermemory import MemoryConfig
+
+    include_control = mode == "buffer"
+    config = MemoryConfig(
+        mode=mode, window_turns=args.window, include_control=include_control
+    )
+    agent_registry.register("summary", task_agents.summarization_prompt, memory=config)
+
+    counter.tokens.clear()
+    state = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for turn in range(args.turns):
+            counter.turn = turn + 1
+            state = AgentState.start_turn(
+                state, f"Summarize {TOPICS[turn % len(TOPICS)]} (part {turn})", "summary", 1
+            )
+            state = graph.invoke(state, {"callbacks": [counter]})
+    return dict(counter.tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--window", type=int, default=3)
+    parser.add_argument("--answer-words", type=int, default=150)
+    parser.add_argument("--modes", nargs="+", default=["none", "buffer", "window", "summary"])
+    args = parser.parse_args()
+
+    install_fake_backends(chat_model=FakeChatModel(responder=answer_responder(args.answer_words)))
+    counter = PromptTokens()
+    marks = sorted({1, 2, 5, 10, 20, args.turns} & set(range(1, args.turns + 1)))
+    print(f"{args.turns} turns, {args.answer_words}-word answers, window {args.window} turns")
+    print("task-agent prompt tokens at turn " + " ".join(f"{mark:>6}" for mark in marks))
+    for mode in args.modes:
+        tokens = run(mode, args, counter)
+        task = [tokens.get(mark, {}).get("task", 0) for mark in marks]
+        total = {
+            caller: sum(turn.get(caller, 0) for turn in tokens.values())
+            for caller in ("task", "validator", "summarizer")
+        }
+        print(
+            f"  {mode:<8}" + " " * 22 + " ".join(f"{value:>6}" for value in task)
+            + f"   total task {total['task']:>7}, validator {total['validator']:>6}, "
+            f"summarizer {total['summarizer']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
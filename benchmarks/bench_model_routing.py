@@ -0,0 +1,90 @@
+"""
+Latency and estimated cost per node and model with every agent on the
+strong model against the default tiered routing (validator and memory
+summarizer on the fast model, task agents on the strong one).
+
+Runs the real graph on fakes: "fake-fast" and "fake-strong" answer after
+`--fast-latency`/`--strong-latency` seconds and are priced as the models
+named by MODEL_FAKE_FAST/MODEL_FAKE_STRONG (gpt-4o-mini and gpt-4o by
+default). Sessions ask `--turns` questions each, so the memory summarizer
+runs once they outgrow the window. Numbers come from model_usage, the same
+recorder /metrics serves.
+
+    python -m benchmarks.bench_model_routing --sessions 8 --turns 6
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import time
+
+from utils.fakes import FakeChatModel, install_fake_backends
+
+TOPICS = ["amdahl's law", "pipelining", "cache hierarchy", "virtual memory", "branch prediction", "dram"]
+
+
+def run(graph, routes: dict, args):
+    from models.model_registry import model_usage
+    from states.states import AgentState
+
+    model_usage.reset()
+    latencies = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for session in range(args.sessions):
+            config = {"configurable": {"thread_id": f"{id(routes)}-{session}", "model_routes": routes}}
+            state = None
+            for turn in range(args.turns):
+                topic = TOPICS[(session + turn) % len(TOPICS)]
+                state = AgentState.start_turn(state, f"Explain {topic} with an example", "summary", 1)
+                start = time.perf_counter()
+                state = graph.invoke(state, config)
+                latencies.append(time.perf_counter() - start)
+    return sorted(latencies), model_usage.snapshot()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--fast-latency", type=float, default=0.02)
+    parser.add_argument("--strong-latency", type=float, default=0.08)
+    args = parser.parse_args()
+
+    os.environ.setdefault("MODEL_FAKE_FAST", "gpt-4o-mini")
+    os.environ.setdefault("MODEL_FAKE_STRONG", "gpt-4o")
+    os.environ.setdefault("MEMORY_WINDOW_TURNS", "2")
+    install_fake_backends()
+    from models.model_registry import model_registry
+
+    model_registry.use_fake(
+        FakeChatModel(),
+        by_model={
+            os.environ["MODEL_FAKE_FAST"]: FakeChatModel(latency=args.fast_latency),
+            os.environ["MODEL_FAKE_STRONG"]: FakeChatModel(latency=args.strong_latency),
+        },
+    )
+    from graph import get_session_graph
+
+    graph = get_session_graph()
+    scenarios = {
+        "all strong": {"retrieval_validator": "strong", "memory_summary": "strong"},
+        "tiered (default)": {},
+    }
+    for label, routes in scenarios.items():
+        latencies, usage = run(graph, routes, args)
+        cost = sum(row["cost_usd"] or 0.0 for row in usage)
+        print(
+            f"\n{label}: {len(latencies)} turns, p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+            f"p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms, est. ${cost:.5f}"
+        )
+        print(f"  {'node':<22}{'model':<18}{'calls':>6}{'in tok':>8}{'out tok':>8}{'p50 ms':>8}{'cost $':>10}")
+        for row in usage:
+            print(
+                f"  {row['node']:<22}{row['model']:<18}{row['calls']:>6}{row['input_tokens']:>8}"
+                f"{row['output_tokens']:>8}{row['latency_ms_p50']:>8.1f}{row['cost_usd'] or 0.0:>10.5f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Burst load on the graph against a rate-limited provider, with and without
+the outbound-call layer (utils.outbound).
+
+`--requests` concurrent graph runs over `--distinct` distinct questions hit
+a fake chat model that, like Azure, accepts at most `--provider-rps` calls
+in any one-second window and answers the rest with a 429 and a Retry-After.
+Three setups are compared:
+
+- direct: what the clients did before the layer: two retries with
+  exponential backoff per call, no shared rate limit, no coalescing;
+- rate-limit: the layer's token bucket and retries, without coalescing;
+- layer: the same plus single-flight coalescing of identical calls.
+
+Then a provider that stops answering: time until a request gives up, with
+no deadline (abandoned by this script after `--hang-cap` seconds) and with
+a `--deadline`.
+
+    python -m benchmarks.bench_outbound --requests 64 --distinct 8 --provider-rps 20
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+import types
+from collections import deque
+from typing import Any
+
+from langchain.schema import Document
+
+from utils.fakes import FakeChatModel, install_fake_backends
+from utils.outbound import DeadlineExceeded, Outbound, OutboundChatModel, deadline
+
+
+class ProviderRateLimited(Exception):
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__("429 Too Many Requests")
+        self.response = types.SimpleNamespace(status_code=429, headers={"retry-after": f"{retry_after:.3f}"})
+
+
+class ProviderLimit:
+    """The provider's side: at most `rps` calls in any one-second window."""
+
+    def __init__(self, rps: int):
+        self.rps = rps
+        self.window: deque = deque()
+        self.accepted = 0
+        self.rejected = 0
+
+    def admit(self) -> None:
+        now = time.monotonic()
+        while self.window and now - self.window[0] >= 1.0:
+            self.window.popleft()
+        if len(self.window) >= self.rps:
+            self.rejected += 1
+            raise ProviderRateLimited(1.0 - (now - self.window[0]))
+        self.window.append(now)
+        self.accepted += 1
+
+
+class LimitedChatModel(FakeChatModel):
+    limit: Any = None
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.limit.admit()
+        return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.limit.admit()
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            yield chunk
+
+
+class UncoalescedChatModel(OutboundChatModel):
+    def _key(self, messages, stop, kwargs):
+        return None
+
+
+ROUTED_NODES = ("retrieval_validator", "summary")
+
+
+def documents():
+    topics = ["RISC-V registers", "cache coherence", "pipelining", "branch prediction", "virtual memory"]
+    return [
+        Document(page_content=f"{topic}: slide {i} explains {topic} with an example.", metadata={"source": f"{i}.pdf"})
+        for i, topic in enumerate(topics * 4)
+    ]
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def routed(setup: str) -> dict:
+    """Run config serving every agent from the fake model named `setup`."""
+    return {"configurable": {"model_routes": {node: f"fake:{setup}" for node in ROUTED_NODES}}}
+
+
+async def burst(graph, setup: str, requests: int, distinct: int, run_deadline: float):
+    from states.states import AgentState
+
+    async def one(i: int):
+        state = AgentState.start_turn(None, f"Explain topic {i % distinct} of computer architecture.", "summary", 0)
+        start = time.perf_counter()
+        try:
+            with deadline(run_deadline):
+                await graph.ainvoke(state, routed(setup))
+            return time.perf_counter() - start, None
+        except Exception as e:
+            return time.perf_counter() - start, e
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(requests)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--distinct", type=int, default=8)
+    parser.add_argument("--provider-rps", type=int, default=20)
+    parser.add_argument("--rps", type=float, default=18.0, help="the layer's rate limit")
+    parser.add_argument("--burst", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--run-deadline", type=float, default=30.0)
+    parser.add_argument("--deadline", type=float, default=1.0)
+    parser.add_argument("--hang-cap", type=float, default=5.0)
+    args = parser.parse_args()
+
+    limit = ProviderLimit(args.provider_rps)
+    provider = LimitedChatModel(latency=args.llm_latency, limit=limit)
+    install_fake_backends(chat_model=provider, documents=documents())
+
+    from graph import get_graph
+    from models.model_registry import model_registry
+    from utils.telemetry import configure_logging
+
+    configure_logging(level="error")
+    graph = get_graph()
+
+    setups = {
+        "direct": UncoalescedChatModel(
+            model=provider, outbound=Outbound("direct", max_retries=2, backoff=0.5, max_backoff=8.0)
+        ),
+        "rate-limit": UncoalescedChatModel(
+            model=provider, outbound=Outbound("rate-limit", rate=args.rps, burst=args.burst, max_retries=5)
+        ),
+        "layer": OutboundChatModel(
+            model=provider, outbound=Outbound("layer", rate=args.rps, burst=args.burst, max_retries=5)
+        ),
+    }
+    print(f"{args.requests} concurrent requests over {args.distinct} questions, "
+          f"provider limit {args.provider_rps}/s, layer limit {args.rps:g}/s\n")
+    print(f"{'setup':<12}{'p50 ms':>9}{'p95 ms':>9}{'failed':>8}{'calls':>7}{'429s':>6}"
+          f"{'retries':>9}{'coalesced':>11}{'queued':>8}{'queue ms':>10}{'seconds':>9}")
+    model_registry.use_fake(provider, by_model=setups)
+    for name, model in setups.items():
+        limit.window.clear()
+        limit.accepted = limit.rejected = 0
+        results, seconds = asyncio.run(burst(graph, name, args.requests, args.distinct, args.run_deadline))
+        latencies = [latency for latency, error in results if error is None]
+        stats = model.outbound.snapshot()
+        print(
+            f"{name:<12}{statistics.median(latencies or [0]) * 1000:>9.0f}"
+            f"{percentile(latencies, 0.95) * 1000:>9.0f}{sum(error is not None for _, error in results):>8}"
+            f"{limit.accepted:>7}{limit.rejected:>6}{stats['retries']:>9}{stats['coalesced']:>11}"
+            f"{stats['queued']:>8}{stats['queue_ms_mean']:>10.0f}{seconds:>9.2f}"
+        )
+        time.sleep(1.0)
+
+    # A provider that accepts the call and never answers.
+    provider.latency = 3600
+    limit.rps = 10**6
+    print()
+    for name, run_deadline in (("no deadline", 0.0), (f"deadline {args.deadline:g}s", args.deadline)):
+        async def hung():
+            from states.states import AgentState
+
+            state = AgentState.start_turn(None, "Explain pipelining.", "summary", 0)
+            start = time.perf_counter()
+            try:
+                with deadline(run_deadline):
+                    await asyncio.wait_for(graph.ainvoke(state, routed("layer")), args.hang_cap)
+                return time.perf_counter() - start, "answered"
+            except DeadlineExceeded:
+                return time.perf_counter() - start, "DeadlineExceeded"
+            except asyncio.TimeoutError:
+                return time.perf_counter() - start, f"still waiting, abandoned after {args.hang_cap:g}s"
+
+        seconds, outcome = asyncio.run(hung())
+        print(f"{name:<16}{seconds:>7.2f}s  {outcome}")
+
+
+if __name__ == "__main__":
+    main()
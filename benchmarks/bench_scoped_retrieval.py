@@ -0,0 +1,111 @@
+"""
+Vector search latency and precision with and without a course/chapter scope,
+on a local store of `--chunks` synthetic chunks (100k by default) spread over
+`--courses` courses of `--chapters` chapters each.
+
+Each course has its own vocabulary plus words shared by every course, so an
+unscoped search for a course's question also returns other courses' chunks;
+precision is the share of the top k that belong to the asked course. Scoped
+searches are timed through the store's metadata value indexes and through a
+full metadata scan (the filter path before the indexes).
+
+    python -m benchmarks.bench_scoped_retrieval --chunks 100000 --queries 200
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import numpy as np
+
+from tools.local_vectorstore import LocalVectorStore
+from utils.fakes import FakeEmbeddings
+
+SHARED = ["memory", "register", "instruction", "cycle", "cache", "bus", "clock", "data", "address", "unit"]
+
+
+class ScanningStore(LocalVectorStore):
+    """Filters by comparing every row's metadata, without the value indexes."""
+
+    def _filter_rows(self, filter):
+        return np.flatnonzero(self._mask(filter))
+
+
+def build_store(args) -> LocalVectorStore:
+    rng = random.Random(args.seed)
+    texts, metadatas = [], []
+    for i in range(args.chunks):
+        course = i % args.courses
+        chapter = (i // args.courses) % args.chapters
+        words = [f"c{course}w{rng.randrange(40)}" for _ in range(12)]
+        words += [f"c{course}ch{chapter}w{rng.randrange(10)}" for _ in range(4)]
+        words += rng.sample(SHARED, 6)
+        texts.append(" ".join(words))
+        metadatas.append({"course": f"course-{course}", "chapter": f"chapter-{chapter}"})
+    store = LocalVectorStore(FakeEmbeddings(size=args.dimensions))
+    for start in range(0, len(texts), 10_000):
+        store.add_texts(texts[start : start + 10_000], metadatas[start : start + 10_000])
+    return store
+
+
+def timed(store, queries, k: int, scope: str):
+    latencies, precision = [], []
+    for course, chapter, vector in queries:
+        filter = {
+            "none": None,
+            "course": {"course": course},
+            "course+chapter": {"course": course, "chapter": chapter},
+        }[scope]
+        start = time.perf_counter()
+        results = store.similarity_search_with_score_by_vector(vector, k=k, filter=filter)
+        latencies.append(time.perf_counter() - start)
+        precision.append(sum(doc.metadata["course"] == course for doc, _ in results) / k)
+    latencies.sort()
+    return (
+        statistics.median(latencies) * 1000,
+        latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        statistics.mean(precision),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chunks", type=int, default=100_000)
+    parser.add_argument("--courses", type=int, default=40)
+    parser.add_argument("--chapters", type=int, default=12)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = build_store(args)
+    print(f"{args.chunks} chunks, {args.courses} courses x {args.chapters} chapters "
+          f"(built in {time.perf_counter() - start:.1f}s)\n")
+
+    rng = random.Random(args.seed + 1)
+    queries = []
+    for _ in range(args.queries):
+        course, chapter = rng.randrange(args.courses), rng.randrange(args.chapters)
+        text = " ".join(
+            [f"c{course}w{rng.randrange(40)}" for _ in range(2)]
+            + [f"c{course}ch{chapter}w{rng.randrange(10)}"]
+            + rng.sample(SHARED, 4)
+        )
+        queries.append((f"course-{course}", f"chapter-{chapter}", store.embedding.embed_query(text)))
+
+    print(f"{'scope':<16}{'filter path':<14}{'p50 ms':>9}{'p95 ms':>9}{'precision@' + str(args.k):>15}")
+    for scope in ("none", "course", "course+chapter"):
+        paths = [("-", LocalVectorStore)] if scope == "none" else [("scan", ScanningStore), ("index", LocalVectorStore)]
+        for label, cls in paths:
+            store.__class__ = cls
+            timed(store, queries[:10], args.k, scope)
+            p50, p95, precision = timed(store, queries, args.k, scope)
+            print(f"{scope:<16}{label:<14}{p50:>9.2f}{p95:>9.2f}{precision:>15.2f}")
+    store.__class__ = LocalVectorStore
+
+
+if __name__ == "__main__":
+    main()
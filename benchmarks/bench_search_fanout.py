@@ -0,0 +1,70 @@
+"""
+Wall time of one search step over several pending queries, serial
+(concurrency 1) vs fanned out, through search_node and asearch_node.
+
+The fake search provider sleeps `--latency` seconds per call and the search
+cache is reset before every step, so each query really pays the latency.
+Also prints documents added and the total_search charged, to check the
+merge/dedupe and the max_search budget.
+
+    python -m benchmarks.bench_search_fanout --queries 4 --latency 0.5
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.fakes import FakeSearchTool, install_fake_backends
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--max-search", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    search_tool = FakeSearchTool(latency=args.latency)
+    fakes = install_fake_backends(search_tool=search_tool)
+    fakes.search_cache.ttl = -1  # every lookup misses
+
+    import nodes.search_agent as search_agent
+    from states.states import AgentState
+
+    # The last query repeats the first up to case, so it is deduplicated.
+    queries = [f"missing topic {i}" for i in range(args.queries - 1)] + ["Missing topic 0"]
+
+    def new_state() -> AgentState:
+        state = AgentState.create_initial_state(option="summary", max_search=args.max_search)
+        state["search_query"] = list(queries)
+        return state
+
+    print(
+        f"{len(queries)} queries, {args.latency}s per search call, max_search={args.max_search}"
+    )
+    for concurrency in args.concurrency:
+        search_agent.SEARCH_MAX_CONCURRENCY = concurrency
+        search_agent._search_pool = ThreadPoolExecutor(max_workers=concurrency)
+        for name, run in (
+            ("search_node", lambda s: search_agent.search_node(s)),
+            ("asearch_node", lambda s: asyncio.run(search_agent.asearch_node(s))),
+        ):
+            state = new_state()
+            search_tool.calls = 0
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                state = run(state)
+            elapsed = time.perf_counter() - start
+            print(
+                f"  concurrency={concurrency} {name:<12} {elapsed:6.2f}s "
+                f"calls={search_tool.calls} docs={len(state['retrieved_docs'])} "
+                f"total_search={state['total_search']}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Time-to-first-byte of /query/stream against total time of the blocking /query,
+with the server running on fake backends under uvicorn.
+
+    python -m benchmarks.bench_server_ttfb --requests 20 --llm-latency 0.3
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+import threading
+import time
+
+import httpx
+import uvicorn
+
+from utils.fakes import FakeChatModel, FakeEmbeddings, FakeSearchTool, install_fake_backends
+
+PORT = 8765
+BODY = {"query": "What is Amdahl's law?", "option": "summary", "max_search": 3}
+
+
+def serve(app) -> uvicorn.Server:
+    server = uvicorn.Server(uvicorn.Config(app, port=PORT, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    args = parser.parse_args()
+
+    install_fake_backends(
+        chat_model=FakeChatModel(latency=args.llm_latency),
+        embeddings=FakeEmbeddings(),
+        search_tool=FakeSearchTool(latency=args.search_latency),
+    )
+    from nodes.agent_registry import agent_registry
+
+    agent_registry.verbose = False
+    from graph import graph
+    from server import create_app
+
+    server = serve(create_app(graph=graph, cache=None))
+    url = f"http://127.0.0.1:{PORT}"
+    blocking, first_byte, streamed = [], [], []
+    with httpx.Client(base_url=url, timeout=60) as client, contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            client.post("/query", json=BODY).raise_for_status()
+            blocking.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            with client.stream("POST", "/query/stream", json=BODY) as response:
+                for i, _chunk in enumerate(response.iter_raw()):
+                    if i == 0:
+                        first_byte.append(time.perf_counter() - start)
+            streamed.append(time.perf_counter() - start)
+    server.should_exit = True
+
+    print(f"/query        total: {statistics.median(blocking) * 1000:8.1f} ms (median)")
+    print(f"/query/stream TTFB:  {statistics.median(first_byte) * 1000:8.1f} ms (median)")
+    print(f"/query/stream total: {statistics.median(streamed) * 1000:8.1f} ms (median)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Time-to-first-token of a task agent's answer, streamed through the compiled
+graph, against the time to the full response.
+
+The fake chat model takes `--llm-latency` seconds to its first token and
+`--token-latency` seconds per further token, so a non-streaming caller waits
+for the whole answer while a streaming one sees the first flashcard as soon
+as the task node starts generating.
+
+    python -m benchmarks.bench_task_streaming --requests 10 --tokens 200
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import statistics
+import time
+
+from utils.fakes import FakeChatModel, default_responder, install_fake_backends
+
+TASK_NODES = {"flashcard", "summary", "quiz", "studyplan"}
+
+
+def long_responder(tokens: int):
+    def responder(messages):
+        if "validation agent" in (messages[0].content if messages else ""):
+            return default_responder(messages)
+        return " ".join(
+            f"Q{i // 10 + 1}:" if i % 10 == 0 else f"word{i}" for i in range(tokens)
+        )
+
+    return responder
+
+
+async def measure(graph, new_state, mode: str):
+    """(time to first task token, time to full response) for one request."""
+    start = time.perf_counter()
+    first = None
+    if mode == "ainvoke":
+        await graph.ainvoke(new_state())
+    elif mode == "astream_events":
+        async for event in graph.astream_events(new_state(), version="v2"):
+            if (
+                first is None
+                and event["event"] == "on_chat_model_stream"
+                and event["metadata"].get("langgraph_node") in TASK_NODES
+                and event["data"]["chunk"].content
+            ):
+                first = time.perf_counter() - start
+    else:
+        async for chunk, metadata in graph.astream(new_state(), stream_mode="messages"):
+            if first is None and metadata.get("langgraph_node") in TASK_NODES and chunk.content:
+                first = time.perf_counter() - start
+    total = time.perf_counter() - start
+    return (first if first is not None else total), total
+
+
+async def run(args):
+    install_fake_backends(
+        chat_model=FakeChatModel(
+            latency=args.llm_latency,
+            token_latency=args.token_latency,
+            responder=long_responder(args.tokens),
+        )
+    )
+    from graph import graph
+    from states.states import AgentState
+
+    def new_state():
+        state = AgentState.create_initial_state(option="flashcard", max_search=1)
+        AgentState.add_human_message(state, "Make flashcards on Amdahl's law")
+        return state
+
+    print(
+        f"{args.tokens} tokens, first token after {args.llm_latency}s, "
+        f"{args.token_latency * 1000:.0f} ms/token"
+    )
+    for mode in ("ainvoke", "astream_events", "astream messages"):
+        firsts, totals = [], []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(args.requests):
+                first, total = await measure(graph, new_state, mode)
+                firsts.append(first)
+                totals.append(total)
+        print(
+            f"  {mode:<17} first token: {statistics.median(firsts) * 1000:7.1f} ms  "
+            f"full response: {statistics.median(totals) * 1000:7.1f} ms (median)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Per-request cost of the instrumentation: CPU time of the same graph runs
+with tracing off, tracing on, and tracing on with debug logging, on
+zero-latency fakes so the overhead is not hidden behind model latency (CPU
+time, as wall time on a shared machine is noisier than the difference).
+Also prints one request's span tree.
+
+    python -m benchmarks.bench_telemetry --requests 200
+"""
+
+import argparse
+import contextlib
+import io
+import statistics
+import time
+
+from utils.fakes import install_fake_backends
+
+
+def run(graph, n: int) -> float:
+    from states.states import AgentState
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(n):
+            state = AgentState.start_turn(None, f"Explain topic {i % 7} in detail", "summary", 1)
+            start = time.process_time()
+            graph.invoke(state)
+            timings.append(time.process_time() - start)
+    return statistics.median(timings)
+
+
+def print_tree(node: dict, depth: int = 0) -> None:
+    attributes = ", ".join(f"{k}={v}" for k, v in node["attributes"].items())
+    print(f"  {'  ' * depth}{node['name']:<28}{node['duration_ms']:>8.2f} ms  {attributes}")
+    for child in node.get("children", ()):
+        print_tree(child, depth + 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    install_fake_backends()
+    from graph import get_graph
+    from utils.telemetry import configure_logging, tracer, tracing_handler
+
+    graph = get_graph()
+    run(graph, 20)
+
+    # Interleaved rounds, best median per setting, to keep drift out of the comparison.
+    results = {}
+    for _ in range(args.rounds):
+        for label, enabled, level in (
+            ("tracing off", False, "warning"),
+            ("tracing on", True, "warning"),
+            ("tracing on, debug logs", True, "debug"),
+        ):
+            token = tracing_handler.set(tracer if enabled else None)
+            configure_logging(level=level)
+            median = run(graph, args.requests)
+            results[label] = min(results.get(label, median), median)
+            tracing_handler.reset(token)
+    configure_logging(level="info")
+
+    base = results["tracing off"]
+    for label, median in results.items():
+        print(f"{label:<24} {median * 1000:7.2f} ms CPU/request ({(median - base) * 1000:+.2f} ms)")
+    print("\nspan tree of the last request:")
+    print_tree(tracer.recent_traces(1)[0].to_tree())
+
+
+if __name__ == "__main__":
+    main()
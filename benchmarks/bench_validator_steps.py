@@ -0,0 +1,113 @@
+"""
+Average graph steps, validator LLM calls and searches per query, with one
+rewritten query per validator turn (the old QUERY= protocol) vs several.
+
+Runs offline: a scripted fake validator answers NO with the topics of the
+case that are not yet in the retrieved content, and YES once all are there;
+fake search results contain their query, so a searched topic counts as found.
+The confidence gate is disabled so every verdict comes from the validator.
+
+    python -m benchmarks.bench_validator_steps --queries 200 --max-queries 1 3
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import re
+
+os.environ["VALIDATOR_GATE_ENABLED"] = "false"
+
+from langchain.schema import Document
+
+from utils.fakes import FakeChatModel, default_responder, install_fake_backends
+
+TOPICS = [
+    "amdahl's law", "cpu time", "clock rate", "cpi", "instruction count",
+    "pipelining", "branch prediction", "cache hierarchy", "virtual memory",
+    "tlb", "dram", "spec benchmark", "power wall", "multicore", "simd",
+    "out-of-order execution", "register renaming", "memory bus", "interrupts",
+    "dma",
+]
+_RETRIEVED = re.compile(r"Retrieved content: (.*?)\.\n\s*Task option", re.S)
+
+
+def make_cases(n: int, seed: int):
+    rng = random.Random(seed)
+    cases = []
+    for i in range(n):
+        # Case-tagged topics, so one case's docs never cover another's.
+        topics = [f"{topic} q{i:04d}" for topic in rng.sample(TOPICS, rng.randint(1, 4))]
+        covered = [topic for topic in topics if rng.random() < 0.4]
+        query = "Explain " + ", ".join(topics)
+        docs = [Document(page_content=f"Notes on {topic}.") for topic in covered]
+        cases.append((query, topics, docs))
+    return cases
+
+
+def scripted_validator(cases):
+    topics_by_query = {query: topics for query, topics, _ in cases}
+
+    def responder(messages):
+        system = messages[0].content if messages else ""
+        if "validation agent" not in system:
+            return default_responder(messages)
+        query = next(m.content for m in messages[1:] if m.type == "human")
+        match = _RETRIEVED.search(system)
+        content = (match.group(1) if match else "").lower()
+        missing = [topic for topic in topics_by_query[query] if topic not in content]
+        if not missing:
+            return json.dumps({"verdict": "YES", "missing_topics": [], "queries": []})
+        return json.dumps({"verdict": "NO", "missing_topics": missing, "queries": missing})
+
+    return responder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--max-search", type=int, default=3)
+    parser.add_argument("--max-queries", type=int, nargs="+", default=[1, 3])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cases = make_cases(args.queries, args.seed)
+    chat_model = FakeChatModel(responder=scripted_validator(cases))
+    fakes = install_fake_backends(
+        chat_model=chat_model, documents=[doc for _, _, docs in cases for doc in docs]
+    )
+
+    import nodes.retriver_validator_agent as validator
+    import nodes.search_agent
+
+    # Keep runs independent: no search results written into the shared store.
+    nodes.search_agent.tool.writeback = False
+    from graph import graph
+    from states.states import AgentState
+
+    print(f"{args.queries} queries, max_search={args.max_search}")
+    for max_queries in args.max_queries:
+        validator.VALIDATOR_MAX_QUERIES = max_queries
+        fakes.search_cache.__init__(":memory:")
+        chat_model.calls = fakes.search_tool.calls = 0
+        steps = capped = 0
+        with contextlib.redirect_stdout(io.StringIO()):
+            for query, topics, _ in cases:
+                state = AgentState.create_initial_state(option="summary", max_search=args.max_search)
+                AgentState.add_human_message(state, query)
+                for update in graph.stream(state, stream_mode="updates"):
+                    steps += 1
+                    state = next(iter(update.values()))
+                capped += state["total_search"] >= args.max_search
+        n = len(cases)
+        print(
+            f"  queries/verdict={max_queries}: steps={steps / n:.2f} "
+            f"llm_calls={chat_model.calls / n:.2f} searches={fakes.search_tool.calls / n:.2f} "
+            f"hit_max_search={capped / n:.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
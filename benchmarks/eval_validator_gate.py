@@ -0,0 +1,162 @@
+"""
+Offline evaluation of the retrieval-confidence gate against the LLM validator.
+
+For every case (a JSONL line with "query", optional "option" and optional
+"llm_verdict"), the gate features are computed once from the retriever's
+documents and relevance scores, as the validator computes them; a grid of thresholds is then swept to report, per setting, the
+share of validator LLM calls avoided and the agreement with the LLM verdict on
+the cases the gate decided.
+
+Labels come from the "llm_verdict" field; `--label` calls the real validator
+for unlabelled cases and `--write-labels` saves them for later offline runs.
+Unlabelled cases count towards the calls avoided but not the agreement, and
+without labels no threshold setting is recommended.
+`--offline` seeds a local store from test_pdfs/ with fake embeddings instead
+of using the configured backends (useful for smoke runs, not for tuning);
+benchmarks.rag_suite runs the evaluation on its fakes the same way.
+
+    python -m benchmarks.eval_validator_gate --label --write-labels labelled.jsonl
+    python -m benchmarks.eval_validator_gate --cases labelled.jsonl
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import itertools
+import json
+from dataclasses import replace
+
+from tools.retrieval_gate import GateConfig, compute_features, decide
+from tools.context_builder import build_context
+from tools.hybrid_retriever import pop_relevance
+
+
+def load_cases(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def llm_verdict(case: dict) -> str:
+    from nodes.agent_registry import agent_registry
+    from nodes.retriver_validator_agent import _validator_inputs
+    from states.states import AgentState
+    from tools.retrivers import semantic_retriever
+
+    state = AgentState.create_initial_state(option=case.get("option", "summary"))
+    AgentState.add_human_message(state, case["query"])
+    AgentState.add_documents(state, semantic_retriever.invoke(case["query"]))
+    return agent_registry.invoke("retrieval_validator", state, _validator_inputs(state)).verdict
+
+
+def evaluate(features, labels, config: GateConfig):
+    """
+    Share of cases the gate decides, and its agreement with the labelled ones
+    among them (None when it decides none of the labelled cases).
+    """
+    decided = labelled = agreed = 0
+    for feature, label in zip(features, labels):
+        verdict = decide(feature, config).verdict
+        if verdict is None:
+            continue
+        decided += 1
+        if label is not None:
+            labelled += 1
+            agreed += verdict == label
+    return decided / len(features), (agreed / labelled if labelled else None)
+
+
+def gate_features(cases, label: bool = False):
+    """Gate features and LLM labels (None where unlabelled) of `cases`."""
+    from tools.retrivers import semantic_retriever
+
+    features, labels = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for case in cases:
+            docs = semantic_retriever.invoke(case["query"])
+            scores = pop_relevance(docs)
+            context, _ = build_context(case["query"], docs)
+            features.append(compute_features(case["query"], scores, context))
+            if case.get("llm_verdict") is None and label:
+                case["llm_verdict"] = llm_verdict(case)
+            labels.append(case.get("llm_verdict"))
+    return features, labels
+
+
+def summarize(cases, base: GateConfig) -> dict:
+    """Calls avoided and agreement of the `base` thresholds on `cases`, for the suite's report."""
+    features, labels = gate_features(cases)
+    avoided, agreement = evaluate(features, labels, base)
+    return {
+        "cases": len(cases),
+        "labelled": sum(label is not None for label in labels),
+        "llm_calls_avoided": round(avoided, 3),
+        "agreement": None if agreement is None else round(agreement, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", default="benchmarks/data/validator_cases.jsonl")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--label", action="store_true", help="call the LLM validator for unlabelled cases")
+    parser.add_argument("--write-labels")
+    parser.add_argument("--min-agreement", type=float, default=0.95)
+    args = parser.parse_args()
+
+    if args.offline:
+        from utils.fakes import install_fake_backends
+        from utils.ingest import iter_chunks, iter_pages
+
+        paths = sorted(glob.glob("test_pdfs/*.pdf"))
+        chunks = [chunk for _, chunk in iter_chunks(iter_pages(paths), "bench", {p: p for p in paths})]
+        install_fake_backends(documents=chunks)
+
+    cases = load_cases(args.cases)
+    base = GateConfig.from_env()
+    features, labels = gate_features(cases, label=args.label)
+
+    if args.write_labels:
+        with open(args.write_labels, "w") as f:
+            f.writelines(json.dumps(case) + "\n" for case in cases)
+
+    print(f"{len(cases)} cases, {sum(label is not None for label in labels)} labelled")
+    for case, feature in zip(cases, features):
+        print(
+            f"  top={feature.top_score:.3f} cov={feature.coverage:.2f} docs={feature.doc_count} "
+            f"llm={case.get('llm_verdict') or '?':<3} {case['query'][:60]}"
+        )
+
+    avoided, agreement = evaluate(features, labels, base)
+    print(f"\ncurrent config: avoided={avoided:.0%} agreement={'n/a' if agreement is None else f'{agreement:.0%}'}")
+    if not any(label is not None for label in labels):
+        print("\nno labelled cases: agreement not measured, run with --label to sweep the thresholds")
+        return
+
+    grid = itertools.product(
+        [0.70, 0.75, 0.80, 0.82, 0.85, 0.90],
+        [0.5, 0.75, 1.0],
+        [0.2, 0.3, 0.4],
+        [0.1, 0.15, 0.25],
+    )
+    rows = []
+    for yes_score, yes_coverage, no_score, no_coverage in grid:
+        config = replace(
+            base, yes_score=yes_score, yes_coverage=yes_coverage,
+            no_score=no_score, no_coverage=no_coverage,
+        )
+        avoided, agreement = evaluate(features, labels, config)
+        if agreement is not None and agreement >= args.min_agreement:
+            rows.append((avoided, agreement, config))
+    rows.sort(key=lambda row: row[0], reverse=True)
+    print(f"\nbest settings with agreement >= {args.min_agreement:.0%}:")
+    for avoided, agreement, c in rows[:10]:
+        print(
+            f"  avoided={avoided:.0%} agreement={agreement:.0%} "
+            f"yes_score={c.yes_score} yes_coverage={c.yes_coverage} "
+            f"no_score={c.no_score} no_coverage={c.no_coverage}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Load test: concurrent graph.ainvoke on one event loop vs. sequential graph.invoke.
+
+All network backends are replaced by fakes from utils.fakes that sleep for a
+configurable latency, so the numbers show how much I/O wait the async graph
+overlaps rather than the cost of the real services.
+
+    python -m benchmarks.load_test_async --requests 50 --llm-latency 0.2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import time
+
+from langchain.schema import Document
+
+from utils.fakes import FakeChatModel, FakeEmbeddings, FakeSearchTool, install_fake_backends
+
+SEED_DOCS = [
+    Document(page_content="Amdahl's law gives the theoretical speedup of a task when part of it is parallelised."),
+    Document(page_content="RISC-V is an open standard instruction set architecture based on RISC principles."),
+    Document(page_content="A microprocessor integrates the CPU on a single integrated circuit."),
+]
+QUERIES = [
+    "What is Amdahl's law?",
+    "Explain the RISC-V instruction set.",
+    "What does a microprocessor contain?",
+]
+OPTIONS = ["summary", "flashcard", "quiz", "studyplan"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=40)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--sequential", type=int, default=10, help="requests for the sync baseline")
+    args = parser.parse_args()
+
+    backends = install_fake_backends(
+        chat_model=FakeChatModel(latency=args.llm_latency),
+        embeddings=FakeEmbeddings(latency=args.embedding_latency),
+        search_tool=FakeSearchTool(latency=args.search_latency),
+        documents=SEED_DOCS,
+    )
+
+    from nodes.agent_registry import agent_registry
+
+    agent_registry.verbose = False
+
+    from graph import graph
+    from states.states import AgentState
+
+    def initial_state(i: int) -> AgentState:
+        state = AgentState.create_initial_state(option=OPTIONS[i % len(OPTIONS)], max_search=3)
+        AgentState.add_human_message(state, QUERIES[i % len(QUERIES)])
+        return state
+
+    async def run_concurrent() -> float:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(i: int):
+            async with semaphore:
+                await graph.ainvoke(initial_state(i))
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        return time.perf_counter() - start
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for i in range(args.sequential):
+            graph.invoke(initial_state(i))
+        sequential = time.perf_counter() - start
+        concurrent = asyncio.run(run_concurrent())
+
+    print(f"sync graph.invoke:   {args.sequential / sequential:8.2f} req/s ({args.sequential} requests)")
+    print(
+        f"async graph.ainvoke: {args.requests / concurrent:8.2f} req/s "
+        f"({args.requests} requests, concurrency {args.concurrency})"
+    )
+    print(f"LLM calls: {backends.chat_model.calls}, embedding calls: {backends.embeddings.calls}")
+
+
+if __name__ == "__main__":
+    main()
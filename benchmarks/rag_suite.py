@@ -0,0 +1,325 @@
+"""
+Offline benchmark and regression suite for the full RAG graph.
+
+Runs the checkpointed session graph end to end on deterministic fakes
+(utils.fakes: chat model, embeddings, web search) with a local vector store
+seeded from the PDFs in `--pdfs`. The scripted workloads in
+benchmarks/data/rag_workloads.json cover questions the slides answer,
+off-corpus questions, questions that run the search loop to `max_search`,
+and multi-turn sessions. For every option it reports, per workload, latency
+percentiles, graph steps, search iterations and tokens per query (read from
+the run's trace), and throughput under each `--concurrency` level. The
+retrieval-confidence gate is evaluated on the same store over `--gate-cases`
+(benchmarks.eval_validator_gate): calls avoided, and agreement on labelled cases.
+
+Results are written as JSON; `--baseline` compares them with an earlier run
+and exits non-zero when a metric regressed by more than `--tolerance`.
+
+    python -m benchmarks.rag_suite --output results.json
+    python -m benchmarks.rag_suite --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import asyncio
+import contextvars
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from uuid import uuid4
+
+from utils.fakes import (
+    FakeChatModel,
+    FakeEmbeddings,
+    FakeSearchTool,
+    default_responder,
+    install_fake_backends,
+)
+
+WORKLOADS_PATH = os.path.join(os.path.dirname(__file__), "data", "rag_workloads.json")
+GATE_CASES_PATH = os.path.join(os.path.dirname(__file__), "data", "validator_cases.jsonl")
+OPTIONS = ["summary", "flashcard", "quiz", "studyplan"]
+
+# Metrics compared against a baseline: name -> True when higher is better.
+TRACKED = {
+    "latency_ms_p50": False,
+    "latency_ms_p95": False,
+    "steps_mean": False,
+    "tokens_mean": False,
+    "throughput_qps": True,
+}
+
+# NO verdicts the validator LLM may still give in the current query; each
+# query runs in its own context (thread or task), so concurrent runs don't mix.
+_searches_left: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar(
+    "searches_left", default=None
+)
+
+
+def scripted_responder(messages) -> str:
+    """The validator says NO while the query has searches left, then YES."""
+    system = messages[0].content if messages else ""
+    left = _searches_left.get()
+    if "validation agent" in system and left and left[0] > 0:
+        left[0] -= 1
+        query = next((m.content for m in reversed(messages) if m.type == "human"), "")
+        return json.dumps({"verdict": "NO", "missing_topics": [query], "queries": [f"{query} {left[0]}"]})
+    return default_responder(messages)
+
+
+def load_workloads(path: str, names: Optional[List[str]] = None) -> Dict[str, dict]:
+    with open(path) as f:
+        workloads = json.load(f)
+    unknown = set(names or ()) - set(workloads)
+    if unknown:
+        raise SystemExit(f"unknown workloads {sorted(unknown)}, expected some of {list(workloads)}")
+    return {name: spec for name, spec in workloads.items() if not names or name in names}
+
+
+def sessions(spec: dict) -> List[List[str]]:
+    """The workload's queries grouped into sessions of `session_turns` turns."""
+    turns = spec.get("session_turns", 1)
+    queries = spec["queries"]
+    return [queries[i : i + turns] for i in range(0, len(queries), turns)]
+
+
+def seed_documents(pdf_dir: str, workers: Optional[int]):
+    from utils.ingest import iter_chunks, iter_pages
+
+    paths = sorted(glob.glob(os.path.join(pdf_dir, "*.pdf")))
+    if not paths:
+        raise SystemExit(f"no PDFs in {pdf_dir}")
+    chapters = {path: os.path.splitext(os.path.basename(path))[0] for path in paths}
+    return [chunk for _, chunk in iter_chunks(iter_pages(paths, workers), "benchmark", chapters)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+def trace_stats(run_id) -> dict:
+    """Steps, search iterations and tokens of one graph run, from its trace."""
+    from utils.telemetry import tracer
+
+    root = tracer.get_trace(run_id.hex)
+    if root is None:
+        return {"steps": 0, "search_iterations": 0, "prompt_tokens": 0, "completion_tokens": 0}
+    llm_spans = [span for span in root.walk() if span.kind == "llm"]
+    return {
+        "steps": root.attributes.get("nodes", 0),
+        "search_iterations": root.attributes.get("search_iterations", 0),
+        "prompt_tokens": sum(span.attributes.get("prompt_tokens", 0) for span in llm_spans),
+        "completion_tokens": sum(span.attributes.get("completion_tokens", 0) for span in llm_spans),
+    }
+
+
+def summarize(samples: List[dict], seconds: Optional[float] = None) -> dict:
+    latencies = [sample["latency"] * 1000 for sample in samples]
+    n = len(samples) or 1
+    summary = {
+        "queries": len(samples),
+        "latency_ms_p50": round(percentile(latencies, 0.50), 2),
+        "latency_ms_p95": round(percentile(latencies, 0.95), 2),
+        "latency_ms_p99": round(percentile(latencies, 0.99), 2),
+        "latency_ms_max": round(max(latencies, default=0.0), 2),
+        "steps_mean": round(sum(s["steps"] for s in samples) / n, 2),
+        "search_iterations_mean": round(sum(s["search_iterations"] for s in samples) / n, 2),
+        "prompt_tokens_mean": round(sum(s["prompt_tokens"] for s in samples) / n, 1),
+        "completion_tokens_mean": round(sum(s["completion_tokens"] for s in samples) / n, 1),
+    }
+    summary["tokens_mean"] = round(summary["prompt_tokens_mean"] + summary["completion_tokens_mean"], 1)
+    if seconds is not None:
+        summary["seconds"] = round(seconds, 3)
+        summary["throughput_qps"] = round(len(samples) / seconds, 2) if seconds else 0.0
+    return summary
+
+
+def run_session(graph, turns: List[str], option: str, searches: int, max_search: int) -> List[dict]:
+    from states.states import AgentState
+
+    samples, state = [], None
+    thread_id = uuid4().hex
+    for query in turns:
+        _searches_left.set([searches])
+        config = {"run_id": uuid4(), "configurable": {"thread_id": thread_id}}
+        state = AgentState.start_turn(state, query, option, max_search)
+        start = time.perf_counter()
+        state = graph.invoke(state, config)
+        samples.append({"latency": time.perf_counter() - start, **trace_stats(config["run_id"])})
+    return samples
+
+
+async def arun_session(graph, turns: List[str], option: str, searches: int, max_search: int) -> List[dict]:
+    from states.states import AgentState
+
+    samples, state = [], None
+    thread_id = uuid4().hex
+    for query in turns:
+        _searches_left.set([searches])
+        config = {"run_id": uuid4(), "configurable": {"thread_id": thread_id}}
+        state = AgentState.start_turn(state, query, option, max_search)
+        start = time.perf_counter()
+        state = await graph.ainvoke(state, config)
+        samples.append({"latency": time.perf_counter() - start, **trace_stats(config["run_id"])})
+    return samples
+
+
+async def run_concurrent(graph, jobs: List[tuple], concurrency: int, max_search: int):
+    """Run every (turns, option, searches) session with at most `concurrency` in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def job(turns, option, searches):
+        async with semaphore:
+            return await arun_session(graph, turns, option, searches, max_search)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(job(*args) for args in jobs))
+    return [sample for samples in results for sample in samples], time.perf_counter() - start
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Tracked metrics more than `tolerance` (relative) worse than `baseline`."""
+    regressions = []
+    for key, current in results["results"].items():
+        previous = baseline.get("results", {}).get(key)
+        if previous is None:
+            continue
+        for metric, higher_is_better in TRACKED.items():
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append(f"{key} {metric}: {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pdfs", default="test_pdfs")
+    parser.add_argument("--workloads", nargs="+", help="names from the workloads file (default: all)")
+    parser.add_argument("--workloads-file", default=WORKLOADS_PATH)
+    parser.add_argument("--options", nargs="+", default=OPTIONS, choices=OPTIONS)
+    parser.add_argument("--repeat", type=int, default=2, help="passes over each workload")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--max-search", type=int, default=3)
+    parser.add_argument("--llm-latency", type=float, default=0.02)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.005)
+    parser.add_argument("--search-latency", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, help="PDF extraction processes")
+    parser.add_argument("--gate-cases", default=GATE_CASES_PATH, help="validator gate cases, '' to skip")
+    parser.add_argument("--output", default="-", help="JSON results file, '-' for stdout")
+    parser.add_argument("--baseline", help="earlier results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    workloads = load_workloads(args.workloads_file, args.workloads)
+    # pypdf warns about every malformed number in the slides.
+    logging.getLogger("pypdf").setLevel(logging.ERROR)
+    documents = seed_documents(args.pdfs, args.workers)
+    fakes = install_fake_backends(
+        chat_model=FakeChatModel(
+            latency=args.llm_latency, token_latency=args.token_latency, responder=scripted_responder
+        ),
+        embeddings=FakeEmbeddings(latency=args.embedding_latency),
+        search_tool=FakeSearchTool(latency=args.search_latency),
+        documents=documents,
+    )
+    # Uncached search, so every search pays its latency and passes stay comparable.
+    import nodes.search_agent
+
+    nodes.search_agent.tool = fakes.search_tool
+
+    from graph import get_session_graph
+    from utils.telemetry import configure_logging, tracer, tracing_handler
+
+    configure_logging(level="warning")
+    tracing_handler.set(tracer)
+    graph = get_session_graph()
+    run_session(graph, ["warm up"], "summary", 0, args.max_search)
+
+    results = {}
+    for option in args.options:
+        jobs = []
+        for name, spec in workloads.items():
+            samples = []
+            for _ in range(args.repeat):
+                for turns in sessions(spec):
+                    samples += run_session(graph, turns, option, spec.get("searches", 0), args.max_search)
+                    jobs.append((turns, option, spec.get("searches", 0)))
+            results[f"{option}/{name}"] = summarize(samples)
+        for concurrency in args.concurrency:
+            samples, seconds = asyncio.run(run_concurrent(graph, jobs, concurrency, args.max_search))
+            results[f"{option}/concurrency={concurrency}"] = summarize(samples, seconds)
+
+    report = {
+        "suite": "rag",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "documents": len(documents),
+        "results": results,
+    }
+    if args.gate_cases:
+        from benchmarks.eval_validator_gate import load_cases, summarize as summarize_gate
+        from tools.retrieval_gate import GateConfig
+
+        report["validator_gate"] = summarize_gate(load_cases(args.gate_cases), GateConfig.from_env())
+
+    print(f"{len(documents)} chunks from {args.pdfs}, commit {report['commit']}", file=sys.stderr)
+    print(
+        f"{'':<28}{'queries':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'steps':>7}{'search':>7}"
+        f"{'tokens':>8}{'qps':>8}",
+        file=sys.stderr,
+    )
+    for key, row in results.items():
+        print(
+            f"{key:<28}{row['queries']:>8}{row['latency_ms_p50']:>9.1f}{row['latency_ms_p95']:>9.1f}"
+            f"{row['latency_ms_p99']:>9.1f}{row['steps_mean']:>7.2f}{row['search_iterations_mean']:>7.2f}"
+            f"{row['tokens_mean']:>8.0f}{row.get('throughput_qps', '-'):>8}",
+            file=sys.stderr,
+        )
+    gate = report.get("validator_gate")
+    if gate:
+        agreement = "n/a" if gate["agreement"] is None else f"{gate['agreement']:.0%}"
+        print(
+            f"validator gate: {gate['cases']} cases ({gate['labelled']} labelled), "
+            f"llm calls avoided {gate['llm_calls_avoided']:.0%}, agreement {agreement}",
+            file=sys.stderr,
+        )
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,68 @@
-from typing import TypedDict, Literal
+from typing import Dict, TypedDict, Literal
 from langgraph.graph import StateGraph, END
-from langchain_community.tools.tavily_search import TavilySearchResults
-from states.states import AgentState
-from typing import Annotated, Sequence, TypedDict, Union
-from langchain_core.messages import HumanMessage, AIMessage
-from langchain.schema import Document
-from nodes.retriver_validator_agent import retrieval_validator_agent
-from nodes.task_agents import flashcard_agent, summarizer_agent, quiz_agent, studyplan_agent
-from router.routers import route_next_step
-from nodes.search_agent import search_node
-
-class GraphConfig(TypedDict):
-    model_name: Literal["anthropic", "openai", "mistral"]
+from states.states import AgentState, retrieval_scope
+from langchain_core.runnables import RunnableLambda
+from nodes.retriver_validator_agent import (
+    retrieval_validator_agent,
+    aretrieval_validator_agent,
+)
+from nodes.task_agents import (
+    flashcard_agent,
+    summarizer_agent,
+    quiz_agent,
+    studyplan_agent,
+    aflashcard_agent,
+    asummarizer_agent,
+    aquiz_agent,
+    astudyplan_agent,
+)
+from router.routers import route_next_step, aroute_next_step
+from nodes.search_agent import search_node, asearch_node
+from nodes.agent_registry import agent_registry
+from models.model_registry import model_registry
+from tools.semantic_cache import get_corpus_version, scoped_option, semantic_cache
+from states.checkpointer import create_checkpointer
+from functools import lru_cache
+from typing import Optional
+import os
+import time
+from utils.telemetry import get_logger
+
+log = get_logger("graph")
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+CHECKPOINT_ENABLED = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+
+class GraphConfig(TypedDict, total=False):
+    # Provider of every agent's model (models.model_registry); MODEL_PROVIDER by default.
+    model_name: Literal["anthropic", "openai", "mistral", "fake"]
+    # Per-node route overrides, e.g. {"quiz": "strong", "summary": "anthropic:strong"}.
+    model_routes: Dict[str, str]
+    # Completion token limit of every agent's model; MODEL_MAX_TOKENS by default.
+    max_tokens: int
+
+
+def _node(func, afunc) -> RunnableLambda:
+    """Pair a sync node with its async twin so both invoke and ainvoke work."""
+    return RunnableLambda(func, afunc=afunc, name=func.__name__)
+
 
 workflow = StateGraph(AgentState, config_schema=GraphConfig)
 
-workflow.add_node("retrieval_validator", retrieval_validator_agent)
-workflow.add_node("search", search_node)
-workflow.add_node("flashcard", flashcard_agent)
-workflow.add_node("summary", summarizer_agent)
-workflow.add_node("quiz", quiz_agent)
-workflow.add_node("studyplan", studyplan_agent)
+workflow.add_node(
+    "retrieval_validator",
+    _node(retrieval_validator_agent, aretrieval_validator_agent),
+)
+workflow.add_node("search", _node(search_node, asearch_node))
+workflow.add_node("flashcard", _node(flashcard_agent, aflashcard_agent))
+workflow.add_node("summary", _node(summarizer_agent, asummarizer_agent))
+workflow.add_node("quiz", _node(quiz_agent, aquiz_agent))
+workflow.add_node("studyplan", _node(studyplan_agent, astudyplan_agent))
 
 workflow.set_entry_point("retrieval_validator")
 workflow.add_conditional_edges(
     "retrieval_validator",
-    route_next_step,
+    _node(route_next_step, aroute_next_step),
     {
         "search": "search",
         "flashcard": "flashcard",
@@ -41,16 +78,130 @@ workflow.add_edge("flashcard", END)
 workflow.add_edge("summary", END)
 workflow.add_edge("quiz", END)
 workflow.add_edge("studyplan", END)
-graph = workflow.compile()
 
 
+@lru_cache(maxsize=None)
+def get_graph():
+    return workflow.compile()
+
+
+@lru_cache(maxsize=None)
+def get_session_graph():
+    """
+    The same workflow with its state checkpointed per thread_id after every
+    step, so a session can be resumed (by any worker sharing CHECKPOINT_DB).
+    """
+    if not CHECKPOINT_ENABLED:
+        return get_graph()
+    return workflow.compile(checkpointer=create_checkpointer())
+
+
+# `graph` and `session_graph` are compiled on first access (PEP 562), so
+# importing this module opens no database and builds no client.
+_LAZY = {"graph": get_graph, "session_graph": get_session_graph}
+
+
+def __getattr__(name: str):
+    if name in _LAZY:
+        return _LAZY[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def startup() -> None:
+    """
+    Build the clients, vector store, search tool, agents and compiled graphs,
+    and open the database pools' minimum connections, now rather than on the first request, e.g. from a server's startup hook.
+    A failing service is reported and retried on first use, so a worker can
+    boot while it is down.
+    """
+    from nodes.search_agent import get_search_tool
+
+    def retrievers():
+        from tools import retrivers
+
+        return retrivers.semantic_retriever, retrivers.async_semantic_retriever
+
+    def keyword_index():
+        from tools.retrivers import ensure_keyword_index
+
+        ensure_keyword_index()
+
+    def database_pools():
+        from tools.db_pool import warm_pools
+
+        warm_pools()
+
+    steps = {
+        "models": model_registry.validate,
+        "agents": agent_registry.warmup,
+        "retrievers": retrievers,
+        "database pools": database_pools,
+        "keyword index": keyword_index,
+        "search tool": get_search_tool,
+        "graphs": get_session_graph,
+    }
+    for name, step in steps.items():
+        start = time.perf_counter()
+        try:
+            step()
+            log.info("startup.ready", step=name, seconds=round(time.perf_counter() - start, 2))
+        except Exception as e:
+            log.warning("startup.failed", step=name, error=str(e), retry="first use")
+
+
+def thread_config(thread_id: str) -> dict:
+    return {"configurable": {"thread_id": thread_id}}
+
+
+def run_query(
+    query: str,
+    option: str = "summary",
+    max_search: int = 3,
+    thread_id: Optional[str] = None,
+    model_name: Optional[str] = None,
+    course: Optional[str] = None,
+    chapter: Optional[str] = None,
+) -> dict:
+    """
+    Answer `query` through the semantic cache, running the graph on a miss.
+    With `thread_id`, the question is a follow-up in that session instead;
+    `model_name` picks the model provider (GraphConfig). `course`/`chapter`
+    restrict retrieval to that part of the corpus.
+    """
+    scope = retrieval_scope(course, chapter)
+    cache_option = scoped_option(option, scope)
+    use_cache = SEMANTIC_CACHE_ENABLED and thread_id is None and model_name is None
+    if use_cache:
+        cached = semantic_cache.lookup(query, cache_option)
+        if cached is not None:
+            return {"answer": cached, "cached": True}
+
+    start = time.perf_counter()
+    corpus_version = get_corpus_version()
+    session_graph = get_session_graph()
+    model_config = {"configurable": {"model_name": model_name}} if model_name else None
+    if thread_id is not None and session_graph.checkpointer is not None:
+        config = thread_config(thread_id)
+        if model_name:
+            config["configurable"]["model_name"] = model_name
+        previous = session_graph.get_state(config).values
+        state = AgentState.start_turn(previous, query, option, max_search, scope)
+        state = session_graph.invoke(state, config)
+    else:
+        state = get_graph().invoke(
+            AgentState.start_turn(None, query, option, max_search, scope), model_config
+        )
+    answer = AgentState.get_last_ai_message(state)
+    if use_cache and state["next_step"] == "end":
+        semantic_cache.store(query, cache_option, answer, time.perf_counter() - start, corpus_version)
+    return {"answer": answer, "cached": False}
 
 
 def test_graph(query: str):
     state = AgentState.create_initial_state(option="summary", max_search=5)
 
     AgentState.add_human_message(state, query)
-    updated_state = graph.invoke(state)
+    updated_state = get_graph().invoke(state)
     print("\n\n Human: ", AgentState.get_last_human_message(updated_state))
     print("\n\nNext step:", updated_state["next_step"])
     if updated_state["search_query"]:
@@ -58,4 +209,14 @@ def test_graph(query: str):
     print("last ai message: ", AgentState.get_last_ai_message(updated_state))
 
 
-test_graph("What is Amdahl's law? Give full definition and formula.")
+async def atest_graph(query: str):
+    state = AgentState.create_initial_state(option="summary", max_search=5)
+
+    AgentState.add_human_message(state, query)
+    updated_state = await get_graph().ainvoke(state)
+    print("\n\n Human: ", AgentState.get_last_human_message(updated_state))
+    print("last ai message: ", AgentState.get_last_ai_message(updated_state))
+
+
+if __name__ == "__main__":
+    test_graph("What is Amdahl's law? Give full definition and formula.")
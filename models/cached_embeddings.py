@@ -0,0 +1,288 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that never embeds the same text twice.
+
+    Vectors are keyed on a SHA-256 of the text (plus `namespace`, e.g. the
+    deployment name) and kept in an in-memory LRU of `max_entries` vectors,
+    optionally backed by `cache_dir` where each vector is stored as raw
+    float32, written to a temporary file and renamed into place; files of
+    the wrong size are treated as misses. Misses are deduplicated against
+    in-flight requests and sent in bulk calls of at most `max_batch_size`
+    texts; on the async path, misses from concurrent callers arriving within
+    `batch_window` seconds share one call. Callers wait on the shared
+    futures without owning them, so a cancelled caller never cancels the
+    call the others joined. Queries are cached apart from
+    documents and embedded through the query endpoint, since some providers
+    embed the two differently.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        namespace: str = "",
+        max_entries: int = 50_000,
+        cache_dir: Optional[str] = None,
+        max_batch_size: int = 256,
+        batch_window: float = 0.005,
+    ):
+        self.underlying = underlying
+        self.namespace = namespace or ""
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._ainflight: Dict[str, asyncio.Future] = {}
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._batches: Set[asyncio.Task] = set()
+
+        # Vector length, from the first vector embedded or read back.
+        self.dimensions: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.underlying_calls = 0
+
+    def _key(self, text: str, query: bool = False) -> str:
+        prefix = f"{self.namespace}\0query" if query else self.namespace
+        return hashlib.sha256(f"{prefix}\0{text}".encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.f32")
+
+    def _get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                return vector
+        if self.cache_dir and os.path.exists(self._path(key)):
+            vector = np.fromfile(self._path(key), dtype=np.float32)
+            if not vector.size or vector.size != (self.dimensions or vector.size):
+                # Left by a crash or another tool: embed the text again.
+                return None
+            self.dimensions = vector.size
+            self._remember(key, vector)
+            return vector
+        return None
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _put(self, key: str, vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        self.dimensions = self.dimensions or array.size
+        self._remember(key, array)
+        if self.cache_dir:
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Readers never see a partly written file.
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            array.tofile(tmp)
+            os.replace(tmp, path)
+        return array
+
+    def _lookup(self, texts: List[str]):
+        keys = [self._key(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            vector = self._get(key)
+            if vector is None:
+                missing[key] = text
+            else:
+                found[key] = vector
+        self.hits += len(found)
+        self.misses += len(missing)
+        return keys, found, missing
+
+    # Sync path: single-flight per text across threads, bulk calls per caller.
+
+    def _embed_missing(self, missing: Dict[str, str]) -> Dict[str, np.ndarray]:
+        owned: Dict[str, str] = {}
+        waiting: Dict[str, Future] = {}
+        with self._lock:
+            for key, text in missing.items():
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    owned[key] = text
+                waiting[key] = future
+
+        owned_items = list(owned.items())
+        try:
+            for i in range(0, len(owned_items), self.max_batch_size):
+                batch = owned_items[i : i + self.max_batch_size]
+                self.underlying_calls += 1
+                vectors = self.underlying.embed_documents([text for _, text in batch])
+                for (key, _), vector in zip(batch, vectors):
+                    waiting[key].set_result(self._put(key, vector))
+        except Exception as e:
+            for key in owned:
+                if not waiting[key].done():
+                    waiting[key].set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                for key in owned:
+                    self._inflight.pop(key, None)
+
+        return {key: future.result() for key, future in waiting.items()}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            found.update(self._embed_missing(missing))
+        return [found[key].tolist() for key in keys]
+
+    def _lookup_query(self, text: str) -> Tuple[str, Optional[np.ndarray]]:
+        key = self._key(text, query=True)
+        vector = self._get(key)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key, vector
+
+    def embed_query(self, text: str) -> List[float]:
+        key, vector = self._lookup_query(text)
+        if vector is not None:
+            return vector.tolist()
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result().tolist()
+        try:
+            self.underlying_calls += 1
+            vector = self._put(key, self.underlying.embed_query(text))
+            future.set_result(vector)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+        return vector.tolist()
+
+    # Async path: misses from concurrent coroutines are micro-batched.
+
+    def _flush(self) -> None:
+        self._flush_handle = None
+        while self._pending:
+            batch = self._pending[: self.max_batch_size]
+            del self._pending[: self.max_batch_size]
+            # Referenced until done, so a running batch isn't garbage-collected.
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, str, asyncio.Future]]) -> None:
+        try:
+            self.underlying_calls += 1
+            vectors = await self.underlying.aembed_documents([text for _, text, _ in batch])
+            for (key, _, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(self._put(key, vector))
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+                    future.exception()
+        finally:
+            for key, _, future in batch:
+                # Cancelled mid-call: waiters see a cancelled future and embed again.
+                if not future.done():
+                    future.cancel()
+                self._ainflight.pop(key, None)
+
+    async def _aembed_missing(self, missing: Dict[str, str]) -> Dict[str, np.ndarray]:
+        loop = asyncio.get_running_loop()
+        waiting: Dict[str, asyncio.Future] = {}
+        for key, text in missing.items():
+            future = self._ainflight.get(key)
+            if future is None:
+                future = self._ainflight[key] = loop.create_future()
+                self._pending.append((key, text, future))
+            waiting[key] = future
+
+        if len(self._pending) >= self.max_batch_size:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush()
+        elif self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+        # asyncio.wait, not gather: cancelling this caller must not cancel the shared futures.
+        await asyncio.wait(waiting.values())
+        vectors = {key: future.result() for key, future in waiting.items() if not future.cancelled()}
+        abandoned = {key: missing[key] for key in waiting if key not in vectors}
+        if abandoned:
+            vectors.update(await self._aembed_missing(abandoned))
+        return vectors
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup(texts)
+        if missing:
+            found.update(await self._aembed_missing(missing))
+        return [found[key].tolist() for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key, vector = self._lookup_query(text)
+        if vector is not None:
+            return vector.tolist()
+        while (future := self._ainflight.get(key)) is not None:
+            # Waited on, not awaited: a cancelled joiner leaves the owner's future alone.
+            await asyncio.wait([future])
+            if not future.cancelled():
+                return future.result().tolist()
+            # The owner was cancelled; the next joiner takes the call over.
+        future = self._ainflight[key] = asyncio.get_running_loop().create_future()
+        try:
+            self.underlying_calls += 1
+            vector = self._put(key, await self.underlying.aembed_query(text))
+            future.set_result(vector)
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieved here, so a call nobody joined doesn't log "never retrieved".
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._ainflight.pop(key, None)
+        return vector.tolist()
+
+    def metrics(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "underlying_calls": self.underlying_calls,
+        }
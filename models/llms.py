@@ -1,25 +1,110 @@
-from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
-from langchain_ollama import OllamaEmbeddings
-from dotenv import load_dotenv
+"""
+Chat model and embedding clients, built on first use.
+
+`from models.llms import model, azure_embeddings` still works: the module
+attributes are resolved lazily (PEP 562), so importing this module reads no
+.env and constructs no client.
+"""
+
 import os
+from functools import lru_cache
+
+# Names in .env whose values the client libraries read from other variables.
+_ENV_ALIASES = {
+    "TAVILY_API_KEY": "tavily_api_key",
+    "AZURE_OPENAI_API_KEY": "AZURE_OPENAI_API_KEY",
+    "OPENAI_API_VERSION": "OPENAI_API_VERSION",
+    "AZURE_OPENAI_ENDPOINT": "AZURE_OPENAI_ENDPOINT",
+}
+
+
+@lru_cache(maxsize=None)
+def load_settings() -> None:
+    """Load .env once and export the variables the client libraries expect."""
+    from dotenv import load_dotenv
+
+    load_dotenv(override=True)
+    for name, source in _ENV_ALIASES.items():
+        value = os.getenv(source)
+        if value is not None:
+            os.environ[name] = value
+
+
+# Clients don't retry: utils.outbound does, under rate limits shared across requests.
+def _azure_openai(model_name: str, **kwargs):
+    from langchain_openai import AzureChatOpenAI
+
+    return AzureChatOpenAI(azure_deployment=model_name, max_retries=0, **kwargs)
+
+
+def _anthropic(model_name: str, **kwargs):
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(model=model_name, max_retries=0, **kwargs)
+
+
+def _mistral(model_name: str, **kwargs):
+    from langchain_mistralai import ChatMistralAI
+
+    return ChatMistralAI(model=model_name, max_retries=0, **kwargs)
+
+
+# GraphConfig.model_name -> client; "openai" is served by the Azure deployment.
+CHAT_PROVIDERS = {"openai": _azure_openai, "anthropic": _anthropic, "mistral": _mistral}
+
+
+@lru_cache(maxsize=None)
+def get_chat_model(
+    provider: str = "openai",
+    model_name: str = "gpt-4o-mini",
+    temperature: float = 0.1,
+    max_tokens: int = 100,
+):
+    """
+    One client per provider/model/settings, shared by every request, behind
+    the provider's rate limit (utils.outbound).
+    """
+    from utils.outbound import OutboundChatModel, get_outbound
+
+    if provider not in CHAT_PROVIDERS:
+        raise ValueError(f"Unknown chat provider {provider!r}, expected one of {list(CHAT_PROVIDERS)}")
+    load_settings()
+    outbound = get_outbound(provider)
+    settings = {"timeout": outbound.timeout} if outbound.timeout else {}
+    client = CHAT_PROVIDERS[provider](model_name, temperature=temperature, max_tokens=max_tokens, **settings)
+    return OutboundChatModel(model=client, outbound=outbound, label=f"{provider}:{model_name}")
+
+
+@lru_cache(maxsize=None)
+def get_embeddings():
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    from models.cached_embeddings import CachedEmbeddings
+    from utils.outbound import OutboundEmbeddings, get_outbound
 
-load_dotenv(override=True)
+    load_settings()
+    outbound = get_outbound("embeddings")
+    return CachedEmbeddings(
+        OutboundEmbeddings(
+            AzureOpenAIEmbeddings(
+                azure_deployment=os.getenv("AZURE_EMBEDDING_DEPLOYMENT"),
+                api_version=os.getenv("EMBEDDING_API_VERSION"),
+                timeout=outbound.timeout or None,
+                max_retries=0,
+            ),
+            outbound,
+        ),
+        namespace=os.getenv("AZURE_EMBEDDING_DEPLOYMENT", ""),
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "50000")),
+        cache_dir=os.getenv("EMBEDDING_CACHE_DIR"),
+        max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256")),
+    )
 
-os.environ["TAVILY_API_KEY"] = os.getenv("tavily_api_key")
-os.environ["AZURE_OPENAI_API_KEY"] = os.getenv("AZURE_OPENAI_API_KEY")
-os.environ["OPENAI_API_VERSION"] = os.getenv("OPENAI_API_VERSION")
-os.environ["AZURE_OPENAI_ENDPOINT"] = os.getenv("AZURE_OPENAI_ENDPOINT")
 
-model = AzureChatOpenAI(
-    azure_deployment="gpt-4o-mini",
-    temperature=0.1,
-    max_tokens=100,
-    timeout=None,
-    max_retries=2,
-)
+_PROVIDERS = {"model": get_chat_model, "azure_embeddings": get_embeddings}
 
 
-azure_embeddings = AzureOpenAIEmbeddings(
-    azure_deployment=os.getenv("AZURE_EMBEDDING_DEPLOYMENT"),
-    api_version=os.getenv("EMBEDDING_API_VERSION"),
-)
+def __getattr__(name: str):
+    if name in _PROVIDERS:
+        return _PROVIDERS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
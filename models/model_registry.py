@@ -0,0 +1,277 @@
+"""
+Per-request chat model routing.
+
+Every agent call resolves a `ModelSpec` from the run's config: the provider
+is `configurable.model_name` (GraphConfig), else MODEL_PROVIDER; the tier
+comes from the node, so the validator and the memory summarizer run on the
+"fast" model and the task agents on the "strong" one. Routes override a
+node's tier, provider or model, from `configurable.model_routes` or
+MODEL_ROUTES ("retrieval_validator=fast;quiz=anthropic:strong;summary=openai:strong").
+A tier's model is MODEL_<PROVIDER>_<TIER>, else the table below; Azure
+("openai") tiers name deployments and default to the one .env configures.
+The completion limit is `configurable.max_tokens`, else MODEL_MAX_TOKENS;
+`FinishReasons` tells a caller whether a reply was cut off at it.
+
+Clients are built once per spec. `model_usage` records calls, latency,
+tokens and estimated cost per node and model, served by /metrics.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models import BaseChatModel
+from langchain_core.outputs import LLMResult
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+
+from utils.telemetry import get_logger, token_usage
+
+log = get_logger("models")
+
+# "openai" is served by Azure deployments: both tiers default to
+# AZURE_OPENAI_DEPLOYMENT (the gpt-4o-mini deployment of the setup guide)
+# until MODEL_OPENAI_STRONG / MODEL_OPENAI_FAST name another deployment.
+MODEL_TIERS = {
+    "openai": {"fast": "gpt-4o-mini", "strong": "gpt-4o-mini"},
+    "anthropic": {"fast": "claude-3-5-haiku-latest", "strong": "claude-3-5-sonnet-latest"},
+    "mistral": {"fast": "mistral-small-latest", "strong": "mistral-large-latest"},
+    "fake": {"fast": "fake-fast", "strong": "fake-strong"},
+}
+
+# Nodes not listed run on the "strong" tier.
+NODE_TIERS = {"retrieval_validator": "fast", "memory_summary": "fast"}
+
+# USD per million input/output tokens, list prices; unknown models report no cost.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "claude-3-5-haiku-latest": (0.80, 4.00),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+    "mistral-small-latest": (0.20, 0.60),
+    "mistral-large-latest": (2.00, 6.00),
+}
+
+
+@dataclass(frozen=True)
+class ModelSpec:
+    provider: str
+    model: str
+    temperature: float = 0.1
+    max_tokens: int = 100
+
+    @property
+    def label(self) -> str:
+        return f"{self.provider}:{self.model}"
+
+
+def parse_routes(value: str) -> Dict[str, str]:
+    """"node=route;node=route" -> {node: route}."""
+    routes = {}
+    for item in value.replace(",", ";").split(";"):
+        node, sep, route = item.partition("=")
+        if sep and node.strip() and route.strip():
+            routes[node.strip()] = route.strip()
+    return routes
+
+
+class ModelUsage(BaseCallbackHandler):
+    """Calls, errors, latency, tokens and cost per (node, model)."""
+
+    run_inline = True
+
+    def __init__(self, window: int = 1024):
+        self.window = window
+        self._runs: Dict[UUID, Tuple[float, str, str]] = {}
+        self._stats: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id: UUID, metadata: Optional[dict] = None, **kwargs
+    ) -> None:
+        metadata = metadata or {}
+        if "routed_model" in metadata:
+            node = metadata.get("routed_node") or metadata.get("langgraph_node", "-")
+            self._runs[run_id] = (time.perf_counter(), node, metadata["routed_model"])
+
+    def _finish(self, run_id: UUID, response: Optional[LLMResult]) -> None:
+        run = self._runs.pop(run_id, None)
+        if run is None:
+            return
+        start, node, model = run
+        latency = time.perf_counter() - start
+        input_tokens, output_tokens = token_usage(response) if response else (0, 0)
+        prices = MODEL_PRICES.get(model.split(":", 1)[1])
+        with self._lock:
+            stats = self._stats.setdefault(
+                (node, model),
+                {"calls": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0,
+                 "latencies": deque(maxlen=self.window)},
+            )
+            stats["calls"] += 1
+            stats["errors"] += response is None
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["latencies"].append(latency)
+            if prices is not None:
+                stats["cost_usd"] = stats.get("cost_usd", 0.0) + (
+                    input_tokens * prices[0] + output_tokens * prices[1]
+                ) / 1e6
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, response)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, None)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(key, dict(stats, latencies=sorted(stats["latencies"])))
+                     for key, stats in self._stats.items()]
+        rows = []
+        for (node, model), stats in sorted(items):
+            latencies = stats.pop("latencies")
+            rows.append({
+                "node": node,
+                "model": model,
+                **stats,
+                "cost_usd": round(stats["cost_usd"], 6) if "cost_usd" in stats else None,
+                "latency_ms_p50": round(latencies[len(latencies) // 2] * 1000, 1) if latencies else None,
+                "latency_ms_p95": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1)
+                if len(latencies) > 1 else None,
+            })
+        return rows
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+
+
+class FinishReasons(BaseCallbackHandler):
+    """Whether any LLM call of a run stopped at its completion token limit."""
+
+    def __init__(self):
+        self.truncated = False
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                message = getattr(generation, "message", None)
+                info = {**(getattr(message, "response_metadata", None) or {}), **(generation.generation_info or {})}
+                # OpenAI and Mistral report "length", Anthropic "max_tokens".
+                if info.get("finish_reason") == "length" or info.get("stop_reason") == "max_tokens":
+                    self.truncated = True
+
+
+class ModelRegistry:
+    """Resolves the model of a node per request and caches the clients."""
+
+    def __init__(self):
+        self.default_provider: Optional[str] = None
+        self.routes: Dict[str, str] = {}
+        self.fake_model: Optional[BaseChatModel] = None
+        self.fake_models: Dict[str, BaseChatModel] = {}
+        self._models: Dict[ModelSpec, BaseChatModel] = {}
+        self._lock = threading.Lock()
+
+    def _load_defaults(self) -> None:
+        from models.llms import load_settings
+
+        load_settings()
+        self.routes = parse_routes(os.getenv("MODEL_ROUTES", ""))
+        self.default_provider = os.getenv("MODEL_PROVIDER", "openai")
+
+    def use_fake(
+        self, model: BaseChatModel, by_model: Optional[Dict[str, BaseChatModel]] = None
+    ) -> None:
+        """
+        Serve every node from `model`, e.g. utils.fakes.FakeChatModel, or from
+        `by_model[name]` for the fake model `name` ("fake-fast", "fake-strong").
+        """
+        self.fake_model = model
+        self.fake_models = dict(by_model or {})
+        self.default_provider = "fake"
+        self.routes = parse_routes(os.getenv("MODEL_ROUTES", ""))
+        self._models.clear()
+
+    def resolve(self, node: str, config: Optional[RunnableConfig] = None) -> ModelSpec:
+        if self.default_provider is None:
+            self._load_defaults()
+        configurable = (config or {}).get("configurable") or {}
+        provider = configurable.get("model_name") or self.default_provider
+        route = (configurable.get("model_routes") or {}).get(node) or self.routes.get(node)
+        model = None
+        tier = NODE_TIERS.get(node, "strong")
+        for part in (route.split(":", 1) if route else ()):
+            if part in MODEL_TIERS:
+                provider = part
+            elif part in ("fast", "strong"):
+                tier = part
+            else:
+                model = part
+        if provider not in MODEL_TIERS:
+            raise ValueError(f"Unknown model provider {provider!r}, expected one of {list(MODEL_TIERS)}")
+        if model is None:
+            model = self.tier_model(provider, tier)
+        max_tokens = configurable.get("max_tokens") or os.getenv("MODEL_MAX_TOKENS", "100")
+        return ModelSpec(provider, model, max_tokens=int(max_tokens))
+
+    def tier_model(self, provider: str, tier: str) -> str:
+        """The model (Azure: deployment) serving `tier` of `provider`."""
+        model = os.getenv(f"MODEL_{provider.upper()}_{tier.upper()}")
+        if not model and provider == "openai":
+            model = os.getenv("AZURE_OPENAI_DEPLOYMENT")
+        return model or MODEL_TIERS[provider][tier]
+
+    def validate(self) -> Dict[str, str]:
+        """
+        Resolve every tier of the default provider, e.g. at startup, so an
+        unknown provider fails before the first request; returns tier -> model.
+        """
+        if self.default_provider is None:
+            self._load_defaults()
+        if self.default_provider not in MODEL_TIERS:
+            raise ValueError(
+                f"Unknown model provider {self.default_provider!r}, expected one of {list(MODEL_TIERS)}"
+            )
+        tiers = {tier: self.tier_model(self.default_provider, tier) for tier in MODEL_TIERS[self.default_provider]}
+        log.info("models.tiers", provider=self.default_provider, **tiers)
+        return tiers
+
+    def get(self, spec: ModelSpec) -> BaseChatModel:
+        model = self._models.get(spec)
+        if model is not None:
+            return model
+        with self._lock:
+            model = self._models.get(spec)
+            if model is None:
+                if spec.provider == "fake":
+                    if self.fake_model is None:
+                        from utils.fakes import FakeChatModel
+
+                        self.fake_model = FakeChatModel()
+                    model = self.fake_models.get(spec.model, self.fake_model)
+                else:
+                    from models.llms import get_chat_model
+
+                    model = get_chat_model(spec.provider, spec.model, spec.temperature, spec.max_tokens)
+                self._models[spec] = model
+        return model
+
+    def run_config(
+        self, node: str, spec: ModelSpec, config: Optional[RunnableConfig] = None
+    ) -> RunnableConfig:
+        """`config` with the node and model tagged for `model_usage`."""
+        return merge_configs(
+            config,
+            {"metadata": {"routed_node": node, "routed_model": spec.label}, "callbacks": [model_usage]},
+        )
+
+
+model_usage = ModelUsage()
+model_registry = ModelRegistry()
@@ -0,0 +1,187 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
+
+from langchain.prompts import ChatPromptTemplate
+from langchain.tools import BaseTool
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import Runnable, RunnableConfig
+from pydantic import BaseModel
+from models.model_registry import ModelSpec, model_registry
+from states.states import AgentState
+from utils.telemetry import get_logger
+from tools.buffermemory import (
+    MEMORY_SUMMARY_TAG,
+    MemoryConfig,
+    aload_chat_history,
+    create_buffer_memory,
+    history_tokens,
+    load_chat_history,
+)
+
+log = get_logger("agents")
+
+
+class AgentRegistry:
+    """
+    Builds every agent's prompt, runnable and executor once per process.
+
+    Node functions register their prompt and tools at import time and call
+    `invoke` per request; the per-request ConversationBufferMemory is attached
+    to a shallow copy of the cached executor, so nothing else is rebuilt.
+    Agents without tools are a single LLM call instead of an executor:
+    prompt | llm | StrOutputParser, or prompt | llm.with_structured_output
+    when registered with an `output_schema`. Those stream their tokens to
+    the caller's callbacks (graph.astream_events, stream_mode="messages").
+    Tool-using executors stream too, as long as the caller's config reaches
+    them. A tool may be given as a factory, called when the executor is built.
+    Agents registered with a `memory` config get the bounded conversation
+    history as the `chat_history` prompt variable; executors among them get
+    no ConversationBufferMemory.
+
+    The chat model is resolved per call by models.model_registry from the
+    run's config (GraphConfig.model_name, per-node routes), so executors are
+    cached per agent and model; an `llm` given here serves every agent.
+    """
+
+    def __init__(self, llm: Optional[BaseLanguageModel] = None, verbose: bool = False):
+        self._llm = llm
+        self.verbose = verbose
+        self._specs: Dict[
+            str,
+            Tuple[
+                ChatPromptTemplate,
+                List[Union[BaseTool, Callable[[], BaseTool]]],
+                Optional[Type[BaseModel]],
+                Optional[MemoryConfig],
+            ],
+        ] = {}
+        self._executors: Dict[Tuple[str, Optional[ModelSpec]], Runnable] = {}
+        self._lock = threading.Lock()
+
+    def model_for(
+        self, name: str, config: Optional[RunnableConfig] = None
+    ) -> Tuple[Optional[ModelSpec], BaseLanguageModel]:
+        """The model spec (None for a fixed `llm`) and client serving `name` in this run."""
+        if self._llm is not None:
+            return None, self._llm
+        spec = model_registry.resolve(name, config)
+        return spec, model_registry.get(spec)
+
+    def register(
+        self,
+        name: str,
+        prompt: ChatPromptTemplate,
+        tools: List[Union[BaseTool, Callable[[], BaseTool]]] = (),
+        output_schema: Optional[Type[BaseModel]] = None,
+        memory: Optional[MemoryConfig] = None,
+    ) -> None:
+        """Register an agent spec; the executor is built on first use."""
+        with self._lock:
+            self._specs[name] = (prompt, list(tools), output_schema, memory)
+            for key in [key for key in self._executors if key[0] == name]:
+                del self._executors[key]
+
+    def is_executor(self, name: str) -> bool:
+        _, tools, output_schema, _ = self._specs[name]
+        return bool(tools) and output_schema is None
+
+    def get_executor(self, name: str, config: Optional[RunnableConfig] = None) -> Runnable:
+        """Return the shared executor for `name` on this run's model, building it once."""
+        spec, llm = self.model_for(name, config)
+        executor = self._executors.get((name, spec))
+        if executor is not None:
+            return executor
+        with self._lock:
+            executor = self._executors.get((name, spec))
+            if executor is None:
+                prompt, tools, output_schema, _ = self._specs[name]
+                if output_schema is not None:
+                    executor = prompt | llm.with_structured_output(output_schema)
+                elif not tools:
+                    executor = prompt | llm | StrOutputParser()
+                else:
+                    from langchain.agents import AgentExecutor, create_openai_functions_agent
+
+                    tools = [tool if isinstance(tool, BaseTool) else tool() for tool in tools]
+                    agent = create_openai_functions_agent(
+                        llm=llm, prompt=prompt, tools=tools
+                    )
+                    executor = AgentExecutor(
+                        agent=agent, tools=tools, verbose=self.verbose
+                    )
+                self._executors[(name, spec)] = executor
+        return executor
+
+    def warmup(self) -> None:
+        """Build every registered executor on its default model, e.g. at server startup."""
+        for name in list(self._specs):
+            self.get_executor(name)
+
+    def bind_memory(
+        self, name: str, state: AgentState, config: Optional[RunnableConfig] = None
+    ) -> Runnable:
+        """Shallow copy of the shared executor with this request's memory attached."""
+        executor = self.get_executor(name, config)
+        if not self.is_executor(name) or self._specs[name][3] is not None:
+            return executor
+        return executor.model_copy(update={"memory": create_buffer_memory(state)})
+
+    def _memory_config(self, name: str) -> Optional[MemoryConfig]:
+        return self._specs[name][3]
+
+    def _run_config(self, name: str, config: Optional[RunnableConfig]) -> Optional[RunnableConfig]:
+        spec, _ = self.model_for(name, config)
+        return config if spec is None else model_registry.run_config(name, spec, config)
+
+    def _summarizer(
+        self, config: Optional[RunnableConfig], memory: MemoryConfig
+    ) -> Tuple[BaseLanguageModel, Optional[RunnableConfig]]:
+        """The model folding old turns into the memory summary, and its run config."""
+        configurable = {**((config or {}).get("configurable") or {}), "max_tokens": memory.summary_max_tokens}
+        config = {**(config or {}), "configurable": configurable}
+        spec, llm = self.model_for(MEMORY_SUMMARY_TAG, config)
+        if spec is None:
+            return llm, config
+        return llm, model_registry.run_config(MEMORY_SUMMARY_TAG, spec, config)
+
+    def _with_history(self, name: str, inputs: Dict[str, Any], history: list) -> Dict[str, Any]:
+        if log.enabled("debug"):
+            log.debug("memory.history", agent=name, messages=len(history), tokens=history_tokens(history))
+        return {**inputs, "chat_history": history}
+
+    def invoke(
+        self,
+        name: str,
+        state: AgentState,
+        inputs: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+    ) -> Any:
+        """The agent's output: text, or the parsed `output_schema` instance."""
+        memory = self._memory_config(name)
+        if memory is not None:
+            llm, summary_config = self._summarizer(config, memory)
+            history = load_chat_history(state, memory, llm, summary_config)
+            inputs = self._with_history(name, inputs, history)
+        executor = self.bind_memory(name, state, config)
+        result = executor.invoke(inputs, self._run_config(name, config))
+        return result["output"] if self.is_executor(name) else result
+
+    async def ainvoke(
+        self,
+        name: str,
+        state: AgentState,
+        inputs: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+    ) -> Any:
+        memory = self._memory_config(name)
+        if memory is not None:
+            llm, summary_config = self._summarizer(config, memory)
+            history = await aload_chat_history(state, memory, llm, summary_config)
+            inputs = self._with_history(name, inputs, history)
+        executor = self.bind_memory(name, state, config)
+        result = await executor.ainvoke(inputs, self._run_config(name, config))
+        return result["output"] if self.is_executor(name) else result
+
+
+agent_registry = AgentRegistry()
@@ -1,105 +1,240 @@
-from langchain.agents import AgentExecutor, create_openai_functions_agent
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.exceptions import OutputParserException
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain.memory import ConversationBufferMemory
 from langchain.tools import Tool
+from langchain_core.runnables import RunnableConfig
+from typing import List, Literal, Optional, Union
+from langchain.schema import Document
+from pydantic import BaseModel, Field, ValidationError
 from states.states import AgentState
-from models.llms import model
-from tools.retrivers import semantic_retriever
-from tools.buffermemory import create_buffer_memory
+from tools.retrieval_gate import compute_features, decide, gate_config
+from nodes.agent_registry import agent_registry
+from tools.buffermemory import MemoryConfig
+from tools.context_builder import assemble_context
+from tools.hybrid_retriever import pop_relevance, scoped
+from utils.telemetry import get_logger
+import os
 
+log = get_logger("validator")
 
+# Rewritten queries the validator may ask for in one verdict; the search node
+# runs them all in a single step.
+VALIDATOR_MAX_QUERIES = int(os.getenv("VALIDATOR_MAX_QUERIES", "3"))
+
+
+# The retrievers are imported where used: tools.retrivers connects to the
+# vector store on first access, not when this module is imported.
 def semantic_search(query: str) -> str:
+    from tools.retrivers import semantic_retriever
+
     semantic_docs = semantic_retriever.invoke(query)
     return "\n".join(doc.page_content for doc in semantic_docs)
 
 
+async def asemantic_search(query: str) -> str:
+    from tools.retrivers import async_semantic_retriever
+
+    semantic_docs = await async_semantic_retriever.ainvoke(query)
+    return "\n".join(doc.page_content for doc in semantic_docs)
+
+
 semantic_retrival_tool = Tool(
     name="semantic_retrival_tool",
     description="Search for relevant documents using vector similarity",
     func=semantic_search,
+    coroutine=asemantic_search,
 )
 
 
-def retrieval_validator_agent(state: AgentState) -> AgentState:
-    validator_prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                """You are a validation agent that determines if the retrieved content is sufficient for the requested task.
-        Your response will be very important for the next agent. 
-        Retrieved content: {retrieved_docs}.
-            Task option: {option}.
-        Try to be biased towards answering "YES" and avoid responding with "NO" as much as possible. Because answering no will force search agent to run which costs money. 
-        Your goal is to provide the user with specific feedback on what is missing or needs to be improved, so they can refine the 
-        retrieval process without constantly relying on the search agent.
-        Evaluate the chat_history and content carefully and respond with either:
-        1. "YES" (is the retrives content is enough for you to come up with an answer)
-        2. "NO" , "QUERY"= An optimized search query for the missing details
-        When evaluating the content, consider:
-        - Completeness of information
-        - Depth of coverage for key concepts
-        - Contextual relevance to the user's query
-        - Sufficinet enough to not require further search
-        - Alignment with the user's context and previous messages
-        - Avoiding unnecessary search queries
-        """,
-            ),
-            ("human", "{input}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
+class ValidatorVerdict(BaseModel):
+    """Whether the retrieved content is sufficient, and what to search for if not."""
+
+    verdict: Literal["YES", "NO"] = Field(
+        description="YES if the retrieved content is enough to answer, NO otherwise"
+    )
+    missing_topics: List[str] = Field(
+        default_factory=list, description="Topics the retrieved content lacks; empty for YES"
+    )
+    queries: List[str] = Field(
+        default_factory=list,
+        description="Short web search queries covering the missing topics; empty for YES",
     )
 
-    memory = create_buffer_memory(state)
 
-    validator_agent = create_openai_functions_agent(
-        llm=model,
-        prompt=validator_prompt,
-        tools=[semantic_retrival_tool],
-    )
+validator_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            """You are a validation agent that determines if the retrieved content is sufficient for the requested task.
+    Your response will be very important for the next agent. 
+    Retrieved content: {retrieved_docs}.
+        Task option: {option}.
+    Try to be biased towards answering "YES" and avoid responding with "NO" as much as possible. Because answering no will force search agent to run which costs money. 
+    Your goal is to provide the user with specific feedback on what is missing or needs to be improved, so they can refine the 
+    retrieval process without constantly relying on the search agent.
+    Evaluate the chat_history and content carefully and give your verdict:
+    1. "YES" if the retrieved content is enough for you to come up with an answer
+    2. "NO" otherwise, listing the missing topics and up to {max_queries} optimized search queries that together cover all of them
+    When evaluating the content, consider:
+    - Completeness of information
+    - Depth of coverage for key concepts
+    - Contextual relevance to the user's query
+    - Sufficinet enough to not require further search
+    - Alignment with the user's context and previous messages
+    - Avoiding unnecessary search queries
+    """,
+        ),
+        MessagesPlaceholder(variable_name="chat_history", optional=True),
+        ("human", "{input}"),
+        MessagesPlaceholder(variable_name="agent_scratchpad"),
+    ]
+)
 
-    validator_executor = AgentExecutor(
-        agent=validator_agent,
-        memory=memory,
-        tools=[semantic_retrival_tool],
-        verbose=True,
-    )
-    if state["total_search"] == 0:
-        try:
-            semantic_docs = semantic_retriever.invoke(
-                AgentState.get_last_human_message(state)
-            )
-            AgentState.add_documents(state, semantic_docs)
-        except Exception as e:
-            print(f"Retrieval error: {e}")
-            AgentState.add_document(state, "")
+# The verdict only needs the previous exchange to resolve follow-ups
+# ("explain that again"); older turns are the task agents' concern.
+agent_registry.register(
+    "retrieval_validator",
+    validator_prompt,
+    [],
+    output_schema=ValidatorVerdict,
+    memory=MemoryConfig.from_env(mode="window", window_turns=1),
+)
 
-    print(
-        f"Retrived Docs length : {len(state['retrieved_docs'])}\n,Total_Searches :{state['total_search']}"
-    )
 
-    response = validator_executor.invoke(
-        {
-            "input": AgentState.get_last_human_message(state),
-            "retrieved_docs": AgentState.get_all_documents(state, with_info=False),
-            "option": state["option"],
-            "agent_scratchpad": AgentState.get_agent_scratchpad(state),
-        }
+def _validator_inputs(state: AgentState) -> dict:
+    log.debug("validator.inputs", docs=len(state["retrieved_docs"]), total_search=state["total_search"])
+    return {
+        "input": AgentState.get_last_human_message(state),
+        "retrieved_docs": assemble_context(state),
+        "option": state["option"],
+        "max_queries": VALIDATOR_MAX_QUERIES,
+        "agent_scratchpad": AgentState.get_agent_scratchpad(state),
+    }
+
+
+def _gate_output(state: AgentState, inputs: dict) -> Optional[ValidatorVerdict]:
+    """Verdict from the confidence gate, or None to fall through to the LLM."""
+    if not gate_config.enabled:
+        return None
+    scores = state.get("retrieval_scores")
+    if scores is None:
+        log.info("validator.gate", source="llm", reason="no_scores")
+        return None
+    decision = decide(
+        compute_features(inputs["input"], scores, inputs["retrieved_docs"]),
+        gate_config,
+        allow_no=state["total_search"] == 0,
+    )
+    f = decision.features
+    log.info(
+        "validator.gate",
+        source=decision.source,
+        verdict=decision.verdict or "ambiguous",
+        top_score=round(f.top_score, 3),
+        coverage=round(f.coverage, 2),
+        docs=f.doc_count,
     )
+    if decision.verdict == "YES":
+        return ValidatorVerdict(verdict="YES")
+    if decision.verdict == "NO":
+        return ValidatorVerdict(verdict="NO", queries=[inputs["input"]])
+    return None
+
+
+def _first_pass(state: AgentState, docs: List[Document]) -> None:
+    """
+    Add the first-pass retrieval to the state with its relevance scores, which
+    the gate reuses on every pass of the turn rather than searching again.
+    """
+    scores = pop_relevance(docs)
+    # None when the retriever reports no scores: the gate then leaves the verdict to the LLM.
+    state["retrieval_scores"] = scores if scores or not docs else None
+    AgentState.add_documents(state, docs)
 
-    output = response["output"]
 
-    AgentState.add_ai_message(state, output)
+# Replies that don't parse into a ValidatorVerdict. Anything else (provider
+# errors, DeadlineExceeded) propagates and fails the request.
+_OUTPUT_ERRORS = (OutputParserException, ValidationError)
 
-    if output.startswith("YES"):
+
+def _validator_error(e: Union[Exception, str]) -> ValidatorVerdict:
+    # A reply that doesn't parse is treated as YES rather than spending a
+    # search loop on it, in line with the prompt's bias towards answering.
+    log.warning("validator.output_invalid", error=str(e))
+    return ValidatorVerdict(verdict="YES")
+
+
+def _apply_verdict(state: AgentState, verdict: ValidatorVerdict) -> AgentState:
+    queries = [query.strip() for query in verdict.queries if query.strip()]
+    if verdict.verdict == "NO" and not queries:
+        queries = verdict.missing_topics or [AgentState.get_last_human_message(state)]
+    queries = list(dict.fromkeys(queries))[:VALIDATOR_MAX_QUERIES]
+
+    if verdict.verdict == "YES":
+        AgentState.add_control_message(state, "YES")
         AgentState.set_next_step(state, step=state["option"])
     else:
+        AgentState.add_control_message(state, "NO, QUERIES= " + "; ".join(queries))
         AgentState.set_next_step(state, step="search")
-        state["search_query"] = output.split("=")[-1]
+        state["search_query"] = queries
 
     return state
 
 
+def retrieval_validator_agent(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    if state["total_search"] == 0:
+        try:
+            from tools.retrivers import semantic_retriever
+
+            semantic_docs = scoped(semantic_retriever, AgentState.get_scope(state)).invoke(
+                AgentState.get_last_human_message(state), config
+            )
+            _first_pass(state, semantic_docs)
+        except Exception as e:
+            log.warning("validator.retrieval_failed", error=str(e))
+            state["retrieval_scores"] = None
+            AgentState.add_document(state, Document(page_content=""))
+
+    inputs = _validator_inputs(state)
+    verdict = _gate_output(state, inputs)
+    if verdict is None:
+        try:
+            verdict = agent_registry.invoke("retrieval_validator", state, inputs, config)
+        except _OUTPUT_ERRORS as e:
+            verdict = _validator_error(e)
+    return _apply_verdict(state, verdict or _validator_error("no verdict in the reply"))
+
+
+async def aretrieval_validator_agent(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    if state["total_search"] == 0:
+        try:
+            from tools.retrivers import async_semantic_retriever
+
+            semantic_docs = await scoped(
+                async_semantic_retriever, AgentState.get_scope(state)
+            ).ainvoke(AgentState.get_last_human_message(state), config)
+            _first_pass(state, semantic_docs)
+        except Exception as e:
+            log.warning("validator.retrieval_failed", error=str(e))
+            state["retrieval_scores"] = None
+            AgentState.add_document(state, Document(page_content=""))
+
+    inputs = _validator_inputs(state)
+    verdict = _gate_output(state, inputs)
+    if verdict is None:
+        try:
+            verdict = await agent_registry.ainvoke(
+                "retrieval_validator", state, inputs, config
+            )
+        except _OUTPUT_ERRORS as e:
+            verdict = _validator_error(e)
+    return _apply_verdict(state, verdict or _validator_error("no verdict in the reply"))
+
+
 # def test_agent(query: str):
 #     state = AgentState.create_initial_state(option="flashcard", max_search=5)
 
@@ -1,27 +1,123 @@
-from langchain_community.tools.tavily_search import TavilySearchResults
 from states.states import AgentState
 from langchain.schema import Document
+from typing import List, Optional
+from tools.search_cache import CachedSearchTool, normalize_query, search_cache
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from langchain_core.runnables import RunnableConfig
+from utils.telemetry import get_logger
+import asyncio
+import os
+import threading
 
-tool = TavilySearchResults(max_results=3)
+log = get_logger("search")
 
+# Upper bound on concurrent search calls: process-wide for search_node, per
+# step for asearch_node.
+SEARCH_MAX_CONCURRENCY = int(os.getenv("SEARCH_MAX_CONCURRENCY", "4"))
+_search_pool = ThreadPoolExecutor(max_workers=SEARCH_MAX_CONCURRENCY, thread_name_prefix="search")
 
-def search_node(state: AgentState) -> AgentState:
-    """
-    Performs search using Tavily and updates state with results
-    """
-    search_tool = tool
+# Built on first search (Tavily checks its API key at construction);
+# utils.fakes assigns a fake before that.
+tool: Optional[CachedSearchTool] = None
+_tool_lock = threading.Lock()
+
+
+def get_search_tool() -> CachedSearchTool:
+    global tool
+    if tool is not None:
+        return tool
+    with _tool_lock:
+        if tool is None:
+            from langchain_community.tools.tavily_search import TavilySearchResults
+            from models.llms import load_settings
+            from utils.outbound import OutboundSearchTool, get_outbound
+
+            load_settings()
+            # Cache hits never reach the outbound rate limit.
+            tool = CachedSearchTool(
+                OutboundSearchTool(TavilySearchResults(max_results=3), get_outbound("search")),
+                search_cache,
+                writeback=os.getenv("SEARCH_CACHE_WRITEBACK", "true").lower() == "true",
+            )
+    return tool
+
+
+def _search_queries(state: AgentState) -> List[str]:
+    """Pending queries, deduplicated and trimmed to the remaining search budget."""
     search_query = state["search_query"]
-    print("search_query:", search_query)
-    search_results = search_tool.invoke(search_query)
-    print("search_results type:", type(search_results))
-    AgentState.add_documents(
-        state,
-        docs=[Document(page_content=result["content"]) for result in search_results],
-    )
-    # print("---------------------------------------------------------------------")
-    # print("Total search :", state["total_search"],"\n")
-    state["total_search"] += 1
-    # print("Updated total_search:", state["total_search"])
-    # print("---------------------------------------------------------------------")
+    queries = [search_query] if isinstance(search_query, str) else list(search_query)
+    remaining = max(1, state["max_search"] - state["total_search"])
+    unique = {}
+    for query in queries:
+        if query and query.strip():
+            unique.setdefault(normalize_query(query), query.strip())
+    queries = list(unique.values())[:remaining]
+    log.debug("search.queries", queries=queries)
+    return queries
+
 
+def _merge_results(state: AgentState, queries: List[str], results: list) -> AgentState:
+    """
+    Add the results of every query, dropping failed queries and duplicate
+    hits (by URL, else content); each query issued counts as one search
+    """
+    seen = {doc.page_content for doc in state["retrieved_docs"]}
+    docs = []
+    for query, search_results in zip(queries, results):
+        if isinstance(search_results, Exception):
+            log.warning("search.failed", query=query, error=str(search_results))
+            continue
+        if not isinstance(search_results, list):
+            log.warning("search.no_results", query=query, result=str(search_results))
+            continue
+        for result in search_results:
+            if not (isinstance(result, dict) and result.get("content")):
+                continue
+            key = result.get("url") or result["content"]
+            if key in seen or result["content"] in seen:
+                continue
+            seen.update((key, result["content"]))
+            docs.append(
+                Document(page_content=result["content"], metadata={"source": result.get("url", "")})
+            )
+    log.debug("search.merged", queries=len(queries), new_documents=len(docs))
+    AgentState.add_documents(state, docs)
+    state["total_search"] += len(queries)
     return state
+
+
+def _search(query: str, config: Optional[RunnableConfig] = None):
+    try:
+        return get_search_tool().invoke(query, config)
+    except Exception as e:
+        return e
+
+
+def search_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    Performs search using Tavily for all pending queries concurrently and
+    updates state with the merged results
+    """
+    queries = _search_queries(state)
+    # The node's config is passed along so the tool calls trace under this
+    # node, and each call runs in a copy of the caller's context so it keeps
+    # the request deadline (utils.outbound).
+    contexts = [copy_context() for _ in queries]
+    results = _search_pool.map(lambda context, query: context.run(_search, query, config), contexts, queries)
+    return _merge_results(state, queries, list(results))
+
+
+async def asearch_node(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    """
+    Async variant of search_node for graph.ainvoke/astream
+    """
+    queries = _search_queries(state)
+    semaphore = asyncio.Semaphore(SEARCH_MAX_CONCURRENCY)
+
+    async def search(query: str):
+        async with semaphore:
+            return await get_search_tool().ainvoke(query, config)
+
+    results = await asyncio.gather(*(search(q) for q in queries), return_exceptions=True)
+    return _merge_results(state, queries, results)
@@ -1,146 +1,108 @@
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.agents import create_openai_functions_agent, AgentExecutor
-from langchain.schema import Document
-from models.llms import model
+from langchain_core.runnables import RunnableConfig
+from typing import Optional
 from states.states import AgentState
-from nodes.search_agent import tool
-from tools.buffermemory import create_buffer_memory
+from nodes.agent_registry import agent_registry
+from nodes.search_agent import get_search_tool
+from tools.buffermemory import MemoryConfig
+from tools.context_builder import assemble_context
 
 
-def flashcard_agent(state: AgentState) -> AgentState:
-    memory = create_buffer_memory(state)
-
-    flashcard_prompt = ChatPromptTemplate.from_messages(
+def _task_prompt(system_message: str) -> ChatPromptTemplate:
+    return ChatPromptTemplate.from_messages(
         [
-            (
-                "system",
-                "You are a flashcard creation agent. Generate flashcards based on the retrieved documents provided.",
-            ),
+            ("system", system_message),
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
             ("human", "{input}"),
             ("user", "{retrieved_docs}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ]
     )
 
-    flashcard_agent_fn = create_openai_functions_agent(
-        llm=model, prompt=flashcard_prompt, tools=[tool]
-    )
 
-    flashcard_executor = AgentExecutor(
-        agent=flashcard_agent_fn, memory=memory, verbose=True, tools=[tool]
-    )
-    response = flashcard_executor.invoke(
-        {
-            "retrieved_docs": AgentState.get_all_documents(state, with_info=False),
-            "input": AgentState.get_last_human_message(state),
-            "agent_scratchpad": AgentState.get_agent_scratchpad(state),
-        }
-    )
+flashcard_prompt = _task_prompt(
+    "You are a flashcard creation agent. Generate flashcards based on the retrieved documents provided."
+)
+summarization_prompt = _task_prompt(
+    "You are a summarization agent. Summarize the content of the retrieved documents."
+)
+studyplan_prompt = _task_prompt(
+    "You are a study plan generator. Create a study plan based on the retrieved documents."
+)
+quiz_prompt = _task_prompt(
+    "You are a quiz question generation agent. Create quiz questions based on the retrieved documents."
+)
+
+# The search tool is built with the executor; the executor's LLM calls stream
+# their tokens through graph.astream_events with the node's config.
+task_memory = MemoryConfig.from_env()
+agent_registry.register("flashcard", flashcard_prompt, [get_search_tool], memory=task_memory)
+agent_registry.register("summary", summarization_prompt, [get_search_tool], memory=task_memory)
+agent_registry.register("studyplan", studyplan_prompt, [get_search_tool], memory=task_memory)
+agent_registry.register("quiz", quiz_prompt, [get_search_tool], memory=task_memory)
+
 
-    AgentState.add_ai_message(state, response["output"])
+def _task_inputs(state: AgentState) -> dict:
+    return {
+        "retrieved_docs": assemble_context(state),
+        "input": AgentState.get_last_human_message(state),
+        "agent_scratchpad": AgentState.get_agent_scratchpad(state),
+    }
+
+
+def _finish(state: AgentState, output: str) -> AgentState:
+    AgentState.add_ai_message(state, output)
     AgentState.set_next_step(state, step="end")
     return state
 
 
-def summarizer_agent(state: AgentState) -> AgentState:
-    summarization_prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "You are a summarization agent. Summarize the content of the retrieved documents.",
-            ),
-            ("human", "{input}"),
-            ("user", "{retrieved_docs}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
-    )
+def _run_task_agent(
+    name: str, state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    output = agent_registry.invoke(name, state, _task_inputs(state), config)
+    return _finish(state, output)
 
-    memory = create_buffer_memory(state)
 
-    summarizer_agent_fn = create_openai_functions_agent(
-        llm=model, prompt=summarization_prompt, tools=[tool]
-    )
+async def _arun_task_agent(
+    name: str, state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    output = await agent_registry.ainvoke(name, state, _task_inputs(state), config)
+    return _finish(state, output)
 
-    summarizer_executor = AgentExecutor(
-        agent=summarizer_agent_fn, memory=memory, verbose=True, tools=[tool]
-    )
-    response = summarizer_executor.invoke(
-        {
-            "retrieved_docs": AgentState.get_all_documents(state, with_info=False),
-            "input": AgentState.get_last_human_message(state),
-            "agent_scratchpad": AgentState.get_agent_scratchpad(state),
-        }
-    )
-    AgentState.add_ai_message(state, response["output"])
-    AgentState.set_next_step(state, step="end")
-    return state
 
+def flashcard_agent(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    return _run_task_agent("flashcard", state, config)
 
-def studyplan_agent(state: AgentState) -> AgentState:
-    studyplan_prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "You are a study plan generator. Create a study plan based on the retrieved documents.",
-            ),
-            ("human", "{input}"),
-            ("user", "{retrieved_docs}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
-    )
 
-    memory = create_buffer_memory(state)
+def summarizer_agent(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    return _run_task_agent("summary", state, config)
 
-    studyplan_agent_fn = create_openai_functions_agent(
-        llm=model, prompt=studyplan_prompt, tools=[tool]
-    )
 
-    study_plan_executor = AgentExecutor(
-        agent=studyplan_agent_fn, memory=memory, verbose=True, tools=[tool]
-    )
-    response = study_plan_executor.invoke(
-        {
-            "retrieved_docs": AgentState.get_all_documents(state, with_info=False),
-            "input": AgentState.get_last_human_message(state),
-            "agent_scratchpad": AgentState.get_agent_scratchpad(state),
-        }
-    )
-    AgentState.add_ai_message(state, response["output"])
-    AgentState.set_next_step(state, step="end")
-    return state
+def studyplan_agent(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    return _run_task_agent("studyplan", state, config)
 
 
-def quiz_agent(state: AgentState) -> AgentState:
-    quiz_prompt = ChatPromptTemplate.from_messages(
-        [
-            (
-                "system",
-                "You are a quiz question generation agent. Create quiz questions based on the retrieved documents.",
-            ),
-            ("human", "{human_query}"),
-            ("user", "{retrieved_docs}"),
-            MessagesPlaceholder(variable_name="agent_scratchpad"),
-        ]
-    )
+def quiz_agent(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    return _run_task_agent("quiz", state, config)
 
-    memory = create_buffer_memory(state)
 
-    quiz_agent_fn = create_openai_functions_agent(
-        llm=model, prompt=quiz_prompt, tools=[tool]
-    )
+async def aflashcard_agent(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    return await _arun_task_agent("flashcard", state, config)
 
-    quiz_executor = AgentExecutor(
-        agent=quiz_agent_fn, memory=memory, verbose=True, tools=[tool]
-    )
 
-    response = quiz_executor.invoke(
-        {
-            "retrieved_docs": AgentState.get_all_documents(state, with_info=False),
-            "input": AgentState.get_last_human_message(state),
-            "agent_scratchpad": AgentState.get_agent_scratchpad(state),
-        }
-    )
-    AgentState.add_ai_message(state, response["output"])
-    # AgentState.add_to_scratchpad(state, {"summary": response["output"]})
-    AgentState.set_next_step(state, step="end")
-    return state
+async def asummarizer_agent(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    return await _arun_task_agent("summary", state, config)
+
+
+async def astudyplan_agent(
+    state: AgentState, config: Optional[RunnableConfig] = None
+) -> AgentState:
+    return await _arun_task_agent("studyplan", state, config)
+
+
+async def aquiz_agent(state: AgentState, config: Optional[RunnableConfig] = None) -> AgentState:
+    return await _arun_task_agent("quiz", state, config)
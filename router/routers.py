@@ -8,3 +8,10 @@ def route_next_step(state: AgentState):
     if state["total_search"] >= state["max_search"]:
         state["next_step"] = state["option"]
     return state["next_step"]
+
+
+async def aroute_next_step(state: AgentState):
+    """
+    Async counterpart of route_next_step so the graph can run under ainvoke
+    """
+    return route_next_step(state)
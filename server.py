@@ -0,0 +1,365 @@
+"""
+ASGI entry point for the RAG graph.
+
+    uvicorn server:app --host 0.0.0.0 --port 8000 --timeout-graceful-shutdown 30
+
+POST /query         -> JSON with the final answer
+POST /query/stream  -> Server-Sent Events: node_start / node_end / token / answer
+
+Every answer carries a `thread_id`; sending it back with the next question
+continues that session from its checkpointed state, on any worker.
+
+For tests and benchmarks, call `create_app(graph=...)` with a graph compiled
+against the fakes in utils.fakes instead of importing the module-level `app`.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Literal, Optional, Tuple
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from sse_starlette.sse import EventSourceResponse
+from starlette.background import BackgroundTask
+
+from states.states import AgentState, retrieval_scope
+from tools.buffermemory import MEMORY_SUMMARY_TAG
+from tools.semantic_cache import SemanticCache, get_corpus_version, scoped_option, semantic_cache
+from tools.search_cache import search_cache
+from utils.outbound import DeadlineExceeded, deadline, outbound_metrics
+from utils.telemetry import get_logger, otlp_json, register_collector, render_prometheus, tracer
+
+log = get_logger("server")
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("SERVER_MAX_CONCURRENT_REQUESTS", "16"))
+QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", "2.0"))
+SHUTDOWN_TIMEOUT = float(os.getenv("SERVER_SHUTDOWN_TIMEOUT", "30.0"))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+# Seconds a graph run may spend on model, embedding and search calls; 0 for no limit.
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE_SECONDS", "120"))
+
+TASK_NODES = {"flashcard", "summary", "quiz", "studyplan"}
+
+
+class QueryRequest(BaseModel):
+    query: str = Field(min_length=1)
+    option: Literal["flashcard", "summary", "quiz", "studyplan"] = "summary"
+    max_search: int = Field(default=3, ge=0, le=10)
+    thread_id: Optional[str] = Field(default=None, min_length=1, max_length=128)
+    # GraphConfig.model_name; the server's MODEL_PROVIDER when omitted.
+    model_name: Optional[Literal["anthropic", "openai", "mistral"]] = None
+    # Restrict retrieval to a course, or one of its chapters (ingestion metadata).
+    course: Optional[str] = Field(default=None, min_length=1, max_length=256)
+    chapter: Optional[str] = Field(default=None, min_length=1, max_length=256)
+
+    @property
+    def scope(self) -> Dict[str, str]:
+        return retrieval_scope(self.course, self.chapter)
+
+    @property
+    def cache_option(self) -> str:
+        """Semantic cache partition: the option, per scope."""
+        return scoped_option(self.option, self.scope)
+
+
+class RequestLimiter:
+    """
+    Bounded admission control: at most `max_concurrent` graph runs, callers
+    wait up to `queue_timeout` seconds for a slot and are rejected otherwise.
+    """
+
+    def __init__(self, max_concurrent: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.draining = False
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._idle = asyncio.Event()
+        self._idle.set()
+
+    async def acquire(self) -> bool:
+        if self.draining:
+            return False
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            return False
+        self.in_flight += 1
+        self._idle.clear()
+        return True
+
+    def releaser(self) -> Callable[[], None]:
+        """Release of one acquired slot that only takes effect on its first call."""
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            if not released:
+                released = True
+                self.release()
+
+        return release
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+        if self.in_flight == 0:
+            self._idle.set()
+
+    async def drain(self, timeout: float) -> None:
+        """Stop admitting requests and wait for in-flight ones to finish."""
+        self.draining = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            log.warning("server.shutdown_timeout", in_flight=self.in_flight)
+
+
+def _session(graph, request: QueryRequest) -> Tuple[Optional[str], dict]:
+    """
+    Thread id and run config: the request's thread, or a new one, and its
+    model. The run id is the id of the request's trace (GET /traces/{id}).
+    """
+    configurable = {"model_name": request.model_name} if request.model_name else {}
+    thread_id = None
+    if graph.checkpointer is not None:
+        thread_id = request.thread_id or uuid.uuid4().hex
+        configurable["thread_id"] = thread_id
+    return thread_id, {"configurable": configurable, "run_id": uuid.uuid4()}
+
+
+async def _initial_state(graph, request: QueryRequest, config: Optional[dict]) -> AgentState:
+    previous = None
+    if request.thread_id and graph.checkpointer is not None:
+        previous = (await graph.aget_state(config)).values
+    return AgentState.start_turn(
+        previous, request.query, request.option, request.max_search, request.scope
+    )
+
+
+def _use_cache(cache: Optional[SemanticCache], request: QueryRequest) -> bool:
+    # Follow-ups depend on the session history, so only first questions are
+    # cached; cached answers come from the default model.
+    return cache is not None and request.thread_id is None and request.model_name is None
+
+
+def _answer(state: AgentState, thread_id: Optional[str], config: dict) -> Dict[str, Any]:
+    return {
+        "answer": AgentState.get_last_ai_message(state),
+        "cached": False,
+        "thread_id": thread_id,
+        "trace_id": config["run_id"].hex,
+        "next_step": state["next_step"],
+        "total_search": state["total_search"],
+        "tokens_saved": state.get("tokens_saved", 0),
+    }
+
+
+async def _remember(
+    cache: Optional[SemanticCache],
+    request: QueryRequest,
+    state: AgentState,
+    start: float,
+    corpus_version: int,
+) -> None:
+    if _use_cache(cache, request) and state["next_step"] == "end":
+        await cache.astore(
+            request.query,
+            request.cache_option,
+            AgentState.get_last_ai_message(state),
+            time.perf_counter() - start,
+            corpus_version,
+        )
+
+
+async def _graph_frames(
+    graph, request: QueryRequest, cache: Optional[SemanticCache]
+) -> AsyncIterator[Dict[str, str]]:
+    """Translate LangGraph events into SSE frames as soon as they happen."""
+    if _use_cache(cache, request):
+        cached = await cache.alookup(request.query, request.cache_option)
+        if cached is not None:
+            yield {"event": "answer", "data": json.dumps({"answer": cached, "cached": True})}
+            return
+
+    start = time.perf_counter()
+    corpus_version = get_corpus_version()
+    thread_id, config = _session(graph, request)
+    state = await _initial_state(graph, request, config)
+    final_state: Optional[AgentState] = None
+    with deadline(REQUEST_DEADLINE):
+        async for event in graph.astream_events(state, config, version="v2"):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+            if node and node.startswith("__"):
+                continue
+            if (
+                kind == "on_chat_model_stream"
+                and node in TASK_NODES
+                and MEMORY_SUMMARY_TAG not in event.get("tags", ())
+            ):
+                content = event["data"]["chunk"].content
+                if content:
+                    yield {"event": "token", "data": json.dumps({"node": node, "content": content})}
+            elif kind == "on_chain_start" and node and event["name"] == node:
+                yield {"event": "node_start", "data": json.dumps({"node": node})}
+            elif kind == "on_chain_end" and node and event["name"] == node:
+                yield {"event": "node_end", "data": json.dumps({"node": node})}
+            elif kind == "on_chain_end" and not event.get("parent_ids"):
+                final_state = event["data"]["output"]
+    if final_state is not None:
+        yield {"event": "answer", "data": json.dumps(_answer(final_state, thread_id, config))}
+        await _remember(cache, request, final_state, start, corpus_version)
+
+
+async def _stream_events(
+    graph, request: QueryRequest, cache: Optional[SemanticCache], release: Optional[Callable[[], None]] = None
+) -> AsyncIterator[Dict[str, str]]:
+    """
+    The SSE frames of one request. A failure ends the stream with an `error`
+    frame, and the admission slot is released however the stream ends.
+    """
+    try:
+        async for frame in _graph_frames(graph, request, cache):
+            yield frame
+    except DeadlineExceeded as e:
+        log.warning("server.deadline_exceeded", thread_id=request.thread_id, error=str(e))
+        yield {"event": "error", "data": json.dumps({"status": 504, "detail": str(e)})}
+    except Exception as e:
+        log.error("server.stream_failed", thread_id=request.thread_id, error=f"{type(e).__name__}: {e}")
+        yield {"event": "error", "data": json.dumps({"status": 500, "detail": "Internal Server Error"})}
+    finally:
+        if release is not None:
+            release()
+
+
+def create_app(
+    graph=None,
+    max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+    queue_timeout: float = QUEUE_TIMEOUT,
+    shutdown_timeout: float = SHUTDOWN_TIMEOUT,
+    cache: Optional[SemanticCache] = semantic_cache if SEMANTIC_CACHE_ENABLED else None,
+) -> FastAPI:
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        if app.state.graph is None:
+            import graph as graph_module
+
+            # Clients, stores and graphs are built here, off the event loop,
+            # not when the module is imported.
+            await asyncio.to_thread(graph_module.startup)
+            app.state.graph = graph_module.get_session_graph()
+        app.state.limiter = RequestLimiter(max_concurrent, queue_timeout)
+        yield
+        await app.state.limiter.drain(shutdown_timeout)
+        from nodes import search_agent
+
+        if search_agent.tool is not None:
+            # Search results still being written back to the vector store.
+            await asyncio.wait_for(search_agent.tool.drain(), shutdown_timeout)
+
+    app = FastAPI(title="MultiAgent RAG Server", lifespan=lifespan)
+    app.state.graph = graph
+
+    async def admit() -> RequestLimiter:
+        limiter: RequestLimiter = app.state.limiter
+        if not await limiter.acquire():
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, retry later",
+                headers={"Retry-After": str(max(1, int(queue_timeout)))},
+            )
+        return limiter
+
+    @app.get("/healthz")
+    async def healthz():
+        limiter: RequestLimiter = app.state.limiter
+        if limiter.draining:
+            raise HTTPException(status_code=503, detail="draining")
+        return {"in_flight": limiter.in_flight, "max_concurrent": limiter.max_concurrent}
+
+    @app.get("/metrics")
+    async def metrics():
+        from models.model_registry import model_usage
+        from tools.db_pool import pool_metrics
+
+        return {
+            "semantic_cache": cache.metrics() if cache is not None else None,
+            "search_cache": search_cache.metrics(),
+            "db_pools": pool_metrics(),
+            "models": model_usage.snapshot(),
+            "outbound": outbound_metrics(),
+        }
+
+    def cache_lookups():
+        samples = []
+        for name, lookups in (("semantic", cache), ("search", search_cache)):
+            if lookups is not None:
+                samples.append(({"cache": name, "result": "hit"}, lookups.hits))
+                samples.append(({"cache": name, "result": "miss"}, lookups.misses))
+        return "counter", "Cache lookups by result.", samples
+
+    register_collector("rag_cache_lookups_total", cache_lookups)
+
+    @app.get("/metrics/prometheus", response_class=PlainTextResponse)
+    async def prometheus_metrics():
+        """Node, LLM, retriever and tool histograms in the Prometheus text format."""
+        return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/traces")
+    async def traces(limit: int = 20):
+        """Span trees of the most recent graph runs, newest first."""
+        return {"traces": [root.to_tree() for root in tracer.recent_traces(limit)]}
+
+    @app.get("/traces/{trace_id}")
+    async def trace(trace_id: str):
+        """One trace as OTLP/JSON, e.g. to load into a trace viewer."""
+        root = tracer.get_trace(trace_id)
+        if root is None:
+            raise HTTPException(status_code=404, detail="Unknown or expired trace")
+        return otlp_json([root])
+
+    @app.post("/query")
+    async def query(request: QueryRequest):
+        if _use_cache(cache, request):
+            cached = await cache.alookup(request.query, request.cache_option)
+            if cached is not None:
+                return {"answer": cached, "cached": True}
+        limiter = await admit()
+        start = time.perf_counter()
+        corpus_version = get_corpus_version()
+        graph = app.state.graph
+        try:
+            thread_id, config = _session(graph, request)
+            with deadline(REQUEST_DEADLINE):
+                state = await graph.ainvoke(await _initial_state(graph, request, config), config)
+        except DeadlineExceeded as e:
+            log.warning("server.deadline_exceeded", thread_id=thread_id, error=str(e))
+            raise HTTPException(status_code=504, detail=str(e))
+        finally:
+            limiter.release()
+        await _remember(cache, request, state, start, corpus_version)
+        return _answer(state, thread_id, config)
+
+    @app.post("/query/stream")
+    async def query_stream(request: QueryRequest):
+        limiter = await admit()
+        # The generator releases the slot when it ends, fails or is cancelled
+        # by a disconnect; the background task covers a stream that never
+        # started. Either way the slot is released once.
+        release = limiter.releaser()
+        return EventSourceResponse(
+            _stream_events(app.state.graph, request, cache, release),
+            background=BackgroundTask(release),
+            ping=15,
+        )
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import msgpack
+from langchain_core.chat_history import InMemoryChatMessageHistory as ChatMessageHistory
+from langchain.schema import Document
+from langchain_core.messages import BaseMessage, messages_from_dict
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.serde.jsonplus import (
+    JsonPlusSerializer,
+    _msgpack_default,
+    _msgpack_ext_hook,
+)
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from states.doc_store import DocRecord, doc_store, document_id
+from states.states import MessageHistory
+from utils.telemetry import get_logger
+
+log = get_logger("checkpoint")
+
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB", ".checkpoints.sqlite")
+
+# msgpack ext codes; 0-5 are taken by JsonPlusSerializer.
+EXT_DOCUMENT = 64
+EXT_MESSAGE = 65
+EXT_HISTORY = 66
+EXT_DATETIME = 67
+
+
+class DocumentStore:
+    """
+    Content-addressed SQLite table of the documents referenced by
+    checkpoints. Each document is written once, however many checkpoints,
+    steps or threads hold it; recently used ones stay decoded in memory, as
+    the process-wide records of doc_store.
+    """
+
+    def __init__(self, path: str = CHECKPOINT_DB, max_cached: int = 10_000):
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, DocRecord]" = OrderedDict()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS checkpoint_documents (
+                id TEXT PRIMARY KEY,
+                content TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )"""
+        )
+
+    def _remember(self, doc_id: str, doc: DocRecord) -> None:
+        self._cache[doc_id] = doc
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.max_cached:
+            self._cache.popitem(last=False)
+
+    def put_many(self, docs: Dict[str, DocRecord]) -> None:
+        with self._lock:
+            new = {doc_id: doc for doc_id, doc in docs.items() if doc_id not in self._cache}
+            if new:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO checkpoint_documents VALUES (?, ?, ?)",
+                    [
+                        (doc_id, doc.page_content, json.dumps(doc.metadata, default=str))
+                        for doc_id, doc in new.items()
+                    ],
+                )
+            for doc_id, doc in docs.items():
+                self._remember(doc_id, doc_store.intern(doc))
+
+    def get(self, doc_id: str) -> DocRecord:
+        with self._lock:
+            doc = self._cache.get(doc_id)
+            if doc is None:
+                row = self._conn.execute(
+                    "SELECT content, metadata FROM checkpoint_documents WHERE id = ?", (doc_id,)
+                ).fetchone()
+                if row is None:
+                    log.warning("checkpoint.document_missing", doc_id=doc_id)
+                    return doc_store.intern(DocRecord(""))
+                doc = doc_store.intern(DocRecord(row[0], json.loads(row[1])))
+            self._remember(doc_id, doc)
+            return doc
+
+    def count(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM checkpoint_documents").fetchone()[0]
+
+
+class AgentStateSerializer(JsonPlusSerializer):
+    """
+    msgpack checkpoint serializer for AgentState: documents are written to a
+    DocumentStore and checkpointed as their id, messages as (type, content,
+    non-default fields), datetimes as timestamps. Everything else falls
+    back to JsonPlusSerializer's encoding.
+    """
+
+    def __init__(self, documents: DocumentStore):
+        super().__init__()
+        self.documents = documents
+
+    def _pack(self, obj: Any, pending: Dict[str, DocRecord]) -> bytes:
+        def pack(value: Any) -> bytes:
+            return msgpack.packb(value, default=default)
+
+        def default(obj: Any):
+            if isinstance(obj, (DocRecord, Document)):
+                doc_id = obj.doc_id if isinstance(obj, DocRecord) else document_id(obj)
+                pending[doc_id] = obj
+                return msgpack.ExtType(EXT_DOCUMENT, doc_id.encode())
+            if isinstance(obj, BaseMessage):
+                extra = obj.model_dump(exclude_defaults=True, exclude={"type", "content"})
+                return msgpack.ExtType(
+                    EXT_MESSAGE, pack([obj.type, obj.content, extra or None])
+                )
+            if isinstance(obj, ChatMessageHistory):
+                return msgpack.ExtType(EXT_HISTORY, pack(list(obj.messages)))
+            if isinstance(obj, datetime) and obj.tzinfo is None:
+                return msgpack.ExtType(EXT_DATETIME, pack(obj.timestamp()))
+            return _msgpack_default(obj)
+
+        return pack(obj)
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == EXT_DOCUMENT:
+            return self.documents.get(data.decode())
+        if code == EXT_MESSAGE:
+            type_, content, extra = self._unpack(data)
+            return messages_from_dict([{"type": type_, "data": {"content": content, **(extra or {})}}])[0]
+        if code == EXT_HISTORY:
+            return MessageHistory(messages=self._unpack(data))
+        if code == EXT_DATETIME:
+            return datetime.fromtimestamp(self._unpack(data))
+        return _msgpack_ext_hook(code, data)
+
+    def _unpack(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, strict_map_key=False)
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        if isinstance(obj, (bytes, bytearray)):
+            return super().dumps_typed(obj)
+        pending: Dict[str, DocRecord] = {}
+        data = self._pack(obj, pending)
+        # Documents are committed before the checkpoint that refers to them.
+        if pending:
+            self.documents.put_many(pending)
+        return "agentstate", data
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        type_, data_ = data
+        if type_ == "agentstate":
+            return self._unpack(data_)
+        return super().loads_typed(data)
+
+
+class SqliteCheckpointer(SqliteSaver):
+    """
+    SqliteSaver whose async methods run the sync ones in a worker thread, so
+    the same checkpointer serves graph.invoke and graph.ainvoke/astream.
+    """
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        checkpoints: List[CheckpointTuple] = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+
+def create_checkpointer(path: str = CHECKPOINT_DB) -> SqliteCheckpointer:
+    """
+    Checkpointer over one SQLite file (WAL mode), safe to share between the
+    worker processes of a host: any of them can resume a thread. With
+    synchronous=NORMAL a power loss can drop the last steps' checkpoints but
+    never corrupts the file; commits skip the per-transaction fsync.
+    """
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    checkpointer = SqliteCheckpointer(conn, serde=AgentStateSerializer(DocumentStore(path)))
+    checkpointer.setup()
+    return checkpointer
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import sys
+import threading
+import weakref
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from langchain.schema import Document
+
+
+def document_id(doc: Any) -> str:
+    """Content address of a document: equal text and metadata share one row."""
+    key = json.dumps([doc.page_content, doc.metadata], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+class DocRecord:
+    """
+    Slotted, read-only stand-in for a retrieved Document: page_content and
+    metadata, plus a content address computed on first use.
+    """
+
+    __slots__ = ("page_content", "metadata", "_doc_id", "__weakref__")
+
+    def __init__(self, page_content: str, metadata: Optional[Dict[str, Any]] = None):
+        self.page_content = page_content
+        self.metadata = metadata or {}
+        self._doc_id: Optional[str] = None
+
+    @property
+    def doc_id(self) -> str:
+        if self._doc_id is None:
+            self._doc_id = document_id(self)
+        return self._doc_id
+
+    def model_dump(self) -> Dict[str, Any]:
+        # Same shape as Document.model_dump, so LangGraph's stock serializers
+        # (MemorySaver, JsonPlusSerializer) can checkpoint records too.
+        return {"page_content": self.page_content, "metadata": self.metadata}
+
+    def to_document(self) -> Document:
+        return Document(page_content=self.page_content, metadata=dict(self.metadata))
+
+    def __repr__(self) -> str:
+        content = self.page_content if len(self.page_content) <= 40 else self.page_content[:37] + "..."
+        return f"DocRecord({content!r}, metadata={self.metadata!r})"
+
+
+def _intern_value(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class DocStore:
+    """
+    Per-process intern table of DocRecords. Every state that retrieves the
+    same chunk or search result holds the same record, and metadata strings
+    (course, chapter, source) are shared between records. Records are weakly
+    held: one is dropped once no state refers to it.
+    """
+
+    def __init__(self):
+        # key -> weakref to the record; a plain dict of refs keeps the hit
+        # path in C, unlike weakref.WeakValueDictionary.get.
+        self._records: Dict[Hashable, weakref.KeyedRef] = {}
+        self._lock = threading.Lock()
+
+    def _forget(self, ref: weakref.KeyedRef) -> None:
+        if self._records.get(ref.key) is ref:
+            del self._records[ref.key]
+
+    def intern(self, doc: Any) -> DocRecord:
+        """The shared record for a Document (or a record from another store)."""
+        # Metadata items unsorted: the same producer always builds them in the
+        # same order, and a reordered copy only costs a second record.
+        key = doc.page_content, tuple(doc.metadata.items())
+        try:
+            ref = self._records.get(key)
+        except TypeError:
+            # Unhashable metadata values.
+            key = doc.page_content, json.dumps(doc.metadata, sort_keys=True, default=str)
+            ref = self._records.get(key)
+        record = ref() if ref is not None else None
+        if record is not None:
+            return record
+        with self._lock:
+            ref = self._records.get(key)
+            record = ref() if ref is not None else None
+            if record is None:
+                record = doc if isinstance(doc, DocRecord) else DocRecord(
+                    doc.page_content,
+                    {_intern_value(k): _intern_value(v) for k, v in doc.metadata.items()},
+                )
+                self._records[key] = weakref.KeyedRef(record, self._forget, key)
+            return record
+
+    def intern_many(self, docs: Iterable[Any]) -> List[DocRecord]:
+        return [self.intern(doc) for doc in docs]
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+
+doc_store = DocStore()
@@ -1,48 +1,158 @@
+import time
 from typing import TypedDict, Annotated, List, Optional, Dict, Any
 from typing_extensions import NotRequired
 from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
-from langchain.memory import ChatMessageHistory
+from langchain_core.chat_history import InMemoryChatMessageHistory as ChatMessageHistory
 from langchain.schema import Document
 from pydantic.types import PositiveInt
 from datetime import datetime
+from states.doc_store import DocRecord, doc_store
+
+
+class MessageHistory(ChatMessageHistory):
+    """
+    ChatMessageHistory that keeps the positions of its last human and AI
+    messages, so looking them up does not rescan the history. Messages
+    appended to `messages` directly are picked up on the next lookup.
+    """
+
+    # A plain slot rather than a pydantic PrivateAttr: private attributes go
+    # through BaseModel.__getattr__, which costs more than the scan it saves.
+    # Holds [id(messages), messages indexed, last human, last AI].
+    __slots__ = ("_index",)
+
+    def _sync(self) -> List[int]:
+        messages = self.messages
+        index = getattr(self, "_index", None)
+        if index is not None and index[1] == len(messages) and index[0] == id(messages):
+            return index
+        if index is None or index[0] != id(messages) or index[1] > len(messages):
+            index = [id(messages), 0, -1, -1]
+            object.__setattr__(self, "_index", index)
+        for position in range(index[1], len(messages)):
+            if isinstance(messages[position], HumanMessage):
+                index[2] = position
+            elif isinstance(messages[position], AIMessage):
+                index[3] = position
+        index[1] = len(messages)
+        return index
+
+    def last_human(self) -> Optional[HumanMessage]:
+        position = self._sync()[2]
+        return self.messages[position] if position >= 0 else None
+
+    def last_ai(self) -> Optional[AIMessage]:
+        position = self._sync()[3]
+        return self.messages[position] if position >= 0 else None
+
+
+def _last_index(history: ChatMessageHistory, message_type: type) -> int:
+    if isinstance(history, MessageHistory):
+        return history._sync()[2 if message_type is HumanMessage else 3]
+    messages = history.messages
+    for position in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[position], message_type):
+            return position
+    return -1
+
+
+def _last_of(history: ChatMessageHistory, message_type: type) -> Optional[BaseMessage]:
+    position = _last_index(history, message_type)
+    return history.messages[position] if position >= 0 else None
+
+
+# `name` of the AI messages that record routing decisions (the validator's
+# YES / NO, QUERIES=) rather than answers.
+CONTROL_MESSAGE_NAME = "control"
+LEGACY_NO_PREFIX = "NO, QUERIES="
+
+
+def retrieval_scope(course: Optional[str] = None, chapter: Optional[str] = None) -> Dict[str, str]:
+    """Metadata filter restricting retrieval to a course, or one of its chapters."""
+    scope = {}
+    if course:
+        scope["course"] = course
+    if chapter:
+        scope["chapter"] = chapter
+    return scope
 
 
 class AgentState(TypedDict):
     message_history: Annotated[ChatMessageHistory, "Complete conversation history"]
-    retrieved_docs: Annotated[list[Document], "Retrieved documents"]
+    retrieved_docs: Annotated[list[DocRecord], "Retrieved documents, interned in doc_store"]
     next_step: Annotated[str, "Next step in the pipeline"]
     search_query: Annotated[list[str], "Topics that need additional search"]
     option: Annotated[str, "Task option (flashcard/summary/quiz/study_plan)"]
     agent_scratchpad: List[Dict[str, Any]]
     max_search: NotRequired[Annotated[int, "Maximum search allowed"]]
+    scope: NotRequired[Annotated[Dict[str, str], "course/chapter metadata filter for retrieval; empty for all"]]
     total_search: NotRequired[Annotated[int, "Number of searches performed"]]
-    created_at: NotRequired[Annotated[datetime, "State creation timestamp"]]
-    last_updated: NotRequired[Annotated[datetime, "Last state update timestamp"]]
+    retrieval_scores: NotRequired[Annotated[Optional[List[float]], "Relevance scores of the turn's first-pass retrieval, for the validator's gate"]]
+    tokens_saved: NotRequired[Annotated[int, "Prompt tokens removed by the turn's latest context assembly"]]
+    memory_summary: NotRequired[Annotated[str, "Rolling summary of turns older than the memory window"]]
+    summarized_turns: NotRequired[Annotated[int, "Number of past turns folded into memory_summary"]]
+    created_ts: NotRequired[Annotated[float, "State creation time (epoch seconds)"]]
+    updated_ts: NotRequired[Annotated[float, "Last state update time (epoch seconds)"]]
 
     @classmethod
     def create_initial_state(
-        cls, option: str = "", max_search: int = 3
+        cls, option: str = "", max_search: int = 3, scope: Optional[Dict[str, str]] = None
     ) -> "AgentState":
         """Create a new AgentState with initial values."""
+        now = time.time()
         return cls(
-            message_history=ChatMessageHistory(),
+            message_history=MessageHistory(),
             retrieved_docs=[],
             next_step="start",
             search_query=[],
             option=option,
             agent_scratchpad=[],
             max_search=max_search,
+            scope=dict(scope or {}),
             total_search=0,
-            created_at=datetime.now(),
-            last_updated=datetime.now(),
+            tokens_saved=0,
+            memory_summary="",
+            summarized_turns=0,
+            created_ts=now,
+            updated_ts=now,
         )
 
+    @classmethod
+    def start_turn(
+        cls,
+        previous: Optional["AgentState"],
+        query: str,
+        option: str = "",
+        max_search: int = 3,
+        scope: Optional[Dict[str, str]] = None,
+    ) -> "AgentState":
+        """
+        State for a new question: a fresh one, or `previous` (a resumed
+        session) keeping its messages and documents with the per-turn
+        routing and search budget reset. `scope` (retrieval_scope) applies to
+        this turn only.
+        """
+        if not previous:
+            state = cls.create_initial_state(option=option, max_search=max_search, scope=scope)
+        else:
+            state = previous
+            state["next_step"] = "start"
+            state["search_query"] = []
+            state["option"] = option
+            state["max_search"] = max_search
+            state["scope"] = dict(scope or {})
+            state["total_search"] = 0
+            state["tokens_saved"] = 0
+            state["agent_scratchpad"] = []
+        AgentState.add_human_message(state, query)
+        return state
+
     # Message Management Methods
     @staticmethod
     def add_message(state: "AgentState", message: BaseMessage) -> None:
         """Add a message to the conversation history."""
         state["message_history"].add_message(message)
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def add_human_message(state: "AgentState", content: str) -> None:
@@ -54,6 +164,41 @@ class AgentState(TypedDict):
         """Add an AI message."""
         AgentState.add_message(state, AIMessage(content=content))
 
+    @staticmethod
+    def add_control_message(state: "AgentState", content: str) -> None:
+        """Add an AI message recording a routing decision, hidden from agents' chat history."""
+        AgentState.add_message(state, AIMessage(content=content, name=CONTROL_MESSAGE_NAME))
+
+    @staticmethod
+    def is_control_message(message: BaseMessage, previous: Optional[BaseMessage] = None) -> bool:
+        """
+        Whether `message` is a routing decision rather than part of the
+        conversation. `previous` is the message before it in the history.
+        """
+        if not isinstance(message, AIMessage):
+            return False
+        if message.name is not None or not isinstance(message.content, str):
+            return message.name == CONTROL_MESSAGE_NAME
+        # Verdicts checkpointed before they were named are matched by content.
+        # An unnamed "YES" counts only where the validator writes one, right
+        # after the question or a "NO, QUERIES=" verdict.
+        if message.content.startswith(LEGACY_NO_PREFIX):
+            return True
+        return message.content == "YES" and (
+            isinstance(previous, HumanMessage)
+            or (
+                isinstance(previous, AIMessage)
+                and isinstance(previous.content, str)
+                and previous.content.startswith(LEGACY_NO_PREFIX)
+            )
+        )
+
+    @staticmethod
+    def get_previous_messages(state: "AgentState") -> List[BaseMessage]:
+        """Messages before the current turn, i.e. before the last human message."""
+        position = _last_index(state["message_history"], HumanMessage)
+        return AgentState.get_all_messages(state)[: max(position, 0)]
+
     @staticmethod
     def get_all_messages(state: "AgentState") -> List[BaseMessage]:
         """Get all messages in chronological order."""
@@ -73,18 +218,14 @@ class AgentState(TypedDict):
     @staticmethod
     def get_last_human_message(state: "AgentState") -> Optional[str]:
         """Get content of the most recent human message."""
-        for message in reversed(AgentState.get_all_messages(state)):
-            if isinstance(message, HumanMessage):
-                return message.content
-        return None
+        message = _last_of(state["message_history"], HumanMessage)
+        return message.content if message is not None else None
 
     @staticmethod
     def get_last_ai_message(state: "AgentState") -> Optional[str]:
         """Get content of the most recent AI message."""
-        for message in reversed(AgentState.get_all_messages(state)):
-            if isinstance(message, AIMessage):
-                return message.content
-        return None
+        message = _last_of(state["message_history"], AIMessage)
+        return message.content if message is not None else None
 
     @staticmethod
     def get_all_human_messages(state: "AgentState") -> List[str]:
@@ -108,23 +249,25 @@ class AgentState(TypedDict):
     def clear_messages(state: "AgentState") -> None:
         """Clear all messages from history."""
         state["message_history"].clear()
-        state["last_updated"] = datetime.now()
+        state["memory_summary"] = ""
+        state["summarized_turns"] = 0
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def add_document(state: "AgentState", doc: Document) -> None:
-        """Add a retrieved document."""
-        state["retrieved_docs"].append(doc)
-        state["last_updated"] = datetime.now()
+        """Add a retrieved document (as its shared DocRecord)."""
+        state["retrieved_docs"].append(doc_store.intern(doc))
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def add_documents(state: "AgentState", docs: List[Document]) -> None:
-        """Add multiple retrieved documents."""
-        state["retrieved_docs"].extend(docs)
-        state["last_updated"] = datetime.now()
+        """Add multiple retrieved documents (as their shared DocRecords)."""
+        state["retrieved_docs"].extend(doc_store.intern_many(docs))
+        state["updated_ts"] = time.time()
 
     @staticmethod
-    def get_all_documents(state: "AgentState", with_info: bool) -> List[Document]:
-        """Get all retrieved documents."""
+    def get_all_documents(state: "AgentState", with_info: bool) -> List[DocRecord]:
+        """Get all retrieved documents (records with page_content and metadata, like Document)."""
         if with_info:
             return state["retrieved_docs"]
         return [doc.page_content for doc in state["retrieved_docs"]]
@@ -133,31 +276,36 @@ class AgentState(TypedDict):
     def clear_documents(state: "AgentState") -> None:
         """Clear all retrieved documents."""
         state["retrieved_docs"].clear()
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def set_next_step(state: "AgentState", step: str) -> None:
         """Update the next step in the pipeline."""
         state["next_step"] = step
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def update_option(state: "AgentState", option: str) -> None:
         """Update the task option."""
         state["option"] = option
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
+
+    @staticmethod
+    def get_scope(state: "AgentState") -> Optional[Dict[str, str]]:
+        """The turn's retrieval filter, or None to search every course."""
+        return state.get("scope") or None
 
     @staticmethod
     def add_to_scratchpad(state: "AgentState", data: Dict[str, Any]) -> None:
         """Add data to agent scratchpad."""
         state["agent_scratchpad"].append(data)
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def clear_scratchpad(state: "AgentState") -> None:
         """Clear the agent scratchpad."""
         state["agent_scratchpad"].clear()
-        state["last_updated"] = datetime.now()
+        state["updated_ts"] = time.time()
 
     @staticmethod
     def to_dict(state: "AgentState") -> Dict[str, Any]:
@@ -168,13 +316,27 @@ class AgentState(TypedDict):
             "agent_scratchpad": state["agent_scratchpad"],
             "total_search": state["total_search"],
             "max_search": state["max_search"],
+            "scope": state.get("scope", {}),
+            "tokens_saved": state.get("tokens_saved", 0),
             "retrieved_docs": state["retrieved_docs"],
             "next_step": state["next_step"],
             "search_query": state["search_query"],
-            "created_at": state["created_at"],
-            "last_updated": state["last_updated"],
+            "created_at": AgentState.get_created_at(state),
+            "last_updated": AgentState.get_last_updated(state),
         }
 
+    @staticmethod
+    def get_created_at(state: "AgentState") -> Optional[datetime]:
+        """State creation time; stored as epoch seconds, converted on demand."""
+        created = state.get("created_ts", state.get("created_at"))
+        return datetime.fromtimestamp(created) if isinstance(created, float) else created
+
+    @staticmethod
+    def get_last_updated(state: "AgentState") -> Optional[datetime]:
+        """Last update time; stored as epoch seconds, converted on demand."""
+        updated = state.get("updated_ts", state.get("last_updated"))
+        return datetime.fromtimestamp(updated) if isinstance(updated, float) else updated
+
     @staticmethod
     def get_conversation_length(state: "AgentState") -> int:
         """Get total number of messages."""
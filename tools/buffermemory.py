@@ -1,11 +1,201 @@
-from langchain.memory import ConversationBufferMemory
+import os
+from dataclasses import dataclass, replace
+from typing import List, Optional, Tuple
+
+from langchain.prompts import ChatPromptTemplate
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
+from models.model_registry import FinishReasons
 from states.states import AgentState
+from tools.context_builder import count_tokens
+from utils.telemetry import get_logger
+
+log = get_logger("memory")
+
+MEMORY_MODES = ("none", "buffer", "window", "summary")
+# Tag of the summarizer's LLM runs, so streamers can tell them from answers.
+MEMORY_SUMMARY_TAG = "memory_summary"
 
 
 def create_buffer_memory(state: AgentState):
+    # Imported here: langchain.memory pulls in langchain_community.
+    from langchain.memory import ConversationBufferMemory
+
     return ConversationBufferMemory(
         chat_memory=state["message_history"],
         return_messages=True,
         input_key="input",  # Add this line
         memory_key="agent_scratchpad",  # Add this line
     )
+
+
+@dataclass(frozen=True)
+class MemoryConfig:
+    """
+    What an agent sees of the earlier conversation as `chat_history`:
+    "none"; "buffer", every past turn; "window", the last `window_turns`
+    turns; "summary", the window plus a rolling summary of older turns.
+    Control messages (validator verdicts) are left out unless
+    `include_control`. The summarizer's completion limit follows
+    `summary_max_words`, not the agents' MODEL_MAX_TOKENS.
+    """
+
+    mode: str = "summary"
+    window_turns: int = 3
+    summary_max_words: int = 150
+    include_control: bool = False
+
+    def __post_init__(self):
+        if self.mode not in MEMORY_MODES:
+            raise ValueError(f"Unknown memory mode {self.mode!r}, expected one of {MEMORY_MODES}")
+
+    @property
+    def summary_max_tokens(self) -> int:
+        # About 1.3 tokens per English word; the rest is room for the model
+        # overshooting the word budget before it is cut off.
+        return 2 * self.summary_max_words
+
+    @classmethod
+    def from_env(cls, **overrides) -> "MemoryConfig":
+        """Defaults from MEMORY_*; `overrides` are per-agent settings."""
+        config = cls(
+            mode=os.getenv("MEMORY_MODE", cls.mode),
+            window_turns=int(os.getenv("MEMORY_WINDOW_TURNS", str(cls.window_turns))),
+            summary_max_words=int(os.getenv("MEMORY_SUMMARY_MAX_WORDS", str(cls.summary_max_words))),
+        )
+        return replace(config, **overrides)
+
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [
+        (
+            "system",
+            "You progressively summarize a conversation between a student and a study assistant. "
+            "Extend the current summary with the new lines, keeping the topics studied, the tasks "
+            "asked for and anything the student said about themselves. Answer with the new summary "
+            "only, in at most {max_words} words.",
+        ),
+        ("human", "Current summary:\n{summary}\n\nNew lines:\n{new_lines}"),
+    ]
+)
+
+
+def past_turns(state: AgentState, include_control: bool = False) -> List[List[BaseMessage]]:
+    """Turns before the current one, each a human message and the replies to it."""
+    turns: List[List[BaseMessage]] = []
+    messages = AgentState.get_previous_messages(state)
+    for position, message in enumerate(messages):
+        previous = messages[position - 1] if position else None
+        if not include_control and AgentState.is_control_message(message, previous):
+            continue
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([message])
+        else:
+            turns[-1].append(message)
+    return turns
+
+
+def _render(turns: List[List[BaseMessage]]) -> str:
+    role = {"human": "Student", "ai": "Assistant"}
+    return "\n".join(
+        f"{role.get(message.type, message.type)}: {message.content}" for turn in turns for message in turn
+    )
+
+
+def _plan(
+    state: AgentState, config: MemoryConfig
+) -> Tuple[List[List[BaseMessage]], List[List[BaseMessage]]]:
+    """(turns to fold into the summary now, turns to send verbatim)."""
+    turns = past_turns(state, config.include_control)
+    if config.mode == "none":
+        return [], []
+    if config.mode == "buffer":
+        return [], turns
+    start = max(len(turns) - config.window_turns, 0)
+    if config.mode == "window":
+        return [], turns[start:]
+    # Only turns evicted since the last update are summarized; another agent
+    # may already have folded further, which just shortens this window.
+    summarized = state.get("summarized_turns", 0)
+    return turns[summarized:start], turns[max(start, summarized):]
+
+
+def _history(state: AgentState, config: MemoryConfig, window: List[List[BaseMessage]]) -> List[BaseMessage]:
+    messages = [message for turn in window for message in turn]
+    summary = state.get("memory_summary", "") if config.mode == "summary" else ""
+    if summary:
+        messages.insert(0, SystemMessage(content=f"Summary of the earlier conversation: {summary}"))
+    return messages
+
+
+def _summary_inputs(state: AgentState, config: MemoryConfig, fold: List[List[BaseMessage]]) -> dict:
+    return {
+        "summary": state.get("memory_summary", "") or "(none yet)",
+        "new_lines": _render(fold),
+        "max_words": config.summary_max_words,
+    }
+
+
+def _folded(
+    state: AgentState, fold: List[List[BaseMessage]], summary: str, finish: FinishReasons
+) -> None:
+    if finish.truncated:
+        # A cut-off summary would replace a whole one; keep the previous
+        # summary and fold these turns on the next call.
+        log.warning("memory.summary_truncated", turns=len(fold), characters=len(summary))
+        return
+    state["memory_summary"] = summary.strip()
+    state["summarized_turns"] = state.get("summarized_turns", 0) + len(fold)
+
+
+def _summarizer(llm: BaseLanguageModel):
+    return (summary_prompt | llm | StrOutputParser()).with_config(
+        run_name=MEMORY_SUMMARY_TAG, tags=[MEMORY_SUMMARY_TAG]
+    )
+
+
+def history_tokens(messages: List[BaseMessage]) -> int:
+    return sum(count_tokens(message.content) for message in messages if isinstance(message.content, str))
+
+
+def load_chat_history(
+    state: AgentState,
+    config: MemoryConfig,
+    llm: BaseLanguageModel,
+    run_config: Optional[RunnableConfig] = None,
+) -> List[BaseMessage]:
+    """chat_history for one agent call, updating the state's rolling summary first if needed."""
+    fold, window = _plan(state, config)
+    if fold:
+        finish = FinishReasons()
+        try:
+            summary = _summarizer(llm).invoke(
+                _summary_inputs(state, config, fold), merge_configs(run_config, {"callbacks": [finish]})
+            )
+            _folded(state, fold, summary, finish)
+        except Exception as e:
+            # Retried on the next call; meanwhile the agent gets the window only.
+            log.warning("memory.summary_failed", error=str(e))
+    return _history(state, config, window)
+
+
+async def aload_chat_history(
+    state: AgentState,
+    config: MemoryConfig,
+    llm: BaseLanguageModel,
+    run_config: Optional[RunnableConfig] = None,
+) -> List[BaseMessage]:
+    fold, window = _plan(state, config)
+    if fold:
+        finish = FinishReasons()
+        try:
+            summary = await _summarizer(llm).ainvoke(
+                _summary_inputs(state, config, fold), merge_configs(run_config, {"callbacks": [finish]})
+            )
+            _folded(state, fold, summary, finish)
+        except Exception as e:
+            log.warning("memory.summary_failed", error=str(e))
+    return _history(state, config, window)
@@ -0,0 +1,125 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Tuple
+
+from langchain.schema import Document
+from states.states import AgentState
+from tools.hybrid_retriever import LocalBM25Index, tokenize
+from utils.telemetry import get_logger
+
+log = get_logger("context")
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+_WHITESPACE = re.compile(r"\s+")
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """cl100k token count via tiktoken, or ~4 characters per token without it."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class ContextStats:
+    docs_in: int = 0
+    docs_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+
+def _shingles(text: str, size: int = 3) -> set:
+    terms = tokenize(text)
+    return {tuple(terms[i : i + size]) for i in range(max(1, len(terms) - size + 1))}
+
+
+def deduplicate(docs: List[Document], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> List[Document]:
+    """Drop exact duplicates (modulo whitespace) and docs whose word 3-shingles
+    overlap an earlier doc with Jaccard similarity >= `threshold`."""
+    seen = set()
+    kept: List[Tuple[Document, set]] = []
+    for doc in docs:
+        text = _WHITESPACE.sub(" ", doc.page_content).strip()
+        if not text:
+            continue
+        digest = hashlib.sha1(text.lower().encode()).digest()
+        if digest in seen:
+            continue
+        seen.add(digest)
+        shingles = _shingles(text)
+        if any(
+            len(shingles & other) / len(shingles | other) >= threshold
+            for _, other in kept
+        ):
+            continue
+        kept.append((doc, shingles))
+    return [doc for doc, _ in kept]
+
+
+def rerank(query: str, docs: List[Document]) -> List[Document]:
+    """BM25 order against the query; docs with no matching term keep their order at the end."""
+    scored = LocalBM25Index(docs).search(query, len(docs))
+    ranked_ids = {id(doc) for doc, score in scored if score > 0}
+    ranked = [doc for doc, score in scored if score > 0]
+    return ranked + [doc for doc in docs if id(doc) not in ranked_ids]
+
+
+def build_context(
+    query: str,
+    docs: List[Document],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+) -> Tuple[List[str], ContextStats]:
+    """Deduplicate, rerank and greedily pack `docs` into `token_budget` tokens."""
+    stats = ContextStats(docs_in=len(docs))
+    costs = {}
+    for doc in docs:
+        costs[id(doc)] = count_tokens(doc.page_content)
+        stats.tokens_in += costs[id(doc)]
+
+    packed: List[str] = []
+    for doc in rerank(query or "", deduplicate(docs, near_duplicate_threshold)):
+        cost = costs[id(doc)]
+        if stats.tokens_out + cost > token_budget:
+            continue
+        packed.append(doc.page_content)
+        stats.tokens_out += cost
+    stats.docs_out = len(packed)
+    return packed, stats
+
+
+def assemble_context(state: AgentState) -> List[str]:
+    """Packed retrieved_docs for the prompt; records the tokens saved in the state."""
+    packed, stats = build_context(
+        AgentState.get_last_human_message(state),
+        AgentState.get_all_documents(state, with_info=True),
+    )
+    # Every pass packs all of the turn's documents again, so the latest build
+    # is the whole saving; adding each pass would count the same documents twice.
+    state["tokens_saved"] = stats.tokens_saved
+    log.debug(
+        "context.assembled",
+        docs_in=stats.docs_in,
+        docs_out=stats.docs_out,
+        tokens_in=stats.tokens_in,
+        tokens_out=stats.tokens_out,
+        tokens_saved=stats.tokens_saved,
+    )
+    return packed
@@ -0,0 +1,225 @@
+"""
+Pooled SQLAlchemy engines for Postgres, one set per workload.
+
+Retrieval ("read") and bulk ingestion ("ingest") get separate pools, so a
+long ingestion run holds at most its own connections and never makes a
+query wait. Each pool is sized, health-checked on checkout (pre-ping),
+recycled and puts a statement timeout on its sessions; the time callers
+wait for a connection and the pool's utilization are recorded per pool and
+served by the server's /metrics.
+
+Sizes and timeouts come from PG_<ROLE>_POOL_MIN_SIZE, _MAX_SIZE, _TIMEOUT
+(seconds to wait for a connection), _STATEMENT_TIMEOUT_MS and _RECYCLE.
+"""
+
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine import URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from utils.telemetry import register_collector
+
+POOL_ROLES = ("read", "ingest")
+
+
+@dataclass(frozen=True)
+class PoolConfig:
+    """`min_size` connections are kept open, up to `max_size` under load."""
+
+    min_size: int = 2
+    max_size: int = 10
+    timeout: float = 5.0
+    statement_timeout_ms: int = 10_000
+    recycle: int = 1800
+
+    @classmethod
+    def from_env(cls, role: str, **defaults) -> "PoolConfig":
+        config = replace(cls(), **defaults)
+        prefix = f"PG_{role.upper()}_POOL_"
+        return cls(
+            min_size=int(os.getenv(prefix + "MIN_SIZE", config.min_size)),
+            max_size=int(os.getenv(prefix + "MAX_SIZE", config.max_size)),
+            timeout=float(os.getenv(prefix + "TIMEOUT", config.timeout)),
+            statement_timeout_ms=int(
+                os.getenv(prefix + "STATEMENT_TIMEOUT_MS", config.statement_timeout_ms)
+            ),
+            recycle=int(os.getenv(prefix + "RECYCLE", config.recycle)),
+        )
+
+
+# Queries should be quick and plentiful; ingestion is a few long transactions.
+DEFAULT_POOL_CONFIGS = {
+    "read": dict(min_size=4, max_size=16, timeout=5.0, statement_timeout_ms=5_000),
+    "ingest": dict(min_size=1, max_size=4, timeout=60.0, statement_timeout_ms=300_000),
+}
+
+
+class PoolMetrics:
+    """Checkout waits, timeouts and utilization of one pool."""
+
+    def __init__(self, name: str, max_size: int, window: int = 2048):
+        self.name = name
+        self.max_size = max_size
+        self.pool: Optional[QueuePool] = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.peak_in_use = 0
+        self._waits: "deque[float]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, wait: float, timed_out: bool = False) -> None:
+        in_use = self.pool.checkedout() if self.pool is not None else 0
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+                self.peak_in_use = max(self.peak_in_use, in_use)
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self._waits.append(wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts, timeouts = self.checkouts, self.timeouts
+            wait_total, wait_max, peak = self.wait_total, self.wait_max, self.peak_in_use
+        pool = self.pool
+        in_use = pool.checkedout() if pool is not None else 0
+        return {
+            "max_size": self.max_size,
+            "open": (pool.checkedin() + in_use) if pool is not None else 0,
+            "in_use": in_use,
+            "peak_in_use": peak,
+            "utilization": round(in_use / self.max_size, 3) if self.max_size else 0.0,
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_ms_mean": round(wait_total / max(checkouts + timeouts, 1) * 1000, 3),
+            "wait_ms_p95": round(waits[int(len(waits) * 0.95) - 1] * 1000, 3) if len(waits) > 1 else 0.0,
+            "wait_ms_median": round(statistics.median(waits) * 1000, 3) if waits else 0.0,
+            "wait_ms_max": round(wait_max * 1000, 3),
+        }
+
+
+_metrics: Dict[str, PoolMetrics] = {}
+
+
+class _MeteredPool:
+    """Times every checkout; the metrics survive pool.recreate() via the pool's name."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        name = self._orig_logging_name or "pool"
+        self.metrics = _metrics.setdefault(
+            name, PoolMetrics(name, self.size() + max(self._max_overflow, 0))
+        )
+        self.metrics.pool = self
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+        return record
+
+
+class MeteredQueuePool(_MeteredPool, QueuePool):
+    pass
+
+
+class MeteredAsyncQueuePool(_MeteredPool, AsyncAdaptedQueuePool):
+    pass
+
+
+def database_url() -> URL:
+    """Postgres URL from POSTGRES_* (psycopg 3 serves both sync and async)."""
+    return URL.create(
+        "postgresql+psycopg",
+        username=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=int(os.getenv("POSTGRES_PORT", "5432")),
+        database=os.getenv("POSTGRES_DB"),
+    )
+
+
+def create_pooled_engine(
+    url, config: PoolConfig, name: str, async_mode: bool = False, **engine_kwargs
+):
+    """An Engine (AsyncEngine with `async_mode`) on a metered QueuePool named `name`."""
+    kwargs: Dict[str, Any] = dict(
+        engine_kwargs,
+        poolclass=MeteredAsyncQueuePool if async_mode else MeteredQueuePool,
+        pool_size=config.min_size,
+        max_overflow=max(config.max_size - config.min_size, 0),
+        pool_timeout=config.timeout,
+        pool_recycle=config.recycle,
+        pool_pre_ping=True,
+        pool_logging_name=name,
+    )
+    if str(url).startswith("postgresql") and config.statement_timeout_ms:
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={config.statement_timeout_ms}"}
+    if async_mode:
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        return create_async_engine(url, **kwargs)
+    return create_engine(url, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def get_engine(role: str = "read", async_mode: bool = False):
+    """The process-wide engine of a pool role ("read" or "ingest")."""
+    if role not in POOL_ROLES:
+        raise ValueError(f"Unknown pool role {role!r}, expected one of {POOL_ROLES}")
+    from models.llms import load_settings
+
+    load_settings()
+    config = PoolConfig.from_env(role, **DEFAULT_POOL_CONFIGS[role])
+    name = f"{role}-async" if async_mode else role
+    return create_pooled_engine(database_url(), config, name, async_mode)
+
+
+def warm_pools() -> None:
+    """Open `min_size` connections of every sync pool created so far."""
+    for metrics in list(_metrics.values()):
+        pool = metrics.pool
+        if pool is None or pool._is_asyncio:
+            continue
+        connections = [pool.connect() for _ in range(max(pool.size() - pool.checkedin(), 0))]
+        for connection in connections:
+            connection.close()
+
+
+def pool_metrics() -> Dict[str, Dict[str, Any]]:
+    return {name: metrics.snapshot() for name, metrics in _metrics.items()}
+
+
+def _pool_samples(field: str, scale: float = 1.0):
+    return [({"pool": name}, metrics.snapshot()[field] * scale) for name, metrics in list(_metrics.items())]
+
+
+register_collector(
+    "rag_db_pool_connections_in_use",
+    lambda: ("gauge", "Checked-out connections per pool.", _pool_samples("in_use")),
+)
+register_collector(
+    "rag_db_pool_checkout_timeouts_total",
+    lambda: ("counter", "Checkouts that gave up waiting for a connection.", _pool_samples("timeouts")),
+)
+register_collector(
+    "rag_db_pool_wait_seconds_max",
+    lambda: ("gauge", "Longest wait for a connection per pool.", _pool_samples("wait_ms_max", 1e-3)),
+)
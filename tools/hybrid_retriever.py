@@ -0,0 +1,313 @@
+import asyncio
+import hashlib
+import math
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from langchain.schema import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.vectorstores import VectorStoreRetriever
+from pydantic import ConfigDict, Field
+from tools.local_vectorstore import matches_filter
+from utils.telemetry import RETRIEVER_ERRORS, get_logger
+
+log = get_logger("retriever")
+
+# Keeps "risc-v", "amdahl's" and "8086" as single terms.
+_TERM = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TERM.findall(text.lower())
+
+
+def doc_key(doc: Document) -> str:
+    return hashlib.sha1(doc.page_content.encode()).hexdigest()
+
+
+def scoped(retriever: BaseRetriever, filter: Optional[dict]) -> Runnable:
+    """
+    `retriever` restricted to the metadata `filter` (a course/chapter scope).
+    LangChain's vector store retrievers ignore invoke arguments, so theirs
+    goes into `search_kwargs`; the retrievers here take it as an argument.
+    """
+    if not filter:
+        return retriever
+    if isinstance(retriever, VectorStoreRetriever):
+        return retriever.model_copy(
+            update={"search_kwargs": {**retriever.search_kwargs, "filter": filter}}
+        )
+    return retriever.bind(filter=filter)
+
+
+RELEVANCE_KEY = "relevance"
+
+
+def _with_relevance(scored: List[Tuple[Document, float]]) -> List[Document]:
+    # Copies: the local store hands out its own Document objects.
+    return [
+        Document(page_content=doc.page_content, metadata={**doc.metadata, RELEVANCE_KEY: score}, id=doc.id)
+        for doc, score in scored
+    ]
+
+
+def pop_relevance(docs: List[Document]) -> List[float]:
+    """Remove and return the relevance scores a ScoredVectorStoreRetriever put on `docs`."""
+    return [doc.metadata.pop(RELEVANCE_KEY) for doc in docs if RELEVANCE_KEY in doc.metadata]
+
+
+class ScoredVectorStoreRetriever(VectorStoreRetriever):
+    """
+    Similarity search that keeps each document's relevance score (cosine, see
+    LocalVectorStore) in `metadata["relevance"]`, so the validator's
+    confidence gate can reuse the first-pass retrieval instead of searching again.
+    """
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, **kwargs
+    ) -> List[Document]:
+        return _with_relevance(
+            self.vectorstore.similarity_search_with_relevance_scores(query, **{**self.search_kwargs, **kwargs})
+        )
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, **kwargs
+    ) -> List[Document]:
+        return _with_relevance(
+            await self.vectorstore.asimilarity_search_with_relevance_scores(
+                query, **{**self.search_kwargs, **kwargs}
+            )
+        )
+
+
+class LocalBM25Index:
+    """In-process BM25 inverted index, the fallback when pg_bestmatch is unavailable."""
+
+    def __init__(self, docs: Optional[List[Document]] = None, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.docs: List[Document] = []
+        self.lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        if docs:
+            self.add_documents(docs)
+
+    def add_documents(self, docs: List[Document]) -> None:
+        for doc in docs:
+            terms = Counter(tokenize(doc.page_content))
+            index = len(self.docs)
+            self.docs.append(doc)
+            self.lengths.append(sum(terms.values()))
+            for term, tf in terms.items():
+                self.postings[term].append((index, tf))
+
+    def search(self, query: str, k: int, filter: Optional[dict] = None) -> List[Tuple[Document, float]]:
+        n = len(self.docs)
+        if not n:
+            return []
+        avg_length = sum(self.lengths) / n
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for index, tf in postings:
+                norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[index] / avg_length)
+                scores[index] += idf * tf * (self.k1 + 1) / norm
+        if filter:
+            scores = {
+                index: score for index, score in scores.items()
+                if matches_filter(self.docs[index].metadata, filter)
+            }
+        best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(self.docs[index], score) for index, score in best]
+
+
+class LocalBM25Retriever(BaseRetriever):
+    index: LocalBM25Index
+    k: int = 5
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        return [doc for doc, _ in self.index.search(query, self.k, filter)]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        return await run_in_executor(
+            None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), filter=filter
+        )
+
+
+class PgBestMatchRetriever(BaseRetriever):
+    """
+    BM25 over the PGVector embedding table using the pg_bestmatch extension.
+    `setup` creates the extension, the sparse `bm25` column and the BM25
+    statistics where they are missing, so it can run on every start;
+    `refresh` fills the column for rows added since.
+    """
+
+    vectorstore: object
+    k: int = 5
+    index_name: str = "langchain_pg_embedding_bm25"
+    tokenizer: str = "bert-base-uncased"
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _execute(self, sql: str, params: Optional[dict] = None):
+        from sqlalchemy import text
+
+        with self.vectorstore.session_maker() as session:
+            result = session.execute(text(sql), params or {})
+            rows = result.fetchall() if result.returns_rows else None
+            session.commit()
+            return rows
+
+    def ready(self) -> bool:
+        """Whether the BM25 statistics exist."""
+        return self._execute("SELECT to_regclass(:name) IS NOT NULL", {"name": self.index_name})[0][0]
+
+    def setup(self) -> None:
+        self._execute("CREATE EXTENSION IF NOT EXISTS pg_bestmatch")
+        self._execute("ALTER TABLE langchain_pg_embedding ADD COLUMN IF NOT EXISTS bm25 svector")
+        # The statistics are computed from the rows present, so they wait for the first ingestion.
+        if not self.ready() and self._execute("SELECT EXISTS (SELECT 1 FROM langchain_pg_embedding)")[0][0]:
+            self._execute(
+                "SELECT bm25_create('langchain_pg_embedding', 'document', :name, :tokenizer, 1.2, 0.75)",
+                {"name": self.index_name, "tokenizer": self.tokenizer},
+            )
+
+    def refresh(self) -> None:
+        if not self.ready():
+            return
+        self._execute(
+            "UPDATE langchain_pg_embedding SET bm25 = "
+            "bm25_document_to_svector(:name, document, :tokenizer)::svector WHERE bm25 IS NULL",
+            {"name": self.index_name, "tokenizer": self.tokenizer},
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        # Plain equality on cmetadata ->> key, the expression the scope index covers.
+        scope = {f"scope_{i}": (key, value) for i, (key, value) in enumerate((filter or {}).items())}
+        for key, value in scope.values():
+            if not key.isidentifier() or isinstance(value, (dict, list)):
+                raise ValueError(f"Unsupported keyword filter {key!r}: {value!r}")
+        conditions = "".join(f" AND e.cmetadata->>'{key}' = :{name}" for name, (key, _) in scope.items())
+        rows = self._execute(
+            f"""
+            SELECT e.document, e.cmetadata
+            FROM langchain_pg_embedding e
+            JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+            WHERE c.name = :collection AND e.bm25 IS NOT NULL{conditions}
+            ORDER BY e.bm25 <#> bm25_query_to_svector(:name, :query, :tokenizer)::svector
+            LIMIT :k
+            """,
+            {
+                "collection": self.vectorstore.collection_name,
+                "name": self.index_name,
+                "query": query,
+                "tokenizer": self.tokenizer,
+                "k": self.k,
+                **{name: value for name, (_, value) in scope.items()},
+            },
+        )
+        return [Document(page_content=document, metadata=metadata or {}) for document, metadata in rows]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        return await run_in_executor(
+            None, self._get_relevant_documents, query, run_manager=run_manager.get_sync(), filter=filter
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[Document]], weights: List[float], k: int, rrf_k: int = 60
+) -> List[Document]:
+    scores: Dict[str, float] = defaultdict(float)
+    docs: Dict[str, Document] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc in enumerate(ranking):
+            key = doc_key(doc)
+            docs.setdefault(key, doc)
+            scores[key] += weight / (rrf_k + rank + 1)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in best]
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Runs the vector and keyword retrievers concurrently and fuses their
+    rankings with reciprocal rank fusion. A retriever that fails is logged
+    and left out of the fusion rather than failing the whole retrieval.
+    """
+
+    retrievers: List[BaseRetriever]
+    weights: Optional[List[float]] = None
+    k: int = 5
+    rrf_k: int = 60
+    executor: ThreadPoolExecutor = Field(
+        default_factory=lambda: ThreadPoolExecutor(thread_name_prefix="hybrid-retriever")
+    )
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def _fuse(self, results: list) -> List[Document]:
+        rankings, weights = [], []
+        for retriever, weight, result in zip(
+            self.retrievers, self.weights or [1.0] * len(self.retrievers), results
+        ):
+            if isinstance(result, Exception):
+                # Retrieval degrades to the other retrievers; the counter makes that visible.
+                RETRIEVER_ERRORS.inc(1, type(retriever).__name__)
+                log.error("retriever.failed", retriever=type(retriever).__name__, error=str(result))
+                continue
+            rankings.append(result)
+            weights.append(weight)
+        if not rankings:
+            raise results[0]
+        return reciprocal_rank_fusion(rankings, weights, self.k, self.rrf_k)
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        # `filter` (a course/chapter scope) is pushed down into every retriever.
+        futures = [
+            self.executor.submit(
+                scoped(retriever, filter).invoke, query, {"callbacks": run_manager.get_child()}
+            )
+            for retriever in self.retrievers
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        return self._fuse(results)
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun, filter: Optional[dict] = None
+    ) -> List[Document]:
+        results = await asyncio.gather(
+            *(
+                scoped(retriever, filter).ainvoke(query, {"callbacks": run_manager.get_child()})
+                for retriever in self.retrievers
+            ),
+            return_exceptions=True,
+        )
+        return self._fuse(results)
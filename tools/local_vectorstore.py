@@ -0,0 +1,383 @@
+import json
+import os
+import threading
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+
+def _matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict):
+        if "$eq" in condition:
+            return value == condition["$eq"]
+        if "$in" in condition:
+            return value in condition["$in"]
+        if "$ne" in condition:
+            return value != condition["$ne"]
+        raise ValueError(f"Unsupported filter operator: {condition}")
+    return value == condition
+
+
+def matches_filter(metadata: dict, filter: Optional[dict]) -> bool:
+    """Whether `metadata` satisfies a {"course": ..., "chapter": ...} style filter."""
+    return all(_matches(metadata.get(key), condition) for key, condition in (filter or {}).items())
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store on NumPy, the PGVector alternative for small
+    corpora and hermetic tests.
+
+    Vectors are L2-normalised float32 rows scored by inner product (cosine
+    similarity, higher is better, also reported as the relevance score). Rows
+    are held in buffers that grow geometrically, so adding is amortised
+    O(rows added). With `path`, rows are appended to `vectors.f32` and
+    `docs.jsonl` as they are added and memory-mapped on load, so opening a
+    large store costs no copy. `build_ivf` partitions the rows into k-means
+    lists, saved to `ivf.npz`; searches then scan only the `n_probe`
+    closest lists instead of every row. Metadata filters take the same
+    {"course": ..., "chapter": ...} dicts as PGVector, plus $eq/$in/$ne;
+    equality and $in conditions are answered from per-key value -> rows
+    indexes, so a scoped search scores only the rows in scope.
+    Writes and searches are serialised by a lock, so search results can be
+    written back from several threads at once.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        path: Optional[str] = None,
+        n_probe: int = 8,
+    ):
+        self.embedding = embedding
+        self.path = path
+        self.n_probe = n_probe
+        self.ids: List[str] = []
+        self.docs: List[Optional[Document]] = []
+        self.alive = np.zeros(0, dtype=bool)
+        self.vectors: Optional[np.ndarray] = None
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._rows: Dict[str, int] = {}
+        self._columns: Dict[str, np.ndarray] = {}
+        self._indexes: Dict[str, Optional[Dict[Any, np.ndarray]]] = {}
+        self._buffers: Dict[str, np.ndarray] = {}
+        self._lock = threading.RLock()
+        if path:
+            os.makedirs(path, exist_ok=True)
+            self._load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    # Persistence
+
+    def _files(self) -> Tuple[str, str]:
+        return os.path.join(self.path, "vectors.f32"), os.path.join(self.path, "docs.jsonl")
+
+    def _ivf_file(self) -> str:
+        return os.path.join(self.path, "ivf.npz")
+
+    def _load(self) -> None:
+        vectors_file, docs_file = self._files()
+        if not os.path.exists(docs_file):
+            return
+        deleted = set()
+        with open(docs_file) as f:
+            for line in f:
+                record = json.loads(line)
+                if "delete" in record:
+                    deleted.add(self._rows.pop(record["delete"], None))
+                    continue
+                if record["id"] in self._rows:
+                    deleted.add(self._rows[record["id"]])
+                self._rows[record["id"]] = len(self.ids)
+                self.ids.append(record["id"])
+                self.docs.append(Document(page_content=record["text"], metadata=record["metadata"]))
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        for row in deleted - {None}:
+            self.alive[row] = False
+            self.docs[row] = None
+        if self.ids:
+            dim = os.path.getsize(vectors_file) // (4 * len(self.ids))
+            self.vectors = np.memmap(vectors_file, dtype=np.float32, mode="r", shape=(len(self.ids), dim))
+        self._load_ivf()
+
+    def _load_ivf(self) -> None:
+        if self.vectors is None or not os.path.exists(self._ivf_file()):
+            return
+        with np.load(self._ivf_file()) as ivf:
+            centroids, assignments = ivf["centroids"], ivf["assignments"]
+        if centroids.shape[1] != self.vectors.shape[1] or len(assignments) > len(self.ids):
+            return
+        # Rows appended since the index was saved go to their closest list.
+        tail = np.asarray(self.vectors[len(assignments) :])
+        self.centroids = centroids
+        self.assignments = np.concatenate(
+            [assignments, np.argmax(tail @ centroids.T, axis=1).astype(np.int32)]
+        )
+
+    def _save_ivf(self) -> None:
+        if not self.path or self.centroids is None:
+            return
+        tmp = f"{self._ivf_file()}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments)
+        os.replace(tmp, self._ivf_file())
+
+    def _append_records(self, records: List[dict], vectors: Optional[np.ndarray] = None) -> None:
+        if not self.path:
+            return
+        vectors_file, docs_file = self._files()
+        if vectors is not None:
+            with open(vectors_file, "ab") as f:
+                vectors.tofile(f)
+        with open(docs_file, "a") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+
+    def compact(self) -> None:
+        """Drop deleted rows from memory and, with a path, rewrite the files."""
+        with self._lock:
+            keep = np.flatnonzero(self.alive)
+            self.ids = [self.ids[i] for i in keep]
+            self.docs = [self.docs[i] for i in keep]
+            self.vectors = None if self.vectors is None else np.array(self.vectors[keep])
+            self.assignments = self.assignments[keep] if len(self.assignments) else self.assignments
+            self.alive = np.ones(len(self.ids), dtype=bool)
+            self._rows = {id_: row for row, id_ in enumerate(self.ids)}
+            self._columns.clear()
+            self._indexes.clear()
+            if self.path:
+                vectors_file, docs_file = self._files()
+                for name in (vectors_file, docs_file):
+                    if os.path.exists(name):
+                        os.remove(name)
+                self._append_records(
+                    [
+                        {"id": id_, "text": doc.page_content, "metadata": doc.metadata}
+                        for id_, doc in zip(self.ids, self.docs)
+                    ],
+                    self.vectors,
+                )
+                self._save_ivf()
+
+    # Writes
+
+    def _extend(self, name: str, rows: np.ndarray) -> None:
+        """Append `rows` to the array attribute `name`, doubling its buffer when full."""
+        current = getattr(self, name)
+        n = 0 if current is None else len(current)
+        buffer = self._buffers.get(name)
+        if current is None or buffer is None or current.base is not buffer or n + len(rows) > len(buffer):
+            buffer = np.empty((max(2 * n, n + len(rows), 64),) + rows.shape[1:], dtype=rows.dtype)
+            if n:
+                buffer[:n] = current
+            self._buffers[name] = buffer
+        buffer[n : n + len(rows)] = rows
+        setattr(self, name, buffer[: n + len(rows)])
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in texts]
+        vectors = np.asarray(self.embedding.embed_documents(texts), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+
+        with self._lock:
+            self._mark_deleted([id_ for id_ in ids if id_ in self._rows], persist=False)
+            start = len(self.ids)
+            for offset, (id_, text, metadata) in enumerate(zip(ids, texts, metadatas)):
+                self._rows[id_] = start + offset
+                self.ids.append(id_)
+                self.docs.append(Document(page_content=text, metadata=metadata))
+            self._extend("vectors", vectors)
+            self._extend("alive", np.ones(len(texts), dtype=bool))
+            if self.centroids is not None:
+                self._extend("assignments", np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32))
+            self._columns.clear()
+            self._indexes.clear()
+            self._append_records(
+                [
+                    {"id": id_, "text": text, "metadata": metadata}
+                    for id_, text, metadata in zip(ids, texts, metadatas)
+                ],
+                vectors,
+            )
+        return ids
+
+    def _mark_deleted(self, ids: List[str], persist: bool = True) -> None:
+        with self._lock:
+            for id_ in ids:
+                row = self._rows.pop(id_, None)
+                if row is not None:
+                    self.alive[row] = False
+                    self.docs[row] = None
+            if persist:
+                self._append_records([{"delete": id_} for id_ in ids])
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if ids:
+            self._mark_deleted(ids)
+        return True
+
+    def get_by_ids(self, ids: List[str]) -> List[Document]:
+        return [self.docs[self._rows[id_]] for id_ in ids if id_ in self._rows]
+
+    def iter_documents(self, filter: Optional[dict] = None) -> Iterable[Tuple[str, Document]]:
+        """Live (id, document) pairs in insertion order, optionally filtered by metadata."""
+        with self._lock:
+            rows = self._filter_rows(filter)
+        for row in rows:
+            yield self.ids[row], self.docs[row]
+
+    # Approximate index
+
+    def build_ivf(self, n_lists: Optional[int] = None, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the live rows into `n_lists` k-means lists (default ~sqrt(N))."""
+        with self._lock:
+            rows = np.flatnonzero(self.alive)
+            if self.vectors is None or len(rows) == 0:
+                return
+            n_lists = min(n_lists or max(1, int(np.sqrt(len(rows)))), len(rows))
+            data = np.asarray(self.vectors[rows])
+            rng = np.random.default_rng(seed)
+            centroids = data[rng.choice(len(data), n_lists, replace=False)]
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                for i in range(n_lists):
+                    members = data[labels == i]
+                    if len(members):
+                        centroid = members.mean(axis=0)
+                        centroids[i] = centroid / (np.linalg.norm(centroid) or 1.0)
+            self.centroids = centroids
+            self.assignments = np.argmax(np.asarray(self.vectors) @ centroids.T, axis=1).astype(np.int32)
+            self._save_ivf()
+
+    # Reads
+
+    def _column(self, key: str) -> np.ndarray:
+        column = self._columns.get(key)
+        if column is None:
+            column = np.empty(len(self.docs), dtype=object)
+            column[:] = [doc.metadata.get(key) if doc is not None else None for doc in self.docs]
+            self._columns[key] = column
+        return column
+
+    def _index(self, key: str) -> Optional[Dict[Any, np.ndarray]]:
+        """value -> rows for metadata `key`, or None when its values are unhashable (lists)."""
+        if key not in self._indexes:
+            rows: Dict[Any, List[int]] = {}
+            try:
+                for row, doc in enumerate(self.docs):
+                    rows.setdefault(doc.metadata.get(key) if doc is not None else None, []).append(row)
+                index = {value: np.asarray(r, dtype=np.int64) for value, r in rows.items()}
+            except TypeError:
+                index = None
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _filter_rows(self, filter: Optional[dict]) -> np.ndarray:
+        """Sorted live rows matching `filter`, narrowed through the value indexes."""
+        rows, rest = None, {}
+        for key, condition in (filter or {}).items():
+            if isinstance(condition, dict) and set(condition) - {"$eq", "$in"}:
+                rest[key] = condition
+                continue
+            values = condition.get("$in", [condition.get("$eq")]) if isinstance(condition, dict) else [condition]
+            index = self._index(key)
+            try:
+                matched = None if index is None else [index[value] for value in values if value in index]
+            except TypeError:
+                matched = None
+            if matched is None:
+                rest[key] = condition
+                continue
+            matched = np.unique(np.concatenate(matched)) if matched else np.zeros(0, dtype=np.int64)
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+        if rows is None:
+            rows = np.flatnonzero(self.alive)
+        else:
+            rows = rows[self.alive[rows]]
+        if rest:
+            rows = rows[self._mask(rest)[rows]]
+        return rows
+
+    def _mask(self, filter: Optional[dict]) -> np.ndarray:
+        mask = self.alive.copy()
+        for key, condition in (filter or {}).items():
+            column = self._column(key)
+            if isinstance(condition, dict):
+                mask &= np.fromiter((_matches(v, condition) for v in column), bool, len(column))
+            else:
+                mask &= column == condition
+        return mask
+
+    def similarity_search_with_score_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None
+    ) -> List[Tuple[Document, float]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            if self.vectors is None:
+                return []
+            rows = self._filter_rows(filter)
+            if self.centroids is not None:
+                probes = np.argsort(self.centroids @ query)[-self.n_probe :]
+                rows = rows[np.isin(self.assignments[rows], probes)]
+            if not len(rows):
+                return []
+            # Every row live and in scope: score the matrix in place rather than gathering a copy.
+            vectors = self.vectors if len(rows) == len(self.ids) else self.vectors[rows]
+            scores = np.asarray(vectors) @ query
+            top = np.argpartition(-scores, min(k, len(rows)) - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.docs[rows[i]], float(scores[i])) for i in top]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(
+            self.embedding.embed_query(query), k=k, filter=filter
+        )
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter)]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: Optional[dict] = None, **kwargs: Any
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Plain cosine, as PGVector's cosine strategy reports (1 - distance), so
+        # relevance thresholds (tools.retrieval_gate) mean the same on both backends.
+        return lambda score: score
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        ids: Optional[List[str]] = None,
+        path: Optional[str] = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, path=path, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
@@ -0,0 +1,94 @@
+import os
+from dataclasses import dataclass
+from typing import List, Optional
+
+from tools.hybrid_retriever import tokenize
+
+STOPWORDS = {
+    "a", "about", "an", "and", "are", "as", "at", "be", "by", "can", "define",
+    "describe", "do", "does", "explain", "for", "from", "full", "give", "how",
+    "i", "in", "is", "it", "me", "of", "on", "or", "please", "s", "tell", "the",
+    "to", "what", "when", "where", "which", "who", "why", "with", "you",
+}
+
+
+@dataclass
+class GateConfig:
+    """Thresholds for deciding YES/NO without the validator LLM."""
+
+    enabled: bool = True
+    min_docs: int = 2
+    yes_score: float = 0.82
+    yes_coverage: float = 0.75
+    no_score: float = 0.30
+    no_coverage: float = 0.15
+
+    @classmethod
+    def from_env(cls) -> "GateConfig":
+        return cls(
+            enabled=os.getenv("VALIDATOR_GATE_ENABLED", "true").lower() == "true",
+            min_docs=int(os.getenv("VALIDATOR_GATE_MIN_DOCS", "2")),
+            yes_score=float(os.getenv("VALIDATOR_GATE_YES_SCORE", "0.82")),
+            yes_coverage=float(os.getenv("VALIDATOR_GATE_YES_COVERAGE", "0.75")),
+            no_score=float(os.getenv("VALIDATOR_GATE_NO_SCORE", "0.30")),
+            no_coverage=float(os.getenv("VALIDATOR_GATE_NO_COVERAGE", "0.15")),
+        )
+
+
+@dataclass
+class GateFeatures:
+    top_score: float
+    coverage: float
+    doc_count: int
+
+
+@dataclass
+class GateDecision:
+    verdict: Optional[str]
+    source: str
+    features: GateFeatures
+
+    def describe(self) -> str:
+        f = self.features
+        return (
+            f"verdict={self.verdict or 'ambiguous'} source={self.source} "
+            f"top_score={f.top_score:.3f} coverage={f.coverage:.2f} docs={f.doc_count}"
+        )
+
+
+def query_terms(query: str) -> set:
+    return {term for term in tokenize(query) if term not in STOPWORDS and len(term) > 1}
+
+
+def compute_features(query: str, scores: List[float], context: List[str]) -> GateFeatures:
+    """
+    `scores` are the retrieved documents' relevance, the cosine similarity on
+    every vector backend, higher is better; coverage is the share of the query's content terms found in `context`.
+    """
+    terms = query_terms(query)
+    present = set(tokenize(" ".join(context)))
+    return GateFeatures(
+        top_score=max(scores, default=0.0),
+        coverage=len(terms & present) / len(terms) if terms else 1.0,
+        doc_count=len([text for text in context if text.strip()]),
+    )
+
+
+def decide(features: GateFeatures, config: GateConfig, allow_no: bool = True) -> GateDecision:
+    """YES/NO when the features are clearly on one side, None in the ambiguous band."""
+    if (
+        features.doc_count >= config.min_docs
+        and features.top_score >= config.yes_score
+        and features.coverage >= config.yes_coverage
+    ):
+        return GateDecision("YES", "gate", features)
+    if allow_no and (
+        features.doc_count < config.min_docs
+        or features.top_score < config.no_score
+        or features.coverage < config.no_coverage
+    ):
+        return GateDecision("NO", "gate", features)
+    return GateDecision(None, "llm", features)
+
+
+gate_config = GateConfig.from_env()
@@ -1,28 +1,190 @@
-from langchain_postgres import PGVector
-from models.llms import azure_embeddings
-from dotenv import load_dotenv
-import os
+"""
+Vector store and retrievers, connected on first use.
 
-load_dotenv(override=True)
+`vectorstore`, `async_vectorstore`, `keyword_retriever`, `semantic_retriever`,
+`async_semantic_retriever` and `ingest_vectorstore` are resolved lazily
+(PEP 562): importing this module neither loads the embedding client nor
+connects to Postgres. Postgres connections come from the pools of
+tools.db_pool.
+"""
 
-driver = "psycopg"
-host = os.getenv("POSTGRES_HOST")
-port = int(os.getenv("POSTGRES_PORT"))
-database = os.getenv("POSTGRES_DB")
-user = os.getenv("POSTGRES_USER")
-password = os.getenv("POSTGRES_PASSWORD")
+from functools import lru_cache
+from types import SimpleNamespace
+from typing import Optional
+import os
 
-CONNECTION_STRING = PGVector.connection_string_from_db_params(
-    driver=driver, host=host, port=port, database=database, user=user, password=password
+from tools.hybrid_retriever import (
+    HybridRetriever,
+    LocalBM25Index,
+    LocalBM25Retriever,
+    PgBestMatchRetriever,
+    ScoredVectorStoreRetriever,
 )
 
-vectorstore = PGVector(
-    connection=CONNECTION_STRING,
-    embeddings=azure_embeddings,
-    collection_name="langchain",
-    pre_delete_collection=False,
-)
 
-semantic_retriever = vectorstore.as_retriever(
-    search_type="similarity", search_kwargs={"k": 5}
-)
+def _local_stores(embeddings) -> SimpleNamespace:
+    from tools.local_vectorstore import LocalVectorStore
+
+    vectorstore = LocalVectorStore(
+        embeddings,
+        path=os.getenv("LOCAL_VECTOR_STORE_PATH", ".vectorstore"),
+        n_probe=int(os.getenv("LOCAL_VECTOR_STORE_N_PROBE", "8")),
+    )
+    if os.getenv("LOCAL_VECTOR_STORE_IVF", "false").lower() == "true":
+        vectorstore.build_ivf()
+    return SimpleNamespace(
+        vectorstore=vectorstore,
+        async_vectorstore=vectorstore,
+        keyword_retriever=LocalBM25Retriever(
+            index=LocalBM25Index([doc for _, doc in vectorstore.iter_documents()]), k=10
+        ),
+    )
+
+
+def _pgvector_stores(embeddings) -> SimpleNamespace:
+    from langchain_postgres import PGVector
+
+    from tools.db_pool import get_engine
+
+    # Queries share the pooled "read" engines; ingestion has its own pool,
+    # see get_ingest_vectorstore.
+    vectorstore = PGVector(
+        connection=get_engine("read"),
+        embeddings=embeddings,
+        collection_name="langchain",
+        pre_delete_collection=False,
+    )
+    return SimpleNamespace(
+        vectorstore=vectorstore,
+        # Same collection through the async psycopg driver, for graph.ainvoke/astream.
+        async_vectorstore=PGVector(
+            connection=get_engine("read", async_mode=True),
+            embeddings=embeddings,
+            collection_name="langchain",
+            pre_delete_collection=False,
+            async_mode=True,
+        ),
+        keyword_retriever=PgBestMatchRetriever(vectorstore=vectorstore, k=10),
+    )
+
+
+def _build_retriever(store, keyword_retriever):
+    # Dense hits carry their relevance score for the validator's gate.
+    if keyword_retriever is None:
+        return ScoredVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 5})
+    return HybridRetriever(
+        retrievers=[
+            ScoredVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 10}),
+            keyword_retriever,
+        ],
+        k=5,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_retrievers() -> SimpleNamespace:
+    """The stores and retrievers of VECTOR_BACKEND, built once per process."""
+    from models.llms import azure_embeddings, load_settings
+
+    # Read after .env is loaded.
+    load_settings()
+    # "pgvector" talks to Postgres; "local" is the in-process NumPy store persisted
+    # under LOCAL_VECTOR_STORE_PATH, for small corpora and hermetic tests.
+    backend = os.getenv("VECTOR_BACKEND", "pgvector")
+    build = _local_stores if backend == "local" else _pgvector_stores
+    stores = build(azure_embeddings)
+    # "hybrid" fuses vector similarity with BM25; "vector" is similarity only.
+    if os.getenv("RETRIEVAL_MODE", "hybrid") != "hybrid":
+        stores.keyword_retriever = None
+    stores.semantic_retriever = _build_retriever(stores.vectorstore, stores.keyword_retriever)
+    stores.async_semantic_retriever = _build_retriever(
+        stores.async_vectorstore, stores.keyword_retriever
+    )
+    return stores
+
+
+@lru_cache(maxsize=None)
+def get_ingest_vectorstore():
+    """
+    The store to write documents through. With pgvector it is the same
+    collection on the "ingest" connection pool, so bulk loads cannot starve
+    queries of connections; the local store is shared.
+    """
+    stores = get_retrievers()
+    if os.getenv("VECTOR_BACKEND", "pgvector") == "local":
+        return stores.vectorstore
+    from langchain_postgres import PGVector
+
+    from models.llms import azure_embeddings
+    from tools.db_pool import get_engine
+
+    return PGVector(
+        connection=get_engine("ingest"),
+        embeddings=azure_embeddings,
+        collection_name="langchain",
+        pre_delete_collection=False,
+    )
+
+
+_LAZY = {
+    "vectorstore",
+    "async_vectorstore",
+    "keyword_retriever",
+    "semantic_retriever",
+    "async_semantic_retriever",
+}
+
+
+def __getattr__(name: str):
+    if name == "ingest_vectorstore":
+        return get_ingest_vectorstore()
+    if name in _LAZY:
+        return getattr(get_retrievers(), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Scoped queries filter on cmetadata ->> 'course' / 'chapter' (PGVector's
+# translation of {"course": ..., "chapter": ...}); this B-tree lets Postgres
+# read only the scope's rows and rank those, so their cost follows the size
+# of the course rather than of the whole collection.
+SCOPE_INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS ix_langchain_pg_embedding_scope
+ON langchain_pg_embedding (collection_id, (cmetadata->>'course'), (cmetadata->>'chapter'))
+"""
+
+
+def ensure_scope_indexes() -> None:
+    """Create the course/chapter index of the pgvector collection if it is missing."""
+    if os.getenv("VECTOR_BACKEND", "pgvector") == "local":
+        # The local store indexes metadata values in memory on first filtered search.
+        return
+    from sqlalchemy import text
+
+    from tools.db_pool import get_engine
+
+    with get_engine("ingest").begin() as conn:
+        conn.execute(text(SCOPE_INDEX_SQL))
+
+
+def ensure_keyword_index() -> Optional[PgBestMatchRetriever]:
+    """
+    Create the pg_bestmatch extension, the `bm25` column and the BM25
+    statistics where missing; a no-op outside hybrid retrieval on pgvector.
+    """
+    if not isinstance(get_retrievers().keyword_retriever, PgBestMatchRetriever):
+        return None
+    # DDL and bulk UPDATEs: run them on the ingestion pool.
+    index = PgBestMatchRetriever(vectorstore=get_ingest_vectorstore(), k=10)
+    index.setup()
+    return index
+
+
+def refresh_keyword_index() -> None:
+    """Index documents added since the last refresh for BM25 search."""
+    stores = get_retrievers()
+    if isinstance(stores.keyword_retriever, PgBestMatchRetriever):
+        ensure_keyword_index().refresh()
+    elif isinstance(stores.keyword_retriever, LocalBM25Retriever):
+        stores.keyword_retriever.index = LocalBM25Index(
+            [doc for _, doc in stores.vectorstore.iter_documents()]
+        )
@@ -0,0 +1,222 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from langchain.schema import Document
+from langchain_core.callbacks import AsyncCallbackManagerForToolRun, CallbackManagerForToolRun
+from langchain_core.tools import BaseTool
+from pydantic import ConfigDict, PrivateAttr
+from utils.telemetry import get_logger
+
+log = get_logger("search_cache")
+
+_NON_WORD = re.compile(r"[^\w\s+\-.]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a search query."""
+    return _WHITESPACE.sub(" ", _NON_WORD.sub(" ", str(query).lower())).strip(" .-")
+
+
+class SearchCache:
+    """
+    SQLite-backed web search result cache shared across conversations and
+    processes. Entries expire after `ttl` seconds; beyond `max_entries` the
+    least recently read entries are evicted.
+    """
+
+    def __init__(self, path: str = ".search_cache.sqlite", ttl: float = 86400.0, max_entries: int = 10_000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._open_lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.hits = 0
+        self.misses = 0
+        self.writebacks = 0
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """The SQLite connection, opened (and the table created) on first use."""
+        if self._db is None:
+            # Not self._lock: callers already hold it.
+            with self._open_lock:
+                if self._db is None:
+                    conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        """CREATE TABLE IF NOT EXISTS search_cache (
+                            key TEXT PRIMARY KEY,
+                            results TEXT NOT NULL,
+                            created_at REAL NOT NULL,
+                            accessed_at REAL NOT NULL
+                        )"""
+                    )
+                    conn.execute(
+                        "CREATE INDEX IF NOT EXISTS search_cache_accessed ON search_cache (accessed_at)"
+                    )
+                    self._db = conn
+        return self._db
+
+    def get(self, query: str) -> Optional[List[dict]]:
+        key = normalize_query(query)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT results, created_at FROM search_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE search_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, query: str, results: List[dict]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?, ?)",
+                (normalize_query(query), json.dumps(results), now, now),
+            )
+            self._conn.execute(
+                """DELETE FROM search_cache WHERE key IN (
+                    SELECT key FROM search_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": self._conn.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0],
+            "avoided_search_calls": self.hits,
+            "search_calls": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "writebacks": self.writebacks,
+        }
+
+
+def results_to_documents(query: str, results: List[dict]) -> List[Document]:
+    return [
+        Document(
+            page_content=result["content"],
+            metadata={"source": result.get("url", ""), "origin": "web_search", "query": query},
+        )
+        for result in results
+        if isinstance(result, dict) and result.get("content")
+    ]
+
+
+class CachedSearchTool(BaseTool):
+    """
+    Wraps a search tool (TavilySearchResults) with a SearchCache. Fresh
+    results are also written back into the vector store, so later first-pass
+    retrievals can find them without searching again.
+
+    On the async path the SQLite cache runs in worker threads and the
+    writeback in a background task, so neither blocks the event loop; past
+    `max_pending_writebacks` tasks a writeback is awaited in line instead.
+    """
+
+    tool: BaseTool
+    cache: SearchCache
+    writeback: bool = True
+    vectorstore: Any = None
+    max_pending_writebacks: int = 8
+
+    _pending: Set[asyncio.Task] = PrivateAttr(default_factory=set)
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def __init__(self, tool: BaseTool, cache: SearchCache, **kwargs: Any):
+        super().__init__(
+            tool=tool, cache=cache, name=tool.name, description=tool.description, **kwargs
+        )
+
+    def _store(self):
+        if self.vectorstore is None:
+            from tools.retrivers import ingest_vectorstore
+
+            self.vectorstore = ingest_vectorstore
+        return self.vectorstore
+
+    def _writeback_docs(self, query: str, results: List[dict]):
+        docs = results_to_documents(query, results)
+        ids = [
+            hashlib.sha256(f"{doc.metadata['source']}\0{doc.page_content}".encode()).hexdigest()
+            for doc in docs
+        ]
+        return docs, ids
+
+    def _writeback(self, query: str, results: List[dict]) -> None:
+        docs, ids = self._writeback_docs(query, results)
+        if not (self.writeback and docs):
+            return
+        try:
+            self._store().add_documents(docs, ids=ids)
+            self.cache.writebacks += len(docs)
+        except Exception as e:
+            log.warning("search_cache.writeback_failed", error=str(e))
+
+    async def _awriteback(self, query: str, results: List[dict]) -> None:
+        docs, ids = self._writeback_docs(query, results)
+        if not (self.writeback and docs):
+            return
+        try:
+            await self._store().aadd_documents(docs, ids=ids)
+            self.cache.writebacks += len(docs)
+        except Exception as e:
+            log.warning("search_cache.writeback_failed", error=str(e))
+
+    def _run(
+        self, query: str, run_manager: Optional[CallbackManagerForToolRun] = None, **kwargs: Any
+    ) -> List[dict]:
+        results = self.cache.get(query)
+        if results is None:
+            # A miss runs the wrapped tool as a child run, so it shows up in traces.
+            results = self.tool.invoke(query, {"callbacks": run_manager.get_child() if run_manager else None})
+            if isinstance(results, list):
+                self.cache.put(query, results)
+                self._writeback(query, results)
+        return results
+
+    async def _arun(
+        self, query: str, run_manager: Optional[AsyncCallbackManagerForToolRun] = None, **kwargs: Any
+    ) -> List[dict]:
+        results = await asyncio.to_thread(self.cache.get, query)
+        if results is None:
+            results = await self.tool.ainvoke(
+                query, {"callbacks": run_manager.get_child() if run_manager else None}
+            )
+            if isinstance(results, list):
+                await asyncio.to_thread(self.cache.put, query, results)
+                if len(self._pending) >= self.max_pending_writebacks:
+                    await self._awriteback(query, results)
+                else:
+                    task = asyncio.create_task(self._awriteback(query, results))
+                    self._pending.add(task)
+                    task.add_done_callback(self._pending.discard)
+        return results
+
+    async def drain(self) -> None:
+        """Wait for the background writebacks started so far."""
+        if self._pending:
+            await asyncio.gather(*self._pending)
+
+
+search_cache = SearchCache(
+    path=os.getenv("SEARCH_CACHE_PATH", ".search_cache.sqlite"),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "86400")),
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "10000")),
+)
@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+CORPUS_VERSION_FILE = os.getenv("CORPUS_VERSION_FILE", ".corpus_version")
+
+
+def bump_corpus_version() -> None:
+    """Mark the vector store as changed; every process's answer cache drops its entries."""
+    with open(CORPUS_VERSION_FILE, "w") as f:
+        f.write(str(time.time_ns()))
+
+
+def get_corpus_version() -> int:
+    """Current corpus version (the mtime of the version file, 0 if never bumped)."""
+    try:
+        return os.stat(CORPUS_VERSION_FILE).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+
+def scoped_option(option: str, scope: Optional[Dict[str, str]] = None) -> str:
+    """The cache partition of an option: a scoped answer only serves the same scope."""
+    if not scope:
+        return option
+    return option + "|" + "|".join(f"{key}={value}" for key, value in sorted(scope.items()))
+
+
+@dataclass
+class CacheEntry:
+    query: str
+    vector: np.ndarray
+    answer: str
+    latency: float
+    created_at: float
+    corpus_version: int
+
+
+class SemanticCache:
+    """
+    Answer cache in front of the graph, keyed on the query embedding and the
+    task option. A lookup hits when a cached query with the same option has
+    cosine similarity >= `threshold`, is younger than `ttl` seconds and was
+    answered against the current corpus version; the best match is taken
+    among those rows only. Entries are evicted LRU once `max_entries` is
+    reached.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        threshold: float = 0.95,
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+    ):
+        self._embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._matrices: Dict[str, tuple] = {}
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._corpus_version = get_corpus_version()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    @property
+    def embeddings(self) -> Embeddings:
+        if self._embeddings is None:
+            from models.llms import azure_embeddings
+
+            self._embeddings = azure_embeddings
+        return self._embeddings
+
+    def _cached_vector(self, query: str) -> Optional[np.ndarray]:
+        with self._lock:
+            return self._vectors.get(query)
+
+    def _remember_vector(self, query: str, vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with self._lock:
+            self._vectors[query] = vector
+            if len(self._vectors) > 256:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = self._cached_vector(query)
+        if vector is None:
+            vector = self._remember_vector(query, self.embeddings.embed_query(query))
+        return vector
+
+    async def _aembed(self, query: str) -> np.ndarray:
+        vector = self._cached_vector(query)
+        if vector is None:
+            vector = self._remember_vector(
+                query, await self.embeddings.aembed_query(query)
+            )
+        return vector
+
+    def _check_corpus_version(self) -> None:
+        version = get_corpus_version()
+        if version != self._corpus_version:
+            self._entries.clear()
+            self._matrices.clear()
+            self._corpus_version = version
+
+    def _matrix(self, option: str):
+        cached = self._matrices.get(option)
+        if cached is None:
+            keys = [key for key in self._entries if key[0] == option]
+            entries = [self._entries[key] for key in keys]
+            matrix = np.stack([entry.vector for entry in entries]) if entries else None
+            created = np.array([entry.created_at for entry in entries])
+            versions = np.array([entry.corpus_version for entry in entries], dtype=np.int64)
+            cached = self._matrices[option] = (keys, matrix, created, versions)
+        return cached
+
+    def _search(self, option: str, vector: np.ndarray) -> Optional[str]:
+        with self._lock:
+            self._check_corpus_version()
+            keys, matrix, created, versions = self._matrix(option)
+            if matrix is not None:
+                live = (time.time() - created <= self.ttl) & (versions == self._corpus_version)
+                for position in np.flatnonzero(~live):
+                    self._evict(keys[position])
+                scores = np.where(live, matrix @ vector, -np.inf)
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = self._entries[keys[best]]
+                    self._entries.move_to_end(keys[best])
+                    self.hits += 1
+                    self.latency_saved += entry.latency
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def _evict(self, key: tuple) -> None:
+        self._entries.pop(key, None)
+        self._matrices.pop(key[0], None)
+
+    def _insert(
+        self,
+        query: str,
+        option: str,
+        vector: np.ndarray,
+        answer: str,
+        latency: float,
+        corpus_version: Optional[int],
+    ) -> None:
+        with self._lock:
+            self._check_corpus_version()
+            if corpus_version is None:
+                corpus_version = self._corpus_version
+            key = (option, query)
+            self._entries[key] = CacheEntry(query, vector, answer, latency, time.time(), corpus_version)
+            self._entries.move_to_end(key)
+            self._matrices.pop(option, None)
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+
+    def lookup(self, query: str, option: str) -> Optional[str]:
+        return self._search(option, self._embed(query))
+
+    async def alookup(self, query: str, option: str) -> Optional[str]:
+        return self._search(option, await self._aembed(query))
+
+    def store(
+        self, query: str, option: str, answer: str, latency: float, corpus_version: Optional[int] = None
+    ) -> None:
+        """
+        Cache `answer`. `corpus_version` is the version it was computed
+        against (get_corpus_version() before running the graph), by default
+        the current one; an answer from an older corpus never hits.
+        """
+        self._insert(query, option, self._embed(query), answer, latency, corpus_version)
+
+    async def astore(
+        self, query: str, option: str, answer: str, latency: float, corpus_version: Optional[int] = None
+    ) -> None:
+        self._insert(query, option, await self._aembed(query), answer, latency, corpus_version)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+
+    def metrics(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
+
+
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024")),
+)
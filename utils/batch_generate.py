@@ -0,0 +1,353 @@
+"""
+Batch generation of flashcard decks and quiz banks for a course or chapter.
+
+The chapter's chunks are read straight from the vector store, in page order
+and a page of rows at a time, and grouped into windows of at most
+`max_tokens` tokens that never span two chapters. Each window is sent to
+the registered "flashcard" / "quiz" agents (nodes.task_agents), up to
+`concurrency` at once, under a requests-per-minute limit, with retries and
+exponential backoff. Each call may write up to `output_tokens` tokens, far
+more than an interactive answer; a reply cut off at that limit is recorded
+as an error, not retried. Results are appended to a JSONL file as they complete;
+a re-run skips the (kind, window) pairs already written, so an interrupted
+job resumes where it stopped. Only a bounded queue of windows is held in
+memory, whatever the size of the course.
+
+    python -m utils.batch_generate --course "Computer Architecture" --chapter RISC-V \\
+        --kinds flashcard quiz --output riscv.jsonl
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+
+from tools.context_builder import count_tokens
+from utils.telemetry import get_logger
+
+log = get_logger("batch")
+
+KINDS = ("flashcard", "quiz")
+INSTRUCTIONS = {
+    "flashcard": "Create a deck of flashcards (question and answer) covering every key concept in these notes from {chapter}.",
+    "quiz": "Create multiple-choice quiz questions with answers covering every key concept in these notes from {chapter}.",
+}
+
+
+@dataclass
+class Window:
+    """Consecutive chunks of one chapter, sent to the agents as one prompt."""
+
+    course: str
+    chapter: str
+    chunk_ids: List[str]
+    docs: List[Document]
+    tokens: int
+
+    @property
+    def id(self) -> str:
+        return hashlib.sha256("\0".join(self.chunk_ids).encode()).hexdigest()[:24]
+
+    def text(self) -> str:
+        return "\n\n".join(doc.page_content for doc in self.docs)
+
+    def describe(self) -> dict:
+        pages = [doc.metadata["page"] for doc in self.docs if doc.metadata.get("page") is not None]
+        return {
+            "course": self.course,
+            "chapter": self.chapter,
+            "window": self.id,
+            "sources": sorted({doc.metadata["source"] for doc in self.docs if doc.metadata.get("source")}),
+            "pages": [min(pages), max(pages)] if pages else None,
+            "chunks": len(self.docs),
+            "tokens": self.tokens,
+        }
+
+
+def _scope_filter(course: str, chapter: Optional[str]) -> dict:
+    return {"course": course, **({"chapter": chapter} if chapter else {})}
+
+
+def _iter_pgvector(store, scope: dict, page_size: int) -> Iterator[Tuple[str, Document]]:
+    """Keyset-paginated scan of the scope's rows, ordered by chapter, source and page."""
+    from sqlalchemy import text
+
+    conditions = " AND ".join(f"e.cmetadata->>'{key}' = :{key}" for key in scope)
+    sql = text(
+        f"""
+        SELECT e.id, e.document, e.cmetadata,
+               coalesce(e.cmetadata->>'chapter', '') AS chapter,
+               coalesce(e.cmetadata->>'source', '') AS source,
+               coalesce((e.cmetadata->>'page')::int, -1) AS page
+        FROM langchain_pg_embedding e
+        JOIN langchain_pg_collection c ON e.collection_id = c.uuid
+        WHERE c.name = :collection AND {conditions}
+          AND (coalesce(e.cmetadata->>'chapter', ''), coalesce(e.cmetadata->>'source', ''),
+               coalesce((e.cmetadata->>'page')::int, -1), e.id) > (:chapter_key, :source_key, :page_key, :id_key)
+        ORDER BY 4, 5, 6, e.id
+        LIMIT :limit
+        """
+    )
+    key = ("", "", -2, "")
+    while True:
+        with store.session_maker() as session:
+            rows = session.execute(
+                sql,
+                {
+                    **scope,
+                    "collection": store.collection_name,
+                    "chapter_key": key[0],
+                    "source_key": key[1],
+                    "page_key": key[2],
+                    "id_key": key[3],
+                    "limit": page_size,
+                },
+            ).fetchall()
+        for id_, document, metadata, *_ in rows:
+            yield id_, Document(page_content=document, metadata=metadata or {})
+        if len(rows) < page_size:
+            return
+        last = rows[-1]
+        key = (last.chapter, last.source, last.page, last.id)
+
+
+def iter_scope_chunks(
+    course: str, chapter: Optional[str] = None, vectorstore=None, page_size: int = 256
+) -> Iterator[Tuple[str, Document]]:
+    """(id, chunk) pairs of a course, or of one of its chapters, from the vector store."""
+    if vectorstore is None:
+        from tools.retrivers import ingest_vectorstore as vectorstore
+    scope = _scope_filter(course, chapter)
+    if hasattr(vectorstore, "iter_documents"):
+        return iter(vectorstore.iter_documents(filter=scope))
+    return _iter_pgvector(vectorstore, scope, page_size)
+
+
+def token_windows(
+    chunks: Iterable[Tuple[str, Document]], course: str, max_tokens: int = 1500
+) -> Iterator[Window]:
+    """Group consecutive chunks into windows of at most `max_tokens`, split at chapter changes."""
+    window: Optional[Window] = None
+    for id_, doc in chunks:
+        chapter = doc.metadata.get("chapter", "")
+        tokens = count_tokens(doc.page_content)
+        if window is not None and (window.chapter != chapter or window.tokens + tokens > max_tokens):
+            yield window
+            window = None
+        if window is None:
+            window = Window(course, chapter, [], [], 0)
+        window.chunk_ids.append(id_)
+        window.docs.append(doc)
+        window.tokens += tokens
+    if window is not None:
+        yield window
+
+
+def completed(path: str) -> Set[Tuple[str, str]]:
+    """(kind, window) pairs already generated in the JSONL output at `path`."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The partial last line of an interrupted run.
+                continue
+            if "error" not in record:
+                done.add((record["kind"], record["window"]))
+    return done
+
+
+class RateLimiter:
+    """At most `per_minute` acquisitions per rolling minute, spaced evenly."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class BatchStats:
+    windows: int = 0
+    generated: int = 0
+    skipped: int = 0
+    failed: int = 0
+    retries: int = 0
+    seconds: float = 0.0
+    per_kind: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def items_per_minute(self) -> float:
+        return self.generated * 60 / self.seconds if self.seconds else 0.0
+
+    def report(self) -> str:
+        # ru_maxrss is in KiB on Linux, bytes on macOS.
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (
+            1024 * 1024 if sys.platform == "darwin" else 1024
+        )
+        return (
+            f"{self.windows} windows: {self.generated} generated, {self.skipped} already done, "
+            f"{self.failed} failed ({self.retries} retries) in {self.seconds:.1f}s: "
+            f"{self.items_per_minute:.1f} items/min, peak RSS {peak_mb:.0f} MB"
+        )
+
+
+class OutputTruncated(Exception):
+    """The model stopped at its completion token limit."""
+
+
+async def _generate(kind: str, window: Window, config: dict) -> str:
+    from models.model_registry import FinishReasons
+    from nodes.agent_registry import agent_registry
+    import nodes.task_agents  # noqa: F401  registers the task agents
+    from states.states import AgentState
+
+    instruction = INSTRUCTIONS[kind].format(chapter=window.chapter or window.course)
+    state = AgentState.start_turn(None, instruction, kind, 0)
+    inputs = {"input": instruction, "retrieved_docs": window.text(), "agent_scratchpad": []}
+    finish = FinishReasons()
+    output = await agent_registry.ainvoke(kind, state, inputs, {**config, "callbacks": [finish]})
+    if finish.truncated:
+        limit = config["configurable"]["max_tokens"]
+        raise OutputTruncated(f"output cut off at max_tokens={limit} after {len(output)} characters")
+    return output
+
+
+async def agenerate_batch(
+    course: str,
+    output: str,
+    chapter: Optional[str] = None,
+    kinds: Iterable[str] = KINDS,
+    vectorstore=None,
+    max_tokens: int = 1500,
+    concurrency: int = 8,
+    requests_per_minute: float = 0.0,
+    retries: int = 3,
+    backoff: float = 1.0,
+    model_name: Optional[str] = None,
+    output_tokens: int = 4096,
+) -> BatchStats:
+    """
+    Generate every kind for every window of the course (or chapter) into
+    `output`, skipping what a previous run already wrote there.
+    """
+    kinds = list(kinds)
+    stats = BatchStats(per_kind={kind: 0 for kind in kinds})
+    done = completed(output)
+    limiter = RateLimiter(requests_per_minute)
+    configurable = {"max_tokens": output_tokens, **({"model_name": model_name} if model_name else {})}
+    config = {"configurable": configurable}
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    windows = token_windows(iter_scope_chunks(course, chapter, vectorstore), course, max_tokens)
+    start = time.perf_counter()
+
+    async def produce():
+        # The store is read in a thread so a page fetch doesn't stall the workers.
+        while (window := await asyncio.to_thread(next, windows, None)) is not None:
+            stats.windows += 1
+            for kind in kinds:
+                if (kind, window.id) in done:
+                    stats.skipped += 1
+                else:
+                    await queue.put((kind, window))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work(f):
+        while (item := await queue.get()) is not None:
+            kind, window = item
+            record = {"kind": kind, **window.describe()}
+            for attempt in range(retries + 1):
+                await limiter.acquire()
+                call_start = time.perf_counter()
+                try:
+                    record["output"] = await _generate(kind, window, config)
+                    record["seconds"] = round(time.perf_counter() - call_start, 3)
+                    record.pop("error", None)
+                    break
+                except OutputTruncated as e:
+                    # The same limit would cut the same reply off again.
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    break
+                except Exception as e:
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    if attempt < retries:
+                        stats.retries += 1
+                        delay = backoff * 2**attempt * (0.5 + random.random())
+                        log.warning("batch.retry", kind=kind, window=window.id, attempt=attempt + 1,
+                                    delay=round(delay, 2), error=record["error"])
+                        await asyncio.sleep(delay)
+            record["attempts"] = attempt + 1
+            if "error" in record:
+                stats.failed += 1
+                log.error("batch.failed", kind=kind, window=window.id, error=record["error"])
+            else:
+                stats.generated += 1
+                stats.per_kind[kind] += 1
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+
+    with open(output, "a") as f:
+        await asyncio.gather(produce(), *(work(f) for _ in range(concurrency)))
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def generate_batch(*args, **kwargs) -> BatchStats:
+    """Synchronous entry point for agenerate_batch."""
+    return asyncio.run(agenerate_batch(*args, **kwargs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate flashcards/quizzes for a course or chapter.")
+    parser.add_argument("--course", required=True)
+    parser.add_argument("--chapter", help="one chapter (default: every chapter of the course)")
+    parser.add_argument("--kinds", nargs="+", default=list(KINDS), choices=KINDS)
+    parser.add_argument("--output", required=True, help="JSONL file, appended to and resumed from")
+    parser.add_argument("--max-tokens", type=int, default=1500, help="chunk tokens per window")
+    parser.add_argument("--output-tokens", type=int, default=4096, help="completion tokens per call")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=float, default=0.0, help="model requests per minute, 0 for no limit")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--model-name", help="model provider (default: MODEL_PROVIDER)")
+    args = parser.parse_args()
+
+    stats = generate_batch(
+        args.course,
+        args.output,
+        chapter=args.chapter,
+        kinds=args.kinds,
+        max_tokens=args.max_tokens,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        retries=args.retries,
+        model_name=args.model_name,
+        output_tokens=args.output_tokens,
+    )
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 from langchain.schema import Document
-import PyPDF2
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from typing import List
-from tools.retrivers import vectorstore, semantic_retriever as retriever
-
-from langchain_community.document_loaders import PyPDFLoader
+from states.states import retrieval_scope
+from tools.semantic_cache import bump_corpus_version
+from utils.ingest import ingest_pdfs
 
 
 def insert_to_db(
@@ -27,34 +26,24 @@ def insert_to_db(
         if chunk.page_content and "\x00" not in chunk.page_content
     ]
 
+    from tools.retrivers import ingest_vectorstore as vectorstore
+
     vectorstore.add_documents(chunks)
+    bump_corpus_version()
 
 
 def search_documents(query: str, course: str = None, chapter: str = None) -> str:
-    search_kwargs = {"k": 5}
-    if course or chapter:
-        filter_dict = {}
-        if course:
-            filter_dict["course"] = course
-        if chapter:
-            filter_dict["chapter"] = chapter
-        search_kwargs["filter"] = filter_dict
-    docs = retriever.invoke(query, **search_kwargs)
-    return "\n".join(doc.page_content + "\n" for doc in docs)
+    from tools.hybrid_retriever import scoped
+    from tools.retrivers import semantic_retriever
 
-
-def extract_text_from_pdf(pdf_path: str) -> str:
-    pdf = PyPDFLoader(pdf_path)
-    string = ""
-    for page in pdf.lazy_load():
-        string += page.page_content
-    return string
+    # A real metadata filter, pushed down into the vector and keyword searches.
+    docs = scoped(semantic_retriever, retrieval_scope(course, chapter)).invoke(query)
+    return "\n".join(doc.page_content + "\n" for doc in docs)
 
 
 def populate_with_pdf(pdf_path: str, course: str, chapter: str):
-    text = extract_text_from_pdf(pdf_path)
-    print(f"Extracted text from {chapter}:\n{text}")
-    insert_to_db(text, course, chapter)
+    stats = ingest_pdfs([pdf_path], course, chapters={pdf_path: chapter})
+    print(f"Ingested {chapter}: {stats.report()}")
 
 
 # pdf1 = "/Users/hasibulhasan/github/rag_server/test_pdfs/Lecture-1(Intro to Microprocessors).pdf"
@@ -66,8 +55,9 @@ def populate_with_pdf(pdf_path: str, course: str, chapter: str):
 
 # print("Database populated")
 
-print(
-    search_documents(
-        "amdahl's law", course="Computer Architecture", chapter="Chapter 1"
+if __name__ == "__main__":
+    print(
+        search_documents(
+            "amdahl's law", course="Computer Architecture", chapter="Chapter 1"
+        )
     )
-)
@@ -0,0 +1,311 @@
+"""
+Deterministic in-process stand-ins for the Azure chat/embedding models and the
+Tavily search tool, plus a LocalVectorStore in place of PGVector, for
+benchmarks and load tests.
+"""
+
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+import types
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional, Sequence
+
+from langchain.schema import Document
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from tools.local_vectorstore import LocalVectorStore
+from tools.hybrid_retriever import (
+    HybridRetriever,
+    LocalBM25Index,
+    LocalBM25Retriever,
+    ScoredVectorStoreRetriever,
+)
+
+_TOKEN = re.compile(r"\w+")
+_STREAM_TOKEN = re.compile(r"\s*\S+")
+
+
+def default_responder(messages: List[BaseMessage]) -> str:
+    """
+    Validator prompts get a YES verdict, the memory summarizer the start of
+    its summary and new lines, everything else a short canned answer.
+    """
+    system = messages[0].content if messages else ""
+    if "validation agent" in system:
+        return json.dumps({"verdict": "YES", "missing_topics": [], "queries": []})
+    if "summarize a conversation" in system:
+        return " ".join(messages[-1].content.split()[:60])
+    # Task prompts end with the question then the retrieved docs, after any chat history.
+    humans = [m.content for m in messages[1:] if m.type == "human"]
+    question = humans[-2] if len(humans) > 1 else (humans[-1] if humans else "")
+    return f"Answer based on the retrieved documents for: {question}"[:400]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that sleeps for `latency` seconds and answers via `responder`.
+    With tools bound (e.g. through with_structured_output) the reply is parsed
+    as JSON arguments for a call to the first tool.
+
+    Streamed replies arrive one word at a time: `latency` is the time to the
+    first token and `token_latency` the gap between tokens; a non-streamed
+    call waits for the same total before returning.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    responder: Optional[Callable[[List[BaseMessage]], str]] = None
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def bind_tools(self, tools: Sequence[Any], tool_choice: Any = None, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _result(self, messages: List[BaseMessage], tools: Optional[list] = None) -> ChatResult:
+        self.calls += 1
+        content = (self.responder or default_responder)(messages)
+        if tools:
+            try:
+                args = json.loads(content)
+            except ValueError:
+                args = {}
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {"name": tools[0]["function"]["name"], "args": args, "id": f"call_{self.calls}"}
+                ],
+            )
+        else:
+            message = AIMessage(content=content)
+        # One token per word, so routing benchmarks see plausible token counts.
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(content.split())
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> List[AIMessageChunk]:
+        if message.tool_calls:
+            call = message.tool_calls[0]
+            chunks = [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": 0}
+                    ],
+                )
+            ]
+        else:
+            chunks = [AIMessageChunk(content=token) for token in _STREAM_TOKEN.findall(message.content)]
+        chunks = chunks or [AIMessageChunk(content="")]
+        chunks[-1].usage_metadata = message.usage_metadata
+        return chunks
+
+    def _total_latency(self, result: ChatResult) -> float:
+        return self.latency + self.token_latency * max(
+            0, len(self._chunks(result.generations[0].message)) - 1
+        )
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self._result(messages, kwargs.get("tools"))
+        if self.latency or self.token_latency:
+            time.sleep(self._total_latency(result))
+        return result
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        result = self._result(messages, kwargs.get("tools"))
+        if self.latency or self.token_latency:
+            await asyncio.sleep(self._total_latency(result))
+        return result
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        result = self._result(messages, kwargs.get("tools"))
+        time.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(result.generations[0].message)):
+            if i and self.token_latency:
+                time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        result = self._result(messages, kwargs.get("tools"))
+        await asyncio.sleep(self.latency)
+        for i, chunk in enumerate(self._chunks(result.generations[0].message)):
+            if i and self.token_latency:
+                await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=chunk)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Hashed bag-of-words embeddings: deterministic, and texts sharing words
+    really are closer, so similarity thresholds behave sensibly in benchmarks.
+    """
+
+    def __init__(self, size: int = 256, latency: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.calls = 0
+        self.texts_embedded = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for token in _TOKEN.findall(text.lower()):
+            digest = hashlib.md5(token.encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % self.size] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            time.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        self.texts_embedded += len(texts)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class FakeSearchTool(BaseTool):
+    """Drop-in for TavilySearchResults returning synthetic results after `latency` seconds."""
+
+    name: str = "tavily_search_results_json"
+    description: str = "Fake web search returning canned results."
+    latency: float = 0.0
+    max_results: int = 3
+    calls: int = 0
+
+    def _results(self, query: str) -> List[dict]:
+        self.calls += 1
+        return [
+            {
+                "url": f"https://example.com/{i}?q={query}",
+                "content": f"Search result {i} about {query}.",
+            }
+            for i in range(self.max_results)
+        ]
+
+    def _run(self, query: str, **kwargs: Any) -> List[dict]:
+        if self.latency:
+            time.sleep(self.latency)
+        return self._results(query)
+
+    async def _arun(self, query: str, **kwargs: Any) -> List[dict]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._results(query)
+
+
+def install_fake_backends(
+    chat_model: Optional[BaseChatModel] = None,
+    embeddings: Optional[Embeddings] = None,
+    search_tool: Optional[BaseTool] = None,
+    documents: Optional[List[Document]] = None,
+) -> types.SimpleNamespace:
+    """
+    Point `models.llms`, the model registry, `tools.retrivers` and the search
+    node at fakes.
+
+    Must run before the first graph run or `graph.startup()`: the real
+    clients are only resolved from those modules on first use.
+    """
+    chat_model = chat_model or FakeChatModel()
+    embeddings = embeddings or FakeEmbeddings()
+    search_tool = search_tool or FakeSearchTool()
+
+    os.environ.setdefault("TAVILY_API_KEY", "fake")
+    os.environ.setdefault("SEARCH_CACHE_PATH", ":memory:")
+    os.environ.setdefault("CHECKPOINT_DB", ":memory:")
+
+    llms = types.ModuleType("models.llms")
+    llms.model = chat_model
+    llms.azure_embeddings = embeddings
+    sys.modules["models.llms"] = llms
+
+    from models.model_registry import model_registry
+
+    model_registry.use_fake(chat_model)
+
+    store = LocalVectorStore(embeddings)
+    if documents:
+        store.add_documents(documents)
+    retriever = HybridRetriever(
+        retrievers=[
+            ScoredVectorStoreRetriever(vectorstore=store, search_kwargs={"k": 10}),
+            LocalBM25Retriever(index=LocalBM25Index(documents or []), k=10),
+        ],
+        k=5,
+    )
+    retrivers = types.ModuleType("tools.retrivers")
+    retrivers.vectorstore = retrivers.async_vectorstore = retrivers.ingest_vectorstore = store
+    retrivers.semantic_retriever = retrivers.async_semantic_retriever = retriever
+    retrivers.keyword_retriever = retriever.retrievers[1]
+    retrivers.refresh_keyword_index = retrivers.ensure_scope_indexes = retrivers.ensure_keyword_index = lambda: None
+    sys.modules["tools.retrivers"] = retrivers
+
+    import nodes.search_agent
+    from tools.search_cache import CachedSearchTool, SearchCache
+
+    search_cache = SearchCache(":memory:")
+    nodes.search_agent.tool = CachedSearchTool(search_tool, search_cache, vectorstore=store)
+
+    return types.SimpleNamespace(
+        chat_model=chat_model,
+        embeddings=embeddings,
+        search_tool=search_tool,
+        search_cache=search_cache,
+        vectorstore=store,
+    )
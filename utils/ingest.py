@@ -0,0 +1,289 @@
+"""
+Streaming PDF ingestion into the vector store.
+
+Pages are extracted lazily in a process pool, with a bounded number of
+pages in flight, split per page, and written in bounded batches, so memory
+stays flat regardless of corpus size. Every chunk is identified by a hash
+of its source file and content; a manifest of the hashes per source file
+lets a re-run embed only new or changed chunks and delete stale ones. The
+manifest is saved as each file is fully written, so an interrupted run
+resumes after the last complete file.
+
+    python -m utils.ingest test_pdfs/ --course "Computer Architecture"
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain.schema import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from pypdf import PdfReader
+
+DEFAULT_MANIFEST = ".ingest_manifest.json"
+
+_readers: Dict[str, PdfReader] = {}
+
+
+def _page_count(pdf_path: str) -> int:
+    return len(PdfReader(pdf_path).pages)
+
+
+def _extract_page(task: Tuple[str, int]) -> Tuple[str, int, str]:
+    """Runs in a worker process; keeps one open reader per file."""
+    pdf_path, page_number = task
+    reader = _readers.get(pdf_path)
+    if reader is None:
+        reader = _readers[pdf_path] = PdfReader(pdf_path)
+    return pdf_path, page_number, reader.pages[page_number].extract_text() or ""
+
+
+def iter_pages(
+    pdf_paths: List[str], workers: Optional[int] = None, window: Optional[int] = None
+) -> Iterator[Tuple[str, int, str]]:
+    """
+    Yield (path, page_number, text) in document order, extracted in parallel.
+    At most `window` pages (4 per worker by default) are submitted or waiting
+    to be consumed at any time.
+    """
+    tasks = (
+        (path, page_number)
+        for path in pdf_paths
+        for page_number in range(_page_count(path))
+    )
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque(pool.submit(_extract_page, task) for task in islice(tasks, window or 4 * workers))
+        while pending:
+            page = pending.popleft().result()
+            # Refill before yielding, so the workers stay busy while the caller embeds.
+            for task in islice(tasks, 1):
+                pending.append(pool.submit(_extract_page, task))
+            yield page
+
+
+def chunk_id(path: str, chunk: Document) -> str:
+    metadata = chunk.metadata
+    key = f"{path}\0{metadata['course']}\0{metadata['chapter']}\0{chunk.page_content}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def iter_chunks(
+    pages: Iterable[Tuple[str, int, str]],
+    course: str,
+    chapters: Dict[str, str],
+    chunk_size: int = 500,
+    chunk_overlap: int = 200,
+) -> Iterator[Tuple[str, Document]]:
+    """Yield (path, chunk) pairs, splitting each page as it arrives."""
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size, chunk_overlap=chunk_overlap
+    )
+    for path, page_number, text in pages:
+        document = Document(
+            page_content=text,
+            metadata={
+                "course": course,
+                "chapter": chapters[path],
+                "source": os.path.basename(path),
+                "page": page_number,
+            },
+        )
+        for chunk in text_splitter.split_documents([document]):
+            if chunk.page_content and "\x00" not in chunk.page_content:
+                yield path, chunk
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class IngestManifest:
+    """
+    Chunk ids already in the vector store, per source file. `pending_refresh`
+    records that the store changed since the keyword index was last
+    refreshed, so a run that was interrupted before refreshing it is finished
+    by the next one.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST):
+        self.path = path
+        self.sources: Dict[str, List[str]] = {}
+        self.pending_refresh = False
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            # Manifests written before pending_refresh are the bare sources mapping.
+            if isinstance(data.get("sources"), dict):
+                self.sources = data["sources"]
+                self.pending_refresh = bool(data.get("pending_refresh"))
+            else:
+                self.sources = data
+
+    def known(self, source: str) -> Set[str]:
+        return set(self.sources.get(source, []))
+
+    def save(self) -> None:
+        """Replace the manifest atomically: a crash leaves the old or the new one."""
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"sources": self.sources, "pending_refresh": self.pending_refresh}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+@dataclass
+class IngestStats:
+    pages: int = 0
+    chunks: int = 0
+    embedded: int = 0
+    deleted: int = 0
+    seconds: float = 0.0
+    sources: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def report(self) -> str:
+        seconds = self.seconds or 1e-9
+        return (
+            f"{self.pages} pages, {self.chunks} chunks "
+            f"({self.embedded} embedded, {self.chunks - self.embedded} unchanged, "
+            f"{self.deleted} deleted) in {self.seconds:.1f}s: "
+            f"{self.pages / seconds:.1f} pages/s, {self.chunks / seconds:.1f} chunks/s"
+        )
+
+
+def ingest_pdfs(
+    pdf_paths: List[str],
+    course: str,
+    chapters: Optional[Dict[str, str]] = None,
+    vectorstore=None,
+    manifest: Optional[IngestManifest] = None,
+    batch_size: int = 64,
+    workers: Optional[int] = None,
+    chunk_size: int = 500,
+    chunk_overlap: int = 200,
+) -> IngestStats:
+    """
+    Ingest `pdf_paths` under `course`; `chapters` maps a path to its chapter
+    name and defaults to the file name without extension.
+    """
+    refresh_keyword_index = ensure_scope_indexes = None
+    if vectorstore is None:
+        from tools.retrivers import (
+            ensure_scope_indexes,
+            ingest_vectorstore as vectorstore,
+            refresh_keyword_index,
+        )
+    manifest = manifest or IngestManifest()
+    chapters = chapters or {}
+    chapters = {
+        path: chapters.get(path) or os.path.splitext(os.path.basename(path))[0]
+        for path in pdf_paths
+    }
+    pdf_paths = [os.path.abspath(path) for path in pdf_paths]
+    chapters = {os.path.abspath(path): chapter for path, chapter in chapters.items()}
+    known = {path: manifest.known(path) for path in pdf_paths}
+    stats = IngestStats(sources={path: set() for path in pdf_paths})
+    position = {path: index for index, path in enumerate(pdf_paths)}
+    committed = 0
+    start = time.perf_counter()
+
+    def commit(path: str) -> None:
+        """Record `path` in the manifest once all its chunks are in the store."""
+        stale = known[path] - stats.sources[path]
+        if stale:
+            vectorstore.delete(ids=list(stale))
+            stats.deleted += len(stale)
+        manifest.sources[path] = sorted(stats.sources[path])
+        manifest.pending_refresh = manifest.pending_refresh or bool(stats.embedded or stats.deleted)
+        manifest.save()
+
+    def counted(pages):
+        for page in pages:
+            stats.pages += 1
+            yield page
+
+    chunks = iter_chunks(
+        counted(iter_pages(pdf_paths, workers)),
+        course,
+        chapters,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+    )
+    for batch in batched(chunks, batch_size):
+        new_chunks, new_ids = [], []
+        for path, chunk in batch:
+            id_ = chunk_id(path, chunk)
+            stats.chunks += 1
+            if id_ in stats.sources[path]:
+                continue
+            stats.sources[path].add(id_)
+            if id_ not in known[path]:
+                new_chunks.append(chunk)
+                new_ids.append(id_)
+        if new_chunks:
+            vectorstore.add_documents(new_chunks, ids=new_ids)
+            stats.embedded += len(new_chunks)
+        # Pages arrive in file order: every file before the batch's last one is complete.
+        while committed < position[batch[-1][0]]:
+            commit(pdf_paths[committed])
+            committed += 1
+
+    for path in pdf_paths[committed:]:
+        commit(path)
+
+    if manifest.pending_refresh:
+        if refresh_keyword_index is not None:
+            refresh_keyword_index()
+            ensure_scope_indexes()
+        from tools.semantic_cache import bump_corpus_version
+
+        bump_corpus_version()
+        manifest.pending_refresh = False
+        manifest.save()
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory of PDFs into the vector store.")
+    parser.add_argument("directory")
+    parser.add_argument("--course", required=True)
+    parser.add_argument("--chapter", help="chapter for every file (default: file name)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    pdf_paths = sorted(
+        os.path.join(args.directory, name)
+        for name in os.listdir(args.directory)
+        if name.lower().endswith(".pdf")
+    )
+    chapters = {path: args.chapter for path in pdf_paths} if args.chapter else None
+    stats = ingest_pdfs(
+        pdf_paths,
+        args.course,
+        chapters=chapters,
+        manifest=IngestManifest(args.manifest),
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+    )
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,665 @@
+"""
+Shared layer for outbound calls: chat models, embeddings and web search.
+
+Every provider ("openai", "anthropic", "mistral", "embeddings", "search")
+has one `Outbound` per process, shared by all requests, which gives its
+calls:
+
+- a token bucket of OUTBOUND_<PROVIDER>_RPS requests per second with bursts
+  of OUTBOUND_<PROVIDER>_BURST. A 429 halves the rate (at most once a
+  second, down to a tenth of it) and pauses the bucket for the provider's
+  Retry-After; every success adds back a twentieth of the configured rate.
+- single-flight coalescing: a call identical to one in flight (same model,
+  messages and bound tools; same normalized search query) waits for that
+  call and gets a copy of its result instead of being sent.
+- retries of rate limits, timeouts, connection errors and 5xx responses, up
+  to OUTBOUND_MAX_RETRIES times with full-jitter exponential backoff
+  (OUTBOUND_BACKOFF_BASE, capped at OUTBOUND_BACKOFF_MAX seconds).
+- a per-attempt timeout of OUTBOUND_<PROVIDER>_TIMEOUT seconds, shortened
+  to the caller's `deadline()`: no call waits, retries or runs past it, and
+  one that would fails with DeadlineExceeded. Async attempts are cancelled
+  at the timeout; sync attempts rely on the client's own HTTP timeout and
+  the deadline is checked between attempts.
+
+Queueing delay, calls by result, coalesced calls and retries are exported
+as rag_outbound_* metrics, and per provider by `outbound_metrics()`.
+
+    with deadline(30):
+        answer = graph.invoke(state)
+"""
+
+import asyncio
+import concurrent.futures
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_core.tools import BaseTool
+from pydantic import ConfigDict
+
+from utils.telemetry import (
+    OUTBOUND_CALLS,
+    OUTBOUND_COALESCED,
+    OUTBOUND_QUEUE_SECONDS,
+    OUTBOUND_RETRIES,
+    get_logger,
+    register_collector,
+)
+
+log = get_logger("outbound")
+
+T = TypeVar("T")
+
+# provider -> (requests per second, burst, attempt timeout in seconds); 0 is unlimited.
+OUTBOUND_DEFAULTS = {
+    "openai": (8.0, 16, 60.0),
+    "anthropic": (4.0, 8, 60.0),
+    "mistral": (4.0, 8, 60.0),
+    "embeddings": (20.0, 40, 30.0),
+    "search": (5.0, 10, 20.0),
+}
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+_STATUS_IN_TEXT = re.compile(r"\b(408|409|429|5\d\d)\b")
+_RETRYABLE_NAMES = ("RateLimit", "Timeout", "Connection", "Overloaded", "ServiceUnavailable")
+
+
+# -- deadlines -------------------------------------------------------------------
+
+_deadline: ContextVar[Optional[float]] = ContextVar("outbound_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed, or would pass, before an outbound call completed."""
+
+
+@contextmanager
+def deadline(seconds: Optional[float]):
+    """Outbound calls in this context finish within `seconds`; nested deadlines only shorten it."""
+    if not seconds:
+        yield
+        return
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, None without one."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+# -- errors ------------------------------------------------------------------------
+
+
+def status_code(error: BaseException) -> Optional[int]:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status
+    match = _STATUS_IN_TEXT.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttled(error: BaseException) -> bool:
+    return status_code(error) == 429 or "RateLimit" in type(error).__name__
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, (TimeoutError, ConnectionError)) or status_code(error) in RETRYABLE_STATUS:
+        return True
+    return any(name in type(error).__name__ for name in _RETRYABLE_NAMES)
+
+
+def call_key(*parts: Any) -> str:
+    """Coalescing key of a call: a hash of its JSON-serialized parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+# -- rate limiting ---------------------------------------------------------------
+
+
+class TokenBucket:
+    """
+    `rate` requests per second with bursts of `burst`. Reservations never
+    block: `reserve()` takes a token, going into debt when there is none,
+    and returns how long the caller must wait for it.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: Optional[float] = None):
+        self.max_rate = self.rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 10
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._throttled_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self._updated = now
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= 1
+            return max(0.0, self._updated - now) + max(0.0, -self.tokens) / self.rate
+
+    def refund(self) -> None:
+        """Return a reservation the caller gave up on."""
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + 1)
+
+    def throttle(self, pause: Optional[float] = None) -> None:
+        """
+        The provider rate limited us: halve the rate and stop refilling for
+        `pause` seconds. The 429s of one burst arrive together, so the rate
+        is halved at most once a second.
+        """
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now - self._throttled_at >= 1.0:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self._throttled_at = now
+            self.tokens = min(self.tokens, 0.0)
+            if pause:
+                self._updated = max(self._updated, now + pause)
+
+    def recover(self) -> None:
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+# -- the layer ---------------------------------------------------------------------
+
+
+class Outbound:
+    """Rate limit, coalescing, retries and deadlines for the calls to one provider."""
+
+    def __init__(
+        self,
+        provider: str,
+        rate: float = 0.0,
+        burst: int = 1,
+        timeout: float = 0.0,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 20.0,
+    ):
+        self.provider = provider
+        self.bucket = TokenBucket(rate, burst)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._inflight: Dict[str, concurrent.futures.Future] = {}
+        self._ainflight: Dict[tuple, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "calls": 0, "errors": 0, "deadline_exceeded": 0, "coalesced": 0,
+            "retries": 0, "throttled": 0, "queued": 0, "queue_seconds": 0.0, "queue_seconds_max": 0.0,
+        }
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self.stats[name] += amount
+
+    # Admission: deadline first, then a slot in the bucket.
+
+    def _expired(self, reason: str) -> DeadlineExceeded:
+        self._count("deadline_exceeded")
+        OUTBOUND_CALLS.inc(1, self.provider, "deadline")
+        log.warning("outbound.deadline_exceeded", provider=self.provider, reason=reason)
+        return DeadlineExceeded(f"{self.provider}: deadline exceeded ({reason})")
+
+    def _reserve(self) -> float:
+        left = remaining()
+        if left is not None and left <= 0:
+            raise self._expired("before the call")
+        wait = self.bucket.reserve()
+        if left is not None and wait >= left:
+            self.bucket.refund()
+            raise self._expired(f"rate limit wait of {wait:.2f}s")
+        OUTBOUND_QUEUE_SECONDS.observe(wait, self.provider)
+        if wait:
+            with self._lock:
+                self.stats["queued"] += 1
+                self.stats["queue_seconds"] += wait
+                self.stats["queue_seconds_max"] = max(self.stats["queue_seconds_max"], wait)
+        return wait
+
+    def _attempt_timeout(self) -> Optional[float]:
+        left = remaining()
+        timeout = self.timeout or None
+        if left is None:
+            return timeout
+        return max(0.0, left) if timeout is None else max(0.0, min(timeout, left))
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying `error`, None to give up."""
+        throttled = is_throttled(error)
+        if throttled:
+            self._count("throttled")
+            self.bucket.throttle(retry_after(error))
+        if attempt >= self.max_retries or not is_retryable(error):
+            return None
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2**attempt))
+        left = remaining()
+        if left is not None and delay >= left:
+            return None
+        reason = "throttled" if throttled else "timeout" if isinstance(error, TimeoutError) else "error"
+        self._count("retries")
+        OUTBOUND_RETRIES.inc(1, self.provider, reason)
+        log.info("outbound.retry", provider=self.provider, attempt=attempt + 1, delay=round(delay, 3),
+                 error=f"{type(error).__name__}: {error}")
+        return delay
+
+    def _succeeded(self) -> None:
+        self.bucket.recover()
+        self._count("calls")
+        OUTBOUND_CALLS.inc(1, self.provider, "ok")
+
+    def _failed(self, error: Exception) -> None:
+        if isinstance(error, DeadlineExceeded):
+            return
+        self._count("calls")
+        self._count("errors")
+        OUTBOUND_CALLS.inc(1, self.provider, "error")
+
+    def _timed_out(self, error: Exception) -> Exception:
+        """An attempt cut short by the deadline rather than by the provider timeout."""
+        left = remaining()
+        if isinstance(error, TimeoutError) and left is not None and left <= 0:
+            return self._expired("during the call")
+        return error
+
+    # Sync path.
+
+    def _attempts(self, fn: Callable[[], T]) -> T:
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait:
+                time.sleep(wait)
+            try:
+                result = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._failed(e)
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._succeeded()
+            return result
+
+    def call(self, key: Optional[str], fn: Callable[[], T]) -> T:
+        """`fn()` through the layer; calls with the same `key` in flight share one result."""
+        if key is None:
+            return self._attempts(fn)
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = concurrent.futures.Future()
+        if not leader:
+            done, _ = concurrent.futures.wait([future], timeout=remaining())
+            if not done:
+                raise self._expired("waiting for a coalesced call")
+            if not future.cancelled():
+                self._count("coalesced")
+                OUTBOUND_COALESCED.inc(1, self.provider)
+                return copy.deepcopy(future.result())
+            # The leader was interrupted: make the call ourselves.
+            return self._attempts(fn)
+        try:
+            result = self._attempts(fn)
+            # A copy, taken before the caller annotates the result with its run id.
+            future.set_result(copy.deepcopy(result))
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stream(self, fn: Callable[[], Iterator[T]]) -> Iterator[T]:
+        """Items of `fn()`, retried while nothing has been yielded yet."""
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait:
+                time.sleep(wait)
+            started = False
+            try:
+                for item in fn():
+                    started = True
+                    yield item
+            except Exception as e:
+                delay = None if started else self._retry_delay(e, attempt)
+                if delay is None:
+                    self._failed(e)
+                    raise
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._succeeded()
+            return
+
+    # Async path: the same, with attempts cancelled at their timeout.
+
+    async def _aattempts(self, afn: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            wait = self._reserve()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await asyncio.wait_for(afn(), self._attempt_timeout())
+            except Exception as e:
+                e = self._timed_out(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    self._failed(e)
+                    raise e
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._succeeded()
+            return result
+
+    async def _afollow(self, future: asyncio.Future) -> Any:
+        done, _ = await asyncio.wait([future], timeout=remaining())
+        if not done:
+            raise self._expired("waiting for a coalesced call")
+        if future.cancelled():
+            return _ABANDONED
+        self._count("coalesced")
+        OUTBOUND_COALESCED.inc(1, self.provider)
+        return copy.deepcopy(future.result())
+
+    def _lead(self, key: str) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = self._ainflight[(loop, key)] = loop.create_future()
+        return future
+
+    def _settle(self, key: str, future: asyncio.Future, error: Optional[BaseException]) -> None:
+        if isinstance(error, Exception):
+            future.set_exception(error)
+            # Retrieved here, so a call nobody joined doesn't log "never retrieved".
+            future.exception()
+        elif error is not None:
+            future.cancel()
+        self._ainflight.pop((asyncio.get_running_loop(), key), None)
+
+    async def acall(self, key: Optional[str], afn: Callable[[], Awaitable[T]]) -> T:
+        if key is None:
+            return await self._aattempts(afn)
+        future = self._ainflight.get((asyncio.get_running_loop(), key))
+        if future is not None:
+            result = await self._afollow(future)
+            if result is not _ABANDONED:
+                return result
+        future = self._lead(key)
+        try:
+            result = await self._aattempts(afn)
+        except BaseException as e:
+            self._settle(key, future, e)
+            raise
+        future.set_result(copy.deepcopy(result))
+        self._settle(key, future, None)
+        return result
+
+    async def astream(self, key: Optional[str], fn: Callable[[], AsyncIterator[T]]) -> AsyncIterator[T]:
+        """
+        Items of `fn()`, retried while nothing has been yielded yet. With a
+        `key`, an identical stream already in flight is replayed once it ends.
+        """
+        if key is not None:
+            future = self._ainflight.get((asyncio.get_running_loop(), key))
+            if future is not None:
+                items = await self._afollow(future)
+                if items is not _ABANDONED:
+                    for item in items:
+                        yield item
+                    return
+            future = self._lead(key)
+        items: List[T] = []
+        attempt = 0
+        try:
+            while True:
+                wait = self._reserve()
+                if wait:
+                    await asyncio.sleep(wait)
+                started = False
+                iterator = fn().__aiter__()
+                try:
+                    while True:
+                        timeout = None if started else self._attempt_timeout()
+                        try:
+                            item = await asyncio.wait_for(iterator.__anext__(), timeout)
+                        except StopAsyncIteration:
+                            break
+                        started = True
+                        if key is not None:
+                            # Copied before the caller annotates it with its run id.
+                            items.append(copy.deepcopy(item))
+                        yield item
+                except Exception as e:
+                    e = self._timed_out(e)
+                    delay = None if started else self._retry_delay(e, attempt)
+                    if delay is None:
+                        self._failed(e)
+                        raise e
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self._succeeded()
+                break
+        except BaseException as e:
+            if key is not None:
+                self._settle(key, future, e)
+            raise
+        if key is not None:
+            future.set_result(items)
+            self._settle(key, future, None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        queued, seconds, longest = stats.pop("queued"), stats.pop("queue_seconds"), stats.pop("queue_seconds_max")
+        return {
+            "rate_per_second": round(self.bucket.rate, 3) if self.bucket.rate > 0 else None,
+            "configured_rate_per_second": self.bucket.max_rate or None,
+            "in_flight_coalescing": len(self._inflight) + len(self._ainflight),
+            **stats,
+            "queued": queued,
+            "queue_ms_mean": round(seconds * 1000 / queued, 1) if queued else 0.0,
+            "queue_ms_max": round(longest * 1000, 1),
+        }
+
+
+_ABANDONED = object()
+
+_outbounds: Dict[str, Outbound] = {}
+
+
+@lru_cache(maxsize=None)
+def get_outbound(provider: str) -> Outbound:
+    """The process-wide layer of `provider`, configured from OUTBOUND_* variables."""
+    rate, burst, timeout = OUTBOUND_DEFAULTS.get(provider, (0.0, 1, 0.0))
+    prefix = f"OUTBOUND_{provider.upper()}_"
+    outbound = Outbound(
+        provider,
+        rate=float(os.getenv(prefix + "RPS", rate)),
+        burst=int(os.getenv(prefix + "BURST", burst)),
+        timeout=float(os.getenv(prefix + "TIMEOUT", timeout)),
+        max_retries=int(os.getenv("OUTBOUND_MAX_RETRIES", "3")),
+        backoff=float(os.getenv("OUTBOUND_BACKOFF_BASE", "0.5")),
+        max_backoff=float(os.getenv("OUTBOUND_BACKOFF_MAX", "20")),
+    )
+    _outbounds[provider] = outbound
+    return outbound
+
+
+def outbound_metrics() -> Dict[str, Dict[str, Any]]:
+    return {provider: outbound.snapshot() for provider, outbound in sorted(_outbounds.items())}
+
+
+def _rate_samples():
+    samples = [({"provider": provider}, outbound.bucket.rate) for provider, outbound in sorted(_outbounds.items())]
+    return "gauge", "Current outbound rate limit in requests per second, after 429 backoff.", samples
+
+
+register_collector("rag_outbound_rate_limit", _rate_samples)
+
+
+# -- wrappers ----------------------------------------------------------------------
+
+
+class OutboundChatModel(BaseChatModel):
+    """
+    A chat model whose calls go through `outbound`. Bound tools and
+    structured output are bound on the wrapper, so they are part of the
+    coalescing key; streams are coalesced on the async path only.
+    """
+
+    model: BaseChatModel
+    outbound: Any
+    label: str = ""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def _llm_type(self) -> str:
+        return self.model._llm_type
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.model._identifying_params
+
+    def bind_tools(self, tools, **kwargs: Any):
+        return self.bind(**self.model.bind_tools(tools, **kwargs).kwargs)
+
+    def _key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: dict) -> str:
+        return call_key(self.label or self.model._llm_type, [m.model_dump() for m in messages], stop, kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return self.outbound.call(
+            self._key(messages, stop, kwargs), lambda: self.model._generate(messages, stop=stop, **kwargs)
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs: Any) -> ChatResult:
+        return await self.outbound.acall(
+            self._key(messages, stop, kwargs), lambda: self.model._agenerate(messages, stop=stop, **kwargs)
+        )
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        return self.outbound.stream(lambda: self.model._stream(messages, stop=stop, **kwargs))
+
+    def _astream(self, messages, stop=None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        return self.outbound.astream(
+            self._key(messages, stop, kwargs), lambda: self.model._astream(messages, stop=stop, **kwargs)
+        )
+
+
+class OutboundEmbeddings(Embeddings):
+    """
+    Embeddings whose calls go through `outbound`. Not coalesced here:
+    CachedEmbeddings, which wraps this, already sends each text once.
+    """
+
+    def __init__(self, underlying: Embeddings, outbound: Outbound):
+        self.underlying = underlying
+        self.outbound = outbound
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.outbound.call(None, lambda: self.underlying.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.outbound.call(None, lambda: self.underlying.embed_query(text))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.outbound.acall(None, lambda: self.underlying.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.outbound.acall(None, lambda: self.underlying.aembed_query(text))
+
+
+class SearchFailed(Exception):
+    """A search tool reported an error as its result, as TavilySearchResults does."""
+
+
+def _search_results(results: Any) -> Any:
+    if isinstance(results, str):
+        raise SearchFailed(results)
+    return results
+
+
+class OutboundSearchTool(BaseTool):
+    """A search tool whose calls go through `outbound`, coalesced per normalized query."""
+
+    tool: BaseTool
+    outbound: Any
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    def __init__(self, tool: BaseTool, outbound: Outbound, **kwargs: Any):
+        super().__init__(tool=tool, outbound=outbound, name=tool.name, description=tool.description, **kwargs)
+
+    def _key(self, query: str) -> str:
+        from tools.search_cache import normalize_query
+
+        return call_key(self.tool.name, normalize_query(query))
+
+    def _run(self, query: str, **kwargs: Any) -> List[dict]:
+        return self.outbound.call(self._key(query), lambda: _search_results(self.tool.invoke(query)))
+
+    async def _arun(self, query: str, **kwargs: Any) -> List[dict]:
+        async def search():
+            return _search_results(await self.tool.ainvoke(query))
+
+        return await self.outbound.acall(self._key(query), search)
@@ -0,0 +1,576 @@
+"""
+Tracing, metrics and logging for the graph and the server.
+
+- `tracer` is a LangChain callback handler attached to every run through a
+  configure hook (no config plumbing needed). It turns the runs of the graph,
+  its nodes, chat models, retrievers and tools into a span tree in the
+  OpenTelemetry data model: trace and span ids come from LangChain run ids,
+  and the root run's id is the trace id. Spans carry wall time, prompt and
+  completion tokens, retrieved document counts and search-loop iterations.
+  Recent traces are kept in memory (`recent_traces`, `otlp_json`) and, with
+  OTEL_EXPORTER_OTLP_ENDPOINT set, posted to a collector as OTLP/JSON.
+- The same spans feed Prometheus-style histograms and counters, rendered by
+  `render_prometheus()` together with registered collectors (caches, pools).
+- `get_logger(name)` is a structured logger printing `event key=value` lines
+  (JSON with LOG_FORMAT=json). Calls below LOG_LEVEL cost one comparison, so
+  LOG_LEVEL=warning silences the per-request lines in the hot path.
+
+TELEMETRY_ENABLED=false turns tracing and the span metrics off.
+"""
+
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import UUID, uuid4
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.tracers.context import register_configure_hook
+
+# -- structured logging --------------------------------------------------------
+
+LOG_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "off": 100}
+_log_level = LOG_LEVELS.get(os.getenv("LOG_LEVEL", "info").lower(), 20)
+_log_json = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+
+def configure_logging(level: Optional[str] = None, fmt: Optional[str] = None) -> None:
+    global _log_level, _log_json
+    if level is not None:
+        _log_level = LOG_LEVELS[level.lower()]
+    if fmt is not None:
+        _log_json = fmt.lower() == "json"
+
+
+def _format_value(value: Any) -> str:
+    text = str(value)
+    return json.dumps(text) if " " in text or not text else text
+
+
+def _emit(logger: str, level: str, event: str, fields: Dict[str, Any]) -> None:
+    if _log_json:
+        line = json.dumps(
+            {"ts": round(time.time(), 3), "level": level, "logger": logger, "event": event, **fields},
+            default=str,
+        )
+    else:
+        line = " ".join(
+            [time.strftime("%H:%M:%S"), level.upper(), logger, event]
+            + [f"{key}={_format_value(value)}" for key, value in fields.items()]
+        )
+    # Resolved per call, so contextlib.redirect_stdout silences it.
+    print(line, file=sys.stdout)
+
+
+class Logger:
+    __slots__ = ("name",)
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def enabled(self, level: str) -> bool:
+        """Guard for fields that are costly to compute."""
+        return _log_level <= LOG_LEVELS[level]
+
+    def debug(self, event: str, **fields: Any) -> None:
+        if _log_level <= 10:
+            _emit(self.name, "debug", event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        if _log_level <= 20:
+            _emit(self.name, "info", event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        if _log_level <= 30:
+            _emit(self.name, "warning", event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        if _log_level <= 40:
+            _emit(self.name, "error", event, fields)
+
+
+def get_logger(name: str) -> Logger:
+    return Logger(name)
+
+
+log = get_logger("telemetry")
+
+# -- Prometheus-style metrics ----------------------------------------------------
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, *labels: Any) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_labels(self.labelnames, labels)} {value:g}" for labels, value in items]
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: Any) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per-bucket counts, then sum and count.
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        names = self.labelnames + ("le",)
+        for labels, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (f'{bound:g}',))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_labels(names, labels + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {series[-2]:g}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {series[-1]}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("rag_graph_duration_seconds", "Wall time of a graph run.")
+NODE_SECONDS = Histogram("rag_node_duration_seconds", "Wall time of a graph node.", ["node"])
+NODE_ERRORS = Counter("rag_node_errors_total", "Graph node runs that raised.", ["node"])
+LLM_SECONDS = Histogram("rag_llm_duration_seconds", "Chat model call latency.", ["node", "model"])
+LLM_TOKENS = Counter("rag_llm_tokens_total", "Chat model tokens.", ["node", "model", "type"])
+RETRIEVER_SECONDS = Histogram("rag_retriever_duration_seconds", "Retriever latency.", ["retriever"])
+RETRIEVER_ERRORS = Counter(
+    "rag_retriever_errors_total", "Retriever failures left out of a hybrid retrieval.", ["retriever"]
+)
+RETRIEVED_DOCS = Histogram(
+    "rag_retrieved_documents", "Documents returned per retrieval.", ["retriever"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50),
+)
+TOOL_SECONDS = Histogram("rag_tool_duration_seconds", "Tool call latency, e.g. web search.", ["tool"])
+SEARCH_ITERATIONS = Histogram(
+    "rag_search_loop_iterations", "Validator-search loops per graph run.", buckets=(0, 1, 2, 3, 5, 10)
+)
+OUTBOUND_QUEUE_SECONDS = Histogram(
+    "rag_outbound_queue_seconds", "Wait for a rate limit slot before an outbound call.", ["provider"],
+    buckets=(0, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+OUTBOUND_CALLS = Counter(
+    "rag_outbound_calls_total", "Outbound calls by result: ok, error or deadline.", ["provider", "result"]
+)
+OUTBOUND_COALESCED = Counter(
+    "rag_outbound_coalesced_total", "Calls served by an identical call already in flight.", ["provider"]
+)
+OUTBOUND_RETRIES = Counter("rag_outbound_retries_total", "Outbound call retries by reason.", ["provider", "reason"])
+METRICS: List[Any] = [
+    REQUEST_SECONDS, NODE_SECONDS, NODE_ERRORS, LLM_SECONDS, LLM_TOKENS,
+    RETRIEVER_SECONDS, RETRIEVER_ERRORS, RETRIEVED_DOCS, TOOL_SECONDS, SEARCH_ITERATIONS,
+    OUTBOUND_QUEUE_SECONDS, OUTBOUND_CALLS, OUTBOUND_COALESCED, OUTBOUND_RETRIES,
+]
+
+# name -> () -> (type, help, [(labels, value)])
+_collectors: Dict[str, Callable[[], Tuple[str, str, List[Tuple[Dict[str, Any], float]]]]] = {}
+
+
+def register_collector(name: str, collect: Callable[[], Tuple[str, str, List[Tuple[Dict[str, Any], float]]]]) -> None:
+    """Sample `name` from existing state at scrape time, e.g. cache hit counters."""
+    _collectors[name] = collect
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines += metric.render()
+    for name, collect in list(_collectors.items()):
+        try:
+            kind, help, samples = collect()
+        except Exception as e:
+            log.warning("collector.failed", collector=name, error=str(e))
+            continue
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        lines += [
+            f"{name}{_labels(list(labels), list(labels.values()))} {float(value):g}"
+            for labels, value in samples
+        ]
+    return "\n".join(lines) + "\n"
+
+
+# -- spans -----------------------------------------------------------------------------
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "multiagent-rag-server")
+
+
+class Span:
+    """One run: OpenTelemetry span fields plus its children."""
+
+    __slots__ = (
+        "name", "kind", "trace_id", "span_id", "parent_id", "root",
+        "start_ns", "end_ns", "attributes", "error", "children",
+    )
+
+    def __init__(self, name: str, kind: str, run_id: UUID, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.span_id = run_id.hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else run_id.hex
+        self.root = parent.root if parent is not None else self
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.children: List["Span"] = []
+        if parent is not None:
+            parent.children.append(self)
+
+    @property
+    def duration(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e9
+
+    def walk(self) -> Iterable["Span"]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def to_tree(self) -> Dict[str, Any]:
+        tree = {
+            "name": self.name,
+            "kind": self.kind,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": self.attributes,
+        }
+        if self.parent_id is None:
+            tree["trace_id"] = self.trace_id
+        if self.error:
+            tree["error"] = self.error
+        if self.children:
+            tree["children"] = [child.to_tree() for child in self.children]
+        return tree
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            # SERVER for the root run, INTERNAL below it.
+            "kind": 2 if self.parent_id is None else 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [_otlp_attribute(f"rag.{key}", value) for key, value in self.attributes.items()]
+            + [_otlp_attribute("rag.kind", self.kind)],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id is not None:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        encoded = {"boolValue": value}
+    elif isinstance(value, int):
+        encoded = {"intValue": str(value)}
+    elif isinstance(value, float):
+        encoded = {"doubleValue": value}
+    else:
+        encoded = {"stringValue": str(value)}
+    return {"key": key, "value": encoded}
+
+
+def otlp_json(roots: Iterable[Span]) -> Dict[str, Any]:
+    """ExportTraceServiceRequest (OTLP/JSON) for the given traces."""
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "rag.telemetry"},
+                        "spans": [span.to_otlp() for root in roots for span in root.walk()],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+def token_usage(response: LLMResult) -> Tuple[int, int]:
+    """Prompt and completion tokens reported by the provider, else zeros."""
+    for generations in response.generations:
+        for generation in generations:
+            if isinstance(generation, ChatGeneration) and generation.message.usage_metadata:
+                usage = generation.message.usage_metadata
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+
+
+def _run_name(serialized: Optional[dict], kwargs: dict, default: str) -> str:
+    return kwargs.get("name") or (serialized or {}).get("name") or default
+
+
+class Tracer(BaseCallbackHandler):
+    """
+    Spans for graph runs (the root), nodes, chat models, retrievers and
+    tools; other runs (prompts, parsers, sequences) are folded into their
+    nearest traced ancestor.
+    """
+
+    run_inline = True
+
+    def __init__(self, max_traces: int = 200):
+        self.max_traces = max_traces
+        self.exporter: Optional["OTLPExporter"] = None
+        self._open: Dict[UUID, Span] = {}
+        # Untraced runs -> the span their children attach to.
+        self._folded: Dict[UUID, Span] = {}
+        self._traces: "OrderedDict[str, Span]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Optional[Span]:
+        if parent_run_id is None:
+            return None
+        return self._open.get(parent_run_id) or self._folded.get(parent_run_id)
+
+    def _start(
+        self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str, **attributes
+    ) -> Span:
+        span = Span(name, kind, run_id, self._parent(parent_run_id), attributes)
+        self._open[run_id] = span
+        return span
+
+    def _finish(self, run_id: UUID, error: Optional[BaseException] = None, **attributes) -> None:
+        span = self._open.pop(run_id, None)
+        if span is None:
+            self._folded.pop(run_id, None)
+            return
+        span.end_ns = time.time_ns()
+        span.attributes.update(attributes)
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        self._observe(span)
+
+    def _observe(self, span: Span) -> None:
+        duration, attributes = span.duration, span.attributes
+        if span.kind == "node":
+            NODE_SECONDS.observe(duration, span.name)
+            if span.error:
+                NODE_ERRORS.inc(1, span.name)
+        elif span.kind == "llm":
+            node, model = attributes["node"], attributes["model"]
+            LLM_SECONDS.observe(duration, node, model)
+            LLM_TOKENS.inc(attributes.get("prompt_tokens", 0), node, model, "prompt")
+            LLM_TOKENS.inc(attributes.get("completion_tokens", 0), node, model, "completion")
+        elif span.kind == "retriever":
+            RETRIEVER_SECONDS.observe(duration, span.name)
+            if "documents" in attributes:
+                RETRIEVED_DOCS.observe(attributes["documents"], span.name)
+        elif span.kind == "tool":
+            TOOL_SECONDS.observe(duration, span.name)
+        if span.parent_id is None:
+            self._complete(span)
+
+    def _complete(self, root: Span) -> None:
+        if root.attributes.get("nodes"):
+            REQUEST_SECONDS.observe(root.duration)
+            SEARCH_ITERATIONS.observe(root.attributes.get("search_iterations", 0))
+        with self._lock:
+            self._traces[root.trace_id] = root
+            while len(self._traces) > self.max_traces:
+                self._traces.popitem(last=False)
+        if self.exporter is not None:
+            self.exporter.submit(root)
+
+    @contextmanager
+    def span(self, name: str, config: Optional[dict] = None, kind: str = "internal", **attributes):
+        """
+        Span for work that is not a LangChain run (e.g. a vector search),
+        under the run `config` belongs to; yields the attributes to fill in.
+        """
+        if tracing_handler.get() is None:
+            yield {}
+            return
+        callbacks = (config or {}).get("callbacks")
+        run_id = uuid4()
+        span = self._start(run_id, getattr(callbacks, "parent_run_id", None), name, kind, **attributes)
+        try:
+            yield span.attributes
+        except BaseException as e:
+            self._finish(run_id, e)
+            raise
+        self._finish(run_id)
+
+    # chains: the graph and its nodes
+
+    def on_chain_start(
+        self, serialized, inputs, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict] = None, **kwargs
+    ) -> None:
+        name = _run_name(serialized, kwargs, "chain")
+        if parent_run_id is None:
+            self._start(run_id, None, name, "request")
+            return
+        parent = self._parent(parent_run_id)
+        if metadata and metadata.get("langgraph_node") == name and not name.startswith("__"):
+            span = self._start(run_id, parent_run_id, name, "node")
+            root = span.root.attributes
+            root["nodes"] = root.get("nodes", 0) + 1
+            if name == "search":
+                root["search_iterations"] = root.get("search_iterations", 0) + 1
+        elif parent is not None:
+            self._folded[run_id] = parent
+
+    def on_chain_end(self, outputs, *, run_id: UUID, **kwargs) -> None:
+        if isinstance(outputs, dict) and "retrieved_docs" in outputs and run_id in self._open:
+            self._finish(
+                run_id,
+                documents=len(outputs["retrieved_docs"] or ()),
+                total_search=outputs.get("total_search", 0),
+                next_step=str(outputs.get("next_step", "")),
+            )
+        else:
+            self._finish(run_id)
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, error)
+
+    # chat models
+
+    def on_chat_model_start(
+        self, serialized, messages, *, run_id: UUID, parent_run_id: Optional[UUID] = None,
+        metadata: Optional[dict] = None, **kwargs
+    ) -> None:
+        metadata = metadata or {}
+        model = (
+            metadata.get("routed_model")
+            or metadata.get("ls_model_name")
+            or _run_name(serialized, kwargs, "chat_model")
+        )
+        node = metadata.get("routed_node") or metadata.get("langgraph_node", "")
+        self._start(run_id, parent_run_id, "llm", "llm", model=model, node=node)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs) -> None:
+        prompt_tokens, completion_tokens = token_usage(response)
+        self._finish(run_id, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, error)
+
+    # retrievers and tools
+
+    def on_retriever_start(
+        self, serialized, query, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs
+    ) -> None:
+        self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "retriever"), "retriever")
+
+    def on_retriever_end(self, documents, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, error)
+
+    def on_tool_start(
+        self, serialized, input_str, *, run_id: UUID, parent_run_id: Optional[UUID] = None, **kwargs
+    ) -> None:
+        self._start(run_id, parent_run_id, _run_name(serialized, kwargs, "tool"), "tool")
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs) -> None:
+        if isinstance(output, list):
+            self._finish(run_id, results=len(output))
+        else:
+            self._finish(run_id)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        self._finish(run_id, error)
+
+    # reading traces
+
+    def recent_traces(self, limit: int = 20) -> List[Span]:
+        with self._lock:
+            return list(self._traces.values())[-limit:][::-1]
+
+    def get_trace(self, trace_id: str) -> Optional[Span]:
+        with self._lock:
+            return self._traces.get(trace_id)
+
+
+class OTLPExporter:
+    """Posts finished traces as OTLP/JSON to `endpoint`/v1/traces from a daemon thread."""
+
+    def __init__(self, endpoint: str, interval: float = 5.0, max_queue: int = 1000):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.interval = interval
+        self._queue: "queue.Queue[Span]" = queue.Queue(max_queue)
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def submit(self, root: Span) -> None:
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            pass
+
+    def _run(self) -> None:
+        from urllib.request import Request, urlopen
+
+        while True:
+            roots = [self._queue.get()]
+            time.sleep(self.interval)
+            while not self._queue.empty():
+                roots.append(self._queue.get_nowait())
+            body = json.dumps(otlp_json(roots)).encode()
+            try:
+                urlopen(Request(self.url, body, {"Content-Type": "application/json"}), timeout=10).close()
+            except Exception as e:
+                log.warning("otlp.export_failed", traces=len(roots), error=str(e))
+
+
+tracer = Tracer(max_traces=int(os.getenv("TRACE_BUFFER_SIZE", "200")))
+if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+    tracer.exporter = OTLPExporter(os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"])
+
+# The default is seen by every thread and task; set it to None to switch
+# tracing off in the current context.
+tracing_handler: ContextVar[Optional[Tracer]] = ContextVar(
+    "rag_tracing_handler",
+    default=tracer if os.getenv("TELEMETRY_ENABLED", "true").lower() == "true" else None,
+)
+register_configure_hook(tracing_handler, inheritable=True)